@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import CustomUser
+
+
+# Everything the permission classes look at. The password hash stays out of the
+# cache; it is loaded on first access like any deferred field.
+CACHED_FIELDS = ('id', 'email', 'aadhaar', 'role', 'is_active', 'is_staff', 'is_superuser', 'patient_id', 'doctor_id', 'last_login')
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_user(user_id):
+    """
+    Drops the cached user now, and again once the surrounding transaction
+    commits, so a request racing the write cannot re-cache the old row.
+    """
+    def delete():
+        get_cache().delete(user_cache_key(user_id))
+
+    delete()
+    transaction.on_commit(delete)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the token's user from the cache instead of the
+    database. The cached row carries the role and its doctor/patient linkage, so
+    authenticating and the permission checks in main_app.permissions cost no
+    queries once the user is cached. Entries live AUTH_USER_CACHE_TIMEOUT seconds
+    and are dropped whenever the CustomUser is saved or deleted (auth_app.signals).
+    """
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # needs the password hash, which is never cached
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        cache = get_cache()
+        key = user_cache_key(user_id)
+        fields = cache.get(key)
+        if fields is None:
+            user = super().get_user(validated_token)
+            cache.set(
+                key, {name: getattr(user, name) for name in CACHED_FIELDS},
+                timeout=getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300),
+            )
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not fields['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user_from_cache(fields)
+
+
+def user_from_cache(fields):
+    names = [field.attname for field in CustomUser._meta.concrete_fields if field.attname in fields]
+    return CustomUser.from_db('default', names, [fields[name] for name in names])
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class HashingBusy(Exception):
+    """
+    Every hashing slot stayed taken for PASSWORD_HASHING_WAIT seconds.
+    """
+
+
+class HashingPool:
+    """
+    Runs password hashing on a fixed number of threads. hashlib releases the GIL
+    while it hashes, so the work runs in parallel with the request threads, but
+    never on more than `workers` cores at once. At most `workers + queue` hashes
+    are in flight; past that a caller waits up to `wait` seconds for a slot and
+    then gets HashingBusy, so a login burst is turned away early instead of
+    piling up behind the hasher and starving every other endpoint of workers.
+
+    Only pure hashing goes through the pool: the threads never touch the database.
+    """
+    def __init__(self, workers, queue, wait):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self.slots = threading.BoundedSemaphore(workers + queue)
+        self.wait = wait
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.wait):
+            raise HashingBusy()
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashingPool(
+                workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', 4),
+                queue=getattr(settings, 'PASSWORD_HASHING_QUEUE', 16),
+                wait=getattr(settings, 'PASSWORD_HASHING_WAIT', 5),
+            )
+        return _pool
+
+
+def make_password(password):
+    return get_pool().run(hashers.make_password, password)
+
+
+def check_password(user, password):
+    """
+    user.check_password() on the pool. When the stored hash was made by an older
+    hasher (or with fewer iterations) than the first one in PASSWORD_HASHERS, the
+    password is rehashed with the current one and saved, so users move to the
+    new hasher as they log in, without a reset.
+    """
+    is_correct, must_update = get_pool().run(hashers.verify_password, password, user.password)
+    if is_correct and must_update:
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+    return is_correct
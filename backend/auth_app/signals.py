@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+
+from .authentication import invalidate_user
+from .models import CustomUser
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def connect_user_cache_invalidation():
+    post_save.connect(invalidate_cached_user, sender=CustomUser, dispatch_uid='auth-user-cache-save')
+    post_delete.connect(invalidate_cached_user, sender=CustomUser, dispatch_uid='auth-user-cache-delete')
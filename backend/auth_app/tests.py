@@ -1,3 +1,109 @@
+from unittest import mock
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import hashing
+from .authentication import CachedJWTAuthentication
+from .models import CustomUser
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email='doctor@example.com', password='doctor', role='doctor')
+        self.authorization = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+
+    def authenticate(self):
+        request = Request(
+            APIRequestFactory().get('/', HTTP_AUTHORIZATION=self.authorization),
+            authenticators=[CachedJWTAuthentication()],
+        )
+        request.user
+        return request
+
+    def test_cached_user_costs_no_queries(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        with self.assertNumQueries(0):
+            request = self.authenticate()
+            self.assertEqual(request.user.role, 'doctor')
+            self.assertFalse(request.user.is_superuser)
+        self.assertEqual(request.user.pk, self.user.pk)
+        self.assertEqual(request.user.email, 'doctor@example.com')
+
+    def test_saving_the_user_invalidates_it(self):
+        self.authenticate()
+        self.user.role = 'staff'
+        self.user.save()
+        self.assertEqual(self.authenticate().user.role, 'staff')
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_user_is_rejected(self):
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self, password='secret', aadhaar='123412341234'):
+        return self.client.post('/login/patient/', {'aadhaar': aadhaar, 'password': password}, format='json')
+
+    def test_register_then_login(self):
+        response = self.client.post('/register/patient/', {'aadhaar': '123412341234', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        user = CustomUser.objects.get(aadhaar='123412341234')
+        self.assertEqual(identify_hasher(user.password).algorithm, 'scrypt')
+
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+
+    def test_login_rehashes_old_hashes(self):
+        user = CustomUser.objects.create(
+            aadhaar='123412341234', role='patient', password=make_password('secret', hasher='pbkdf2_sha256'),
+        )
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+        user.refresh_from_db()
+        self.assertEqual(identify_hasher(user.password).algorithm, 'pbkdf2_sha256')
+
+        self.assertEqual(self.login().status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(identify_hasher(user.password).algorithm, 'scrypt')
+        self.assertTrue(user.check_password('secret'))
+
+    def test_attempts_are_limited_per_account(self):
+        CustomUser.objects.create_user(aadhaar='123412341234', role='patient', password='secret')
+        for _ in range(10):
+            self.assertEqual(self.login(password='wrong').status_code, 401)
+
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # other accounts are unaffected
+        self.assertEqual(self.login(aadhaar='999999999999').status_code, 401)
 
-# Create your tests here.
+    def test_full_pool_turns_logins_away(self):
+        CustomUser.objects.create_user(aadhaar='123412341234', role='patient', password='secret')
+        pool = hashing.HashingPool(workers=1, queue=0, wait=0)
+        pool.slots.acquire()   # the only slot is taken
+        with mock.patch.object(hashing, '_pool', pool):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
@@ -0,0 +1,18 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginRateThrottle(SimpleRateThrottle):
+    """
+    Limits login attempts per account (email, or aadhaar for patients) rather than
+    per client address, so guessing one account's password from many addresses is
+    throttled too. The rate is REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']['login'].
+    Throttled attempts are rejected before any password is hashed.
+    """
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        identifier = request.data.get('aadhaar') or request.data.get('email')
+        if not identifier:
+            return None
+        role = view.kwargs.get('role', '')
+        return self.cache_format % {'scope': self.scope, 'ident': f'{role}:{str(identifier).strip().lower()}'}
@@ -2,9 +2,16 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from .hashing import HashingBusy, check_password, make_password
 from .models import CustomUser
+from .throttling import LoginRateThrottle
 from main_app.models import Patient
 
+
+def hashing_busy_response():
+    return Response({'error': 'Too many sign-ins in progress, try again shortly'}, status=503, headers={'Retry-After': '1'})
+
+
 # Create your views here.
 class PatientRegisterView(APIView):
     def post(self, request):
@@ -15,10 +22,15 @@ class PatientRegisterView(APIView):
         if CustomUser.objects.filter(aadhaar=aadhaar).exists():
             return Response({'error': 'User already exists'}, status=400)
         
+        try:
+            encoded_password = make_password(password)
+        except HashingBusy:
+            return hashing_busy_response()
+
         patient_obj = Patient.objects.filter(aadhar=aadhaar).first()
-        user = CustomUser.objects.create_user(
+        user = CustomUser.objects.create(
             aadhaar=aadhaar,
-            password=password,
+            password=encoded_password,
             role='patient',
             patient=patient_obj
         )
@@ -26,6 +38,8 @@ class PatientRegisterView(APIView):
 
 
 class RoleBasedLoginView(APIView):
+    throttle_classes = [LoginRateThrottle]
+
     def post(self, request, role):
         if role not in ['staff', 'doctor', 'patient']:
             return Response({'error': 'Invalid role'}, status=400)
@@ -39,7 +53,11 @@ class RoleBasedLoginView(APIView):
             password = request.data.get('password')
             user = CustomUser.objects.filter(email=email, role=role).first()
 
-        if user is None or not user.check_password(password):
+        try:
+            valid = user is not None and check_password(user, password)
+        except HashingBusy:
+            return hashing_busy_response()
+        if not valid:
             return Response({'error': 'Invalid credentials', 'password':password}, status=401)
 
         refresh = RefreshToken.for_user(user)
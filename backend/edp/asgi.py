@@ -2,6 +2,9 @@
 ASGI config for edp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP is served by Django as before, but for the public media files (photos and
+their thumbnails, see edp.media); websockets (the live bed board) are routed
+through Channels.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +16,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'edp.settings')
 
-application = get_asgi_application()
+# Initialise Django before importing anything that touches models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+
+from auth_app.middleware import JWTAuthMiddleware
+from edp.media import MediaFiles
+from main_app.routing import websocket_urlpatterns
+
+application = ProtocolTypeRouter({
+    'http': MediaFiles(django_asgi_app),
+    'websocket': AllowedHostsOriginValidator(JWTAuthMiddleware(URLRouter(websocket_urlpatterns))),
+})
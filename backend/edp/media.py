@@ -0,0 +1,200 @@
+"""
+Serves the photo uploads (PUBLIC_MEDIA_DIRS under MEDIA_ROOT, i.e. profile
+photos and their thumbnails) at MEDIA_URL, straight from the ASGI application
+ahead of Django: no URL resolving, middleware or view per image.
+
+The photos are patient data, so only signed URLs are served: the storages
+(SignedMediaStorage) add `expires` and `signature` parameters to the URLs of
+these files, which the API hands to authenticated users only. A URL stays
+valid for one to two MEDIA_URL_MAX_AGE periods and is the same throughout the
+current period, so clients can keep caching it. Anything else gets a 403; an
+<img> cannot send the JWT, hence signatures rather than authentication.
+
+Responses carry an ETag and Last-Modified, so a client revalidating a cached
+image gets a bodiless 304, and honour a single `Range: bytes=` range (206, or
+416 when it is out of bounds), guarded by If-Range. Files are read in
+MEDIA_CHUNK_SIZE blocks on a thread, never whole into memory.
+
+Anything else under MEDIA_ROOT (imports, test results) is not public and is
+left to Django, which has no route for it. Behind a web server, serve the same
+directories from there instead, checking the signatures the same way.
+"""
+import asyncio
+import mimetypes
+import os
+import posixpath
+import stat
+import time
+from urllib.parse import parse_qs, urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_http_date_safe
+
+
+def is_public(name):
+    directories = tuple(getattr(settings, 'PUBLIC_MEDIA_DIRS', ()))
+    return bool(directories) and name.startswith(directories)
+
+
+def get_url_expiry(now=None):
+    """
+    When URLs signed now expire: the end of the period after the current one.
+    """
+    period = getattr(settings, 'MEDIA_URL_MAX_AGE', 24 * 60 * 60)
+    now = int(time.time() if now is None else now)
+    return (now // period + 2) * period
+
+
+def url_signature(name, expires):
+    return signing.Signer(salt='edp.media').signature(f'{posixpath.normpath(name)}:{expires}')
+
+
+def is_signed(name, query_string):
+    query = parse_qs(query_string.decode('latin-1'))
+    try:
+        expires = int(query['expires'][0])
+        signature = query['signature'][0]
+    except (KeyError, ValueError):
+        return False
+    return expires >= time.time() and constant_time_compare(signature, url_signature(name, expires))
+
+
+class SignedMediaStorage(FileSystemStorage):
+    """
+    Signs the URLs of the files MediaFiles serves.
+    """
+    def url(self, name):
+        url = super().url(name)
+        if name and is_public(name):
+            expires = get_url_expiry()
+            url = f'{url}?{urlencode({"expires": expires, "signature": url_signature(name, expires)})}'
+        return url
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single `bytes=` range, None to ignore the header
+    (malformed, or several ranges), or False when it cannot be satisfied.
+    """
+    unit, _, ranges = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+    start, sep, end = ranges.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if start == '':   # the last `end` bytes
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class MediaFiles:
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        prefix = settings.MEDIA_URL
+        if scope['type'] != 'http' or not prefix.startswith('/') or not scope['path'].startswith(prefix):
+            return await self.application(scope, receive, send)
+        name = posixpath.normpath(scope['path'][len(prefix):])   # images/../imports/ is not public
+        if not is_public(name):
+            return await self.application(scope, receive, send)
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await self.respond(send, 405, [(b'allow', b'GET, HEAD')])
+        if not is_signed(name, scope.get('query_string', b'')):
+            return await self.respond(send, 403)
+        try:
+            path = safe_join(str(settings.MEDIA_ROOT), name)
+            info = os.stat(path)
+        except (SuspiciousFileOperation, OSError, ValueError):
+            return await self.respond(send, 404)
+        if not stat.S_ISREG(info.st_mode):
+            return await self.respond(send, 404)
+
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        etag = f'"{info.st_mtime_ns:x}-{info.st_size:x}"'
+        last_modified = http_date(info.st_mtime)
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response_headers = [
+            (b'etag', etag.encode()),
+            (b'last-modified', last_modified.encode()),
+            (b'cache-control', f"private, max-age={getattr(settings, 'MEDIA_MAX_AGE', 24 * 60 * 60)}".encode()),
+            (b'accept-ranges', b'bytes'),
+        ]
+
+        if 'if-none-match' in headers:
+            if etag in [tag.strip().removeprefix('W/') for tag in headers['if-none-match'].split(',')] \
+                    or headers['if-none-match'].strip() == '*':
+                return await self.respond(send, 304, response_headers)
+        elif 'if-modified-since' in headers:
+            since = parse_http_date_safe(headers['if-modified-since'])
+            if since is not None and int(info.st_mtime) <= since:
+                return await self.respond(send, 304, response_headers)
+
+        status, start, end = 200, 0, info.st_size - 1
+        if 'range' in headers and self.if_range(headers.get('if-range'), etag, last_modified):
+            byte_range = parse_range(headers['range'], info.st_size)
+            if byte_range is False:
+                return await self.respond(send, 416, [(b'content-range', f'bytes */{info.st_size}'.encode())])
+            if byte_range is not None:
+                status, (start, end) = 206, byte_range
+                response_headers.append((b'content-range', f'bytes {start}-{end}/{info.st_size}'.encode()))
+
+        length = end - start + 1
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': response_headers + [
+                (b'content-type', content_type.encode()),
+                (b'content-length', str(length).encode()),
+            ],
+        })
+        if scope['method'] == 'HEAD' or length <= 0:
+            return await send({'type': 'http.response.body', 'body': b''})
+        await self.send_file(send, path, start, length)
+
+    @staticmethod
+    def if_range(value, etag, last_modified):
+        """
+        Whether a Range applies: without If-Range, or when it names the current
+        version of the file.
+        """
+        return value is None or value.strip() in (etag, last_modified)
+
+    async def send_file(self, send, path, start, length):
+        chunk_size = getattr(settings, 'MEDIA_CHUNK_SIZE', 64 * 1024)
+        file = await asyncio.to_thread(open, path, 'rb')
+        try:
+            await asyncio.to_thread(file.seek, start)
+            while length > 0:
+                block = await asyncio.to_thread(file.read, min(chunk_size, length))
+                if not block:   # truncated since the stat
+                    break
+                length -= len(block)
+                await send({'type': 'http.response.body', 'body': block, 'more_body': length > 0})
+            if length > 0:
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await asyncio.to_thread(file.close)
+
+    @staticmethod
+    async def respond(send, status, headers=()):
+        await send({'type': 'http.response.start', 'status': status, 'headers': list(headers)})
+        await send({'type': 'http.response.body', 'body': b''})
@@ -35,17 +35,20 @@ CORS_ALLOW_ALL_ORIGINS = True
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',   # ASGI runserver, must come before staticfiles
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third-party apps
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
+    'channels',
     # My app
     'main_app',
     'auth_app'
@@ -60,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'main_app.audit.AuditMiddleware',
 ]
 
 ROOT_URLCONF = 'edp.urls'
@@ -81,6 +85,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'edp.wsgi.application'
+ASGI_APPLICATION = 'edp.asgi.application'
 
 
 # Database
@@ -112,6 +117,49 @@ DATABASES = {
 # }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory unless CACHE_URL is set, e.g. CACHE_URL=redis://localhost:6379/1 in production
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Reference catalogs (medical tests, departments, wards, rooms) cached by main_app.cache
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Users behind JWT access tokens, cached by auth_app.authentication
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = 60 * 5
+
+# Channel layer for the websocket bed board (main_app.consumers)
+# In-memory only reaches clients of the same process; with several workers set
+# CHANNEL_LAYER_URL=redis://localhost:6379/2 (needs channels_redis)
+
+CHANNEL_LAYERS = {
+    'default': env.channels('CHANNEL_LAYER_URL', default='inmemory://'),
+}
+
+# Batch sizes for the ?bulk=true list POSTs (main_app.bulk)
+BULK_CREATE_BATCH_SIZE = 1000
+BULK_CREATE_MAX_BATCH_SIZE = 5000
+
+# Rows fetched from the server-side cursor per chunk of /api/exports/ (main_app.exports)
+EXPORT_CHUNK_SIZE = 2000
+
+# CSV imports (main_app.imports): rows validated and upserted per chunk, row
+# errors kept on the ImportJob, threads that run uploaded imports
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+IMPORT_WORKERS = env.int('IMPORT_WORKERS', default=1)
+
+# Lab queue (main_app.lab_queue): seconds before a claimed test can be claimed
+# again, longest ?wait= of /api/lab/queue/claim/
+LAB_CLAIM_TIMEOUT = 30 * 60
+LAB_QUEUE_MAX_WAIT = 30
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -148,6 +196,50 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploads. Only PUBLIC_MEDIA_DIRS (profile photos and their thumbnails) are
+# served at MEDIA_URL, by edp.media, and only at the signed URLs the storage
+# hands out, valid for one to two MEDIA_URL_MAX_AGE seconds; MEDIA_CHUNK_SIZE
+# bytes are read per block
+MEDIA_ROOT = env('MEDIA_ROOT', default=str(BASE_DIR / 'media'))
+MEDIA_URL = '/media/'
+PUBLIC_MEDIA_DIRS = ['images/', 'thumbnails/']
+MEDIA_CHUNK_SIZE = 64 * 1024
+MEDIA_MAX_AGE = 24 * 60 * 60
+MEDIA_URL_MAX_AGE = 24 * 60 * 60
+STORAGES = {
+    'default': {'BACKEND': 'edp.media.SignedMediaStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Threads that make the profile photo thumbnails (main_app.images)
+PHOTO_THUMBNAIL_WORKERS = env.int('PHOTO_THUMBNAIL_WORKERS', default=1)
+
+# Chunked result file uploads (main_app.uploads): largest file and chunk, bytes
+# held in memory per block, seconds before an idle upload is cleared
+RESULT_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+RESULT_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 ** 2
+RESULT_UPLOAD_BLOCK_SIZE = 1024 ** 2
+RESULT_UPLOAD_EXPIRY = 24 * 60 * 60
+
+# Seconds an unreferenced photo or result file is kept before collect_blobs
+# deletes it (main_app.storage)
+BLOB_GC_GRACE = 60 * 60
+
+# The audit trail (main_app.audit) is buffered in memory and written by a
+# background thread, this many events per INSERT, at least every
+# AUDIT_FLUSH_INTERVAL seconds: a crash loses at most that much. A full buffer
+# is written by the request that fills it.
+AUDIT_BUFFER_SIZE = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 1.0
+
+# Monthly partitions of the history tables (main_app.partitions): how many
+# months ahead archive_partitions creates, how many it keeps in the database,
+# and where it writes the older ones
+PARTITION_MONTHS_AHEAD = 3
+PARTITION_KEEP_MONTHS = 24
+PARTITION_ARCHIVE_DIR = env('PARTITION_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -159,7 +251,7 @@ AUTHENTICATION_BACKENDS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auth_app.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -167,10 +259,35 @@ AUTH_USER_MODEL = 'auth_app.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auth_app.authentication.CachedJWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'main_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '10/min',   # per account, see auth_app.throttling
+    },
 }
 
+# The first hasher hashes new passwords; hashes made by the others still verify
+# and are rehashed with the first one on the user's next login (auth_app.hashing).
+# scrypt is memory-hard and needs nothing beyond hashlib. For argon2, install
+# argon2-cffi and put Argon2PasswordHasher first.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+]
+
+# Login/registration hashing runs on a bounded pool (auth_app.hashing): this many
+# threads, this many more waiting, and how long a request waits for a slot
+# before it gets a 503
+PASSWORD_HASHING_WORKERS = env.int('PASSWORD_HASHING_WORKERS', default=4)
+PASSWORD_HASHING_QUEUE = 16
+PASSWORD_HASHING_WAIT = 5
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=3650),  
     'REFRESH_TOKEN_LIFETIME': timedelta(days=3650),
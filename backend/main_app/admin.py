@@ -1,6 +1,21 @@
 from django.contrib import admin
 from django.apps import apps
 
+from .beds import recount_free_beds
+from .models import Bed, Ward
+
+
+class BedAdmin(admin.ModelAdmin):
+    """
+    Beds edited here bypass main_app.beds, so the counters of the wards they
+    left and joined are recounted.
+    """
+    def save_model(self, request, obj, form, change):
+        ward_ids = set(Ward.objects.filter(room__bed=obj.pk).values_list('id', flat=True)) if change else set()
+        super().save_model(request, obj, form, change)
+        recount_free_beds(list(ward_ids | {obj.room.ward_id}))
+
+
 app_models = apps.get_app_config('main_app').get_models()
 for model in app_models:
-    admin.site.register(model)
\ No newline at end of file
+    admin.site.register(model, BedAdmin if model is Bed else None)
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class MainAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_app'
+
+    def ready(self):
+        from .signals import (
+            connect_audit_log, connect_bed_board, connect_blob_references, connect_catalog_invalidation,
+            connect_photo_thumbnails, connect_ward_occupancy,
+        )
+        connect_catalog_invalidation()
+        connect_ward_occupancy()
+        connect_bed_board()
+        connect_photo_thumbnails()
+        connect_blob_references()
+        connect_audit_log()
@@ -0,0 +1,40 @@
+"""
+Filters over the ArrayField columns of the list endpoints, each served by a GIN
+index on the array (see the models' Meta.indexes).
+
+    ?allergies=Penicillin,Dust              has every value (allergies @> '{Penicillin,Dust}')
+    ?allergies__contains=Penicillin,Dust    the same
+    ?allergies__overlap=Penicillin,Dust     has at least one of them (allergies && ...)
+
+Values are comma separated and matched exactly, case included. A view passes
+the array fields it accepts; any other lookup on them is a 400.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+ARRAY_LOOKUPS = {'': 'contains', 'contains': 'contains', 'overlap': 'overlap'}
+
+
+def filter_arrays(request, queryset, field_names):
+    """
+    `queryset` narrowed by the array filters in the query string, for the
+    ArrayFields named in `field_names`.
+    """
+    filters = {}
+    errors = {}
+    for param, value in request.query_params.items():
+        name, _, lookup = param.partition('__')
+        if name not in field_names:
+            continue
+        if lookup not in ARRAY_LOOKUPS:
+            errors[param] = [f"Unknown lookup, use {name}, {name}__contains or {name}__overlap."]
+            continue
+        values = [item.strip() for item in value.split(',') if item.strip()]
+        if not values:
+            errors[param] = ['Enter at least one value.']
+            continue
+        filters.setdefault(f'{name}__{ARRAY_LOOKUPS[lookup]}', []).extend(values)
+
+    if errors:
+        raise ValidationError(errors)
+    return queryset.filter(**filters)
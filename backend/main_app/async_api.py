@@ -0,0 +1,83 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from .renderers import FastJSONRenderer
+
+
+def async_api_view(permission_classes=None):
+    """
+    @api_view for read-only `async def` views, which DRF cannot dispatch itself.
+
+    Authentication and permission checks are the project's usual DRF classes; they
+    touch the database synchronously, so they run in a worker thread. The view
+    body then awaits the async ORM, and its Response is rendered with the same
+    JSON renderer @api_view uses, so clients see identical output. Under edp.asgi
+    the event loop serves many of these requests at once instead of holding a
+    thread per request.
+    """
+    if permission_classes is None:
+        permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            request = Request(
+                request,
+                authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+            )
+            try:
+                if request.method not in ('GET', 'HEAD'):
+                    raise exceptions.MethodNotAllowed(request.method)
+                await sync_to_async(check_permissions)(request, permission_classes)
+                response = await view(request, *args, **kwargs)
+            except Exception as exc:
+                response = handle_exception(request, exc)
+
+            return render(response)
+        return wrapped
+    return decorator
+
+
+def check_permissions(request, permission_classes):
+    request.user  # authenticates
+    for permission in (permission_class() for permission_class in permission_classes):
+        if not permission.has_permission(request, None):
+            if request.authenticators and not request.successful_authenticator:
+                raise exceptions.NotAuthenticated()
+            raise exceptions.PermissionDenied(detail=getattr(permission, 'message', None))
+
+
+def handle_exception(request, exc):
+    """
+    Mirrors APIView.handle_exception: 401 with a WWW-Authenticate header when the
+    client could retry with credentials, the DRF error payload otherwise.
+    """
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        authenticate_header = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+        if authenticate_header:
+            exc.auth_header = authenticate_header
+        else:
+            exc.status_code = status.HTTP_403_FORBIDDEN
+
+    response = exception_handler(exc, {'request': request})
+    if response is None:
+        raise exc
+    return response
+
+
+def render(response):
+    http_response = HttpResponse(
+        FastJSONRenderer().render(response.data, renderer_context={'response': response}) if response.data is not None else b'',
+        status=response.status_code,
+        content_type='application/json',
+    )
+    for key, value in response.items():
+        if key.lower() != 'content-type':
+            http_response[key] = value
+    return http_response
@@ -0,0 +1,380 @@
+"""
+Audit trail of who read and changed patients, diagnoses, prescriptions and
+prescribed tests (AUDITED_MODELS).
+
+Changes are captured by main_app.signals: every save or delete of an audited
+row becomes an AuditEvent with the field diff, {field: [old, new]}, against
+the values the row was loaded with (updated_at left out). The event is only
+kept once the change commits. Bulk writes send no signals and log their rows
+themselves (log_created, log_updated, log_bulk). Reads are captured by
+AuditMiddleware from the routes in AUDITED_READS: a successful GET of one
+record is a `read` of it, an export a `list` with its path. Lists and
+searches log a `read` of each audited row they return (log_reads, from the
+response helpers in pagination.py), and so do views that return records to
+other methods (the lab queue's claims). The actor is the user of the
+request the change or read happened in, none outside requests (commands,
+background jobs).
+
+Requests never write the events themselves. They go to a bounded in-process
+buffer, which a background thread writes AUDIT_BATCH_SIZE events per INSERT
+as soon as a batch is full, or every AUDIT_FLUSH_INTERVAL seconds. A crash
+loses at most the events of the last interval (and never more than
+AUDIT_BUFFER_SIZE); a normal exit writes what is left. Should the buffer
+fill up anyway, the request that finds it full writes it (backpressure), and
+only when that fails too are the oldest events dropped, with an error logged.
+
+The table, main_app_auditevent, is partitioned by month of occurred_at (see
+partitions.py; the writer creates each month's partition when it first has an
+event for it) and append-only: a trigger rejects UPDATE and DELETE. Old
+months are removed by dropping their partitions.
+"""
+import asyncio
+import atexit
+import collections
+import contextvars
+import logging
+import os
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import FileField
+from django.utils import timezone
+
+from . import partitions
+
+
+logger = logging.getLogger(__name__)
+
+AUDITED_MODELS = [
+    'main_app.Patient',
+    'main_app.Diagnosis',
+    'main_app.Prescription',
+    'main_app.TestPrescribed',
+]
+
+# Fields left out of the diffs
+IGNORED_FIELDS = {'updated_at'}
+
+# GET routes that are audited: url name -> (model label, URL kwarg of the record's pk,
+# None for exports, audited as lists of their serializer's model). Lists and
+# searches log the rows they return themselves.
+AUDITED_READS = {
+    'get_update_delete_patient': ('main_app.Patient', 'patient_id'),
+    'get_diagnoses_for_patient': ('main_app.Patient', 'patient_id'),
+    'get_diagnosis_for_patient': ('main_app.Diagnosis', 'diagnosis_id'),
+    'get_full_diagnosis_details': ('main_app.Diagnosis', 'diagnosis_id'),
+    'get_export': (None, None),
+}
+
+_request = contextvars.ContextVar('audit_request', default=None)
+
+
+def get_buffer_size():
+    return getattr(settings, 'AUDIT_BUFFER_SIZE', 10000)
+
+
+def get_batch_size():
+    return getattr(settings, 'AUDIT_BATCH_SIZE', 500)
+
+
+def get_flush_interval():
+    return getattr(settings, 'AUDIT_FLUSH_INTERVAL', 1.0)
+
+
+def plain(field, value):
+    if isinstance(field, FileField):
+        return getattr(value, 'name', value) or None   # the column value or a FieldFile
+    if isinstance(value, list):
+        return list(value)   # an ArrayField list may be changed in place
+    return value
+
+
+def snapshot(instance):
+    """
+    The loaded field values of `instance`, by attname; deferred fields are left out.
+    """
+    return {
+        field.attname: plain(field, instance.__dict__[field.attname])
+        for field in instance._meta.concrete_fields
+        if field.attname in instance.__dict__ and field.attname not in IGNORED_FIELDS
+    }
+
+
+def diff(old, new):
+    return {
+        name: [old.get(name), value]
+        for name, value in new.items()
+        if name not in old or old[name] != value
+    }
+
+
+def get_actor():
+    request = _request.get()
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None, ''
+    return user.pk, getattr(user, 'role', '')
+
+
+def make_event(action, model, object_id=None, changes=None, path=None):
+    from .models import AuditEvent
+
+    request = _request.get()
+    actor_id, actor_role = get_actor()
+    return AuditEvent(
+        occurred_at=timezone.now(),
+        actor_id=actor_id,
+        actor_role=actor_role,
+        action=action,
+        model=model,
+        object_id=None if object_id is None else str(object_id),
+        changes=changes,
+        path=path if path is not None else (request.get_full_path()[:255] if request is not None else ''),
+    )
+
+
+def log_change(action, instance, changes):
+    """
+    Buffers the change of `instance` once the current transaction commits.
+    """
+    event = make_event(action, instance._meta.label, instance.pk, changes)
+    transaction.on_commit(lambda: record(event))
+
+
+def log_created(objs):
+    """
+    For rows inserted with bulk_create, which sends no signals.
+    """
+    for obj in objs:
+        if obj._meta.label in AUDITED_MODELS:
+            log_change('create', obj, diff({}, snapshot(obj)))
+
+
+def log_updated(model, changes):
+    """
+    For rows changed with queryset.update(), which sends no signals: an
+    `update` of each, with changes {pk: {field: [old, new]}}.
+    """
+    events = [make_event('update', model._meta.label, object_id, diff) for object_id, diff in changes.items()]
+    transaction.on_commit(lambda: [record(event) for event in events])
+
+
+def log_reads(model, object_ids):
+    """
+    A `read` of each record a response returned; none unless `model` is audited.
+    """
+    if model._meta.label not in AUDITED_MODELS:
+        return
+    for object_id in object_ids:
+        record(make_event('read', model._meta.label, object_id))
+
+
+def log_bulk(action, model, changes):
+    """
+    For rows written without instances (imports): one event for the lot.
+    """
+    event = make_event(action, model._meta.label, changes=changes)
+    transaction.on_commit(lambda: record(event))
+
+
+# The buffer and its writer
+
+_events = collections.deque()
+_condition = threading.Condition()
+_writer = None
+_partitions = set()   # the months known to have their partition
+
+
+def record(event):
+    with _condition:
+        _events.append(event)
+        full = len(_events) >= get_buffer_size()
+        if len(_events) >= get_batch_size():
+            _condition.notify()
+    start_writer()
+    if not full:
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:   # the event loop cannot use the database; the writer catches up
+        return drop_overflow()
+    try:
+        flush()
+    except Exception:
+        logger.exception('The audit buffer is full and cannot be written')
+        drop_overflow()
+
+
+def drop_overflow():
+    with _condition:
+        dropped = max(len(_events) - get_buffer_size(), 0)
+        for _ in range(dropped):
+            _events.popleft()
+    if dropped:
+        logger.error('The audit buffer is full, dropped the %d oldest events', dropped)
+
+
+def write(batch):
+    from .models import AuditEvent
+
+    for month in {partitions.month_start(event.occurred_at) for event in batch} - _partitions:
+        try:
+            partitions.create_partition(AuditEvent, month)
+        except DatabaseError:   # the default partition holds rows of the month, which it cannot delete
+            logger.exception('Cannot create the audit partition of %s, writing to the default one', month)
+        _partitions.add(month)
+    AuditEvent.objects.bulk_create(batch)
+
+
+def flush():
+    """
+    Writes the buffered events, AUDIT_BATCH_SIZE per INSERT, on the calling
+    thread's connection. Returns how many. A batch that fails is put back.
+    """
+    written = 0
+    batch_size = get_batch_size()
+    while True:
+        with _condition:
+            batch = [_events.popleft() for _ in range(min(len(_events), batch_size))]
+        if not batch:
+            return written
+        try:
+            write(batch)
+        except Exception:
+            with _condition:
+                _events.extendleft(reversed(batch))
+            raise
+        written += len(batch)
+
+
+class Writer(threading.Thread):
+    def __init__(self):
+        super().__init__(name='audit-writer', daemon=True)
+        self.stopping = False
+
+    def run(self):
+        while not self.stopping:
+            with _condition:
+                _condition.wait_for(
+                    lambda: self.stopping or len(_events) >= get_batch_size(), timeout=get_flush_interval(),
+                )
+            try:
+                flush()
+            except Exception:
+                logger.exception('Cannot write the audit events, retrying')
+            finally:
+                connections.close_all()
+
+    def stop(self):
+        """
+        Wakes the thread to write what is buffered, and waits for it to end.
+        """
+        with _condition:
+            self.stopping = True
+            _condition.notify_all()
+        self.join()
+
+
+def start_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _condition:
+        if _writer is None or not _writer.is_alive():
+            _writer = Writer()
+            _writer.start()
+
+
+def stop_writer():
+    """
+    Stops the writer once it has written the buffer. A later event starts a new one.
+    """
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None and writer.is_alive():
+        writer.stop()
+
+
+@atexit.register
+def flush_at_exit():
+    stop_writer()
+    if _events:   # the writer's last write failed
+        try:
+            flush()
+        except Exception:
+            logger.exception('Cannot write the audit events at exit, lost %d', len(_events))
+
+
+def reset_after_fork():
+    # a forked worker starts with its own buffer; the parent writes what it had
+    global _condition, _writer
+    _events.clear()
+    _condition = threading.Condition()
+    _writer = None
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+# Reads
+
+def read_target(match):
+    """
+    (model label, pk or None) audited for a GET of the resolved route, or None.
+    """
+    if match is None or match.url_name not in AUDITED_READS:
+        return None
+    model, kwarg = AUDITED_READS[match.url_name]
+    if match.url_name == 'get_export':
+        from .exports import EXPORTS
+        if match.kwargs.get('name') not in EXPORTS:
+            return None
+        model = EXPORTS[match.kwargs['name']][0].Meta.model._meta.label
+    return model, match.kwargs.get(kwarg) if kwarg else None
+
+
+class AuditMiddleware:
+    """
+    Makes the request available to the audit events of the changes it makes,
+    and logs the successful GETs of AUDITED_READS.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request.set(request)
+        try:
+            response = self.get_response(request)
+            self.log_read(request, response)
+        finally:
+            _request.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        token = _request.set(request)
+        try:
+            response = await self.get_response(request)
+            self.log_read(request, response)
+        finally:
+            _request.reset(token)
+        return response
+
+    @staticmethod
+    def log_read(request, response):
+        if request.method != 'GET' or not 200 <= response.status_code < 300:
+            return
+        target = read_target(request.resolver_match)
+        if target is not None:
+            model, object_id = target
+            record(make_event('read' if object_id is not None else 'list', model, object_id))
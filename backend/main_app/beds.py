@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Allotment, Bed, Patient, WardOccupancy
+
+
+class NoBedAvailable(Exception):
+    pass
+
+
+class PatientAlreadyAdmitted(Exception):
+    pass
+
+
+def adjust_free_beds(ward_id, delta):
+    WardOccupancy.objects.filter(ward_id=ward_id).update(free_beds=F('free_beds') + delta)
+
+
+def move_bed(old_ward_id, was_free, new_ward_id, is_free):
+    """
+    Applies a single bed's change of occupancy and/or ward to the counters.
+    """
+    if old_ward_id == new_ward_id and was_free == is_free:
+        return
+    WardOccupancy.objects.filter(ward_id=old_ward_id).update(
+        total_beds=F('total_beds') - 1, free_beds=F('free_beds') - int(was_free),
+    )
+    WardOccupancy.objects.filter(ward_id=new_ward_id).update(
+        total_beds=F('total_beds') + 1, free_beds=F('free_beds') + int(is_free),
+    )
+
+
+def remove_bed(room_id, was_free):
+    """
+    Takes a deleted bed off the counters of its room's ward. Looks the ward up
+    through the room, which a cascading delete removes only after its beds.
+    """
+    WardOccupancy.objects.filter(ward__room=room_id).update(
+        total_beds=F('total_beds') - 1, free_beds=F('free_beds') - int(was_free),
+    )
+
+
+def recount_free_beds(ward_ids):
+    """
+    Recomputes the counters of the given wards from the Bed table. Used after
+    writes that add or move many beds at once (bed creation, bulk imports, a
+    room moved to another ward, admin edits) and by `manage.py recount_beds`.
+    """
+    counts = {
+        row['room__ward']: row
+        for row in Bed.objects.filter(room__ward__in=ward_ids).values('room__ward').annotate(
+            total=Count('id'), free=Count('id', filter=Q(is_occupied=False)),
+        )
+    }
+    WardOccupancy.objects.bulk_create(
+        [
+            WardOccupancy(
+                ward_id=ward_id,
+                total_beds=counts.get(ward_id, {}).get('total', 0),
+                free_beds=counts.get(ward_id, {}).get('free', 0),
+            ) for ward_id in ward_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['ward'],
+        update_fields=['total_beds', 'free_beds'],
+    )
+
+
+@transaction.atomic
+def allocate_bed(patient_id, ward_type=None, room_type=None, admission_date=None, admission_time=None):
+    """
+    Claims the first free bed matching the ward and room type and admits the
+    patient to it. Beds locked by a concurrent allocation are skipped rather than
+    waited on, so two nurses can never be handed the same bed.
+    """
+    patient = Patient.objects.select_for_update().get(id=patient_id)
+    if Allotment.objects.filter(patient_id=patient, discharge_date__isnull=True).exists():
+        raise PatientAlreadyAdmitted()
+
+    beds = Bed.objects.filter(is_occupied=False).select_related('room__ward')
+    if ward_type:
+        beds = beds.filter(room__ward__ward_type=ward_type)
+    if room_type:
+        beds = beds.filter(room__room_type=room_type)
+    bed = beds.select_for_update(skip_locked=True, of=('self',)).order_by('room_id', 'bed_number').first()
+    if bed is None:
+        raise NoBedAvailable()
+
+    bed.is_occupied = True
+    bed.save(update_fields=['is_occupied'])
+    adjust_free_beds(bed.room.ward_id, -1)
+
+    now = timezone.localtime()
+    allotment = Allotment.objects.create(
+        patient_id=patient,
+        ward_id=bed.room.ward,
+        room_id=bed.room,
+        bed_id=bed,
+        admission_date=admission_date or now.date(),
+        admission_time=admission_time or now.time(),
+    )
+    return allotment
+
+
+@transaction.atomic
+def discharge(allotment_id, discharge_date=None, discharge_notes=None):
+    """
+    Closes an allotment and frees its bed.
+    """
+    allotment = Allotment.objects.select_for_update().get(id=allotment_id, discharge_date__isnull=True)
+    allotment.discharge_date = discharge_date or timezone.localdate()
+    allotment.discharge_notes = discharge_notes
+    allotment.save(update_fields=['discharge_date', 'discharge_notes', 'updated_at'])
+
+    if allotment.bed_id_id:
+        bed = Bed.objects.select_for_update(of=('self',)).select_related('room').get(id=allotment.bed_id_id)
+        if bed.is_occupied:
+            bed.is_occupied = False
+            bed.save(update_fields=['is_occupied'])
+            adjust_free_beds(bed.room.ward_id, 1)
+    return allotment
@@ -0,0 +1,524 @@
+"""
+Query-count and latency budgets for every route in edp/urls.py and main_app/urls.py.
+
+`seed()` fills the database with a realistic ward roster, `run_benchmarks()` hits
+every route a number of times and records the worst query count and the p95
+latency, and `write_results()` stores the run as JSON so it can be diffed against
+the previous commit. The budgets live in build_endpoints() next to the request
+that exercises them; main_app.tests.EndpointBudgetTests fails when a query budget
+is exceeded or when a route has no entry at all, and EndpointLatencyTests, which
+only runs with EDP_BENCHMARK=1, when a p95 budget is.
+"""
+import datetime
+import json
+import math
+import subprocess
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from auth_app.authentication import CachedJWTAuthentication
+from auth_app.models import CustomUser
+from .permissions import IsAdminUser, IsDoctorUser, IsPatientUser, IsStaffUser
+from .beds import recount_free_beds
+from .models import *
+from .stats import refresh_stats
+
+
+BATCH_SIZE = 1000
+
+# Rows created per unit of scale
+VOLUMES = {
+    'departments': 10,
+    'doctors': 200,
+    'patients': 2000,
+    'diagnoses': 4000,
+    'medical_tests': 100,
+    'wards': 5,
+    'rooms': 50,
+    'beds': 200,
+}
+
+# The password hasher dominates these, not the database
+AUTH_LATENCY_MS = 2000
+
+
+def seed(scale=1):
+    """
+    Creates VOLUMES * scale rows. Every diagnosis gets one prescription with three
+    medicines and one prescribed test. Returns the objects the requests are built on.
+    """
+    def volume(key):
+        return VOLUMES[key] * scale
+
+    today = datetime.date.today()
+
+    departments = Department.objects.bulk_create(
+        [Department(name=f'Department {i}') for i in range(volume('departments'))],
+        batch_size=BATCH_SIZE,
+    )
+    doctors = Doctor.objects.bulk_create([
+        Doctor(
+            name=f'Doctor {i}', dob=datetime.date(1980, 1, 1), age=45,
+            medical_license_number=f'MLN-{i}', department_id=departments[i % len(departments)],
+            working_hours='9-5', contact_number='7777777777', email_id=f'doctor{i}@example.com',
+            aadhar=f'{i:012d}', address='Pune', qualifications=['MBBS'], specializations=['General'],
+            years_of_experience=10,
+        ) for i in range(volume('doctors'))
+    ], batch_size=BATCH_SIZE)
+    patients = Patient.objects.bulk_create([
+        Patient(
+            name=f'Patient {i}', dob=datetime.date(1990, 1, 1), age=35, blood_group='O+',
+            contact_number=f'9{i:09d}', emergency_contact_number='8888888888', address='Pune',
+            aadhar=f'{i + 500000000000:012d}', allergies=['Penicillin'] if i % 10 == 0 else [],
+            disabilities_or_diseases=[],
+        ) for i in range(volume('patients'))
+    ], batch_size=BATCH_SIZE)
+    medical_tests = MedicalTest.objects.bulk_create([
+        MedicalTest(
+            test_code=f'T{i:04d}', name=f'Medical Test {i}', short_name=f'MT{i}',
+            description='Panel', preconditions='None', test_category='Pathology',
+            test_subcategory='Hematology', test_parameters={'value': 'unit'}, sample_type='Blood',
+            turnaround_time=24, reference_range_format='range', units='unit', cost='100.00',
+        ) for i in range(volume('medical_tests'))
+    ], batch_size=BATCH_SIZE)
+    wards = Ward.objects.bulk_create(
+        [Ward(name=f'Ward {i}', floor_number=i) for i in range(volume('wards'))],
+        batch_size=BATCH_SIZE,
+    )
+    rooms = Room.objects.bulk_create([
+        Room(ward=wards[i % len(wards)], room_number=i, room_type='General')
+        for i in range(volume('rooms'))
+    ], batch_size=BATCH_SIZE)
+    beds = Bed.objects.bulk_create([
+        Bed(room=rooms[i % len(rooms)], bed_number=i, is_occupied=(i % 3 == 0))
+        for i in range(volume('beds'))
+    ], batch_size=BATCH_SIZE)
+
+    occupied = [bed for bed in beds if bed.is_occupied]
+    allotments = Allotment.objects.bulk_create([
+        Allotment(
+            patient_id=patients[-(i + 1)], ward_id=bed.room.ward, room_id=bed.room, bed_id=bed,
+            admission_date=today, admission_time=datetime.time(10, 0),
+        ) for i, bed in enumerate(occupied)
+    ], batch_size=BATCH_SIZE)
+    recount_free_beds([ward.id for ward in wards])
+
+    diagnoses = Diagnosis.objects.bulk_create([
+        Diagnosis(
+            patient_id=patients[i % len(patients)], visiting_doctor_id=doctors[i % len(doctors)],
+            diagnosis_date=today - datetime.timedelta(days=i % 365), diagnosis_summary='Fever',
+            tests=[medical_tests[i % len(medical_tests)].test_code],
+        ) for i in range(volume('diagnoses'))
+    ], batch_size=BATCH_SIZE)
+    prescriptions = Prescription.objects.bulk_create([
+        Prescription(
+            diagnosis_id=diagnosis, patient_id=diagnosis.patient_id,
+            prescribed_by_doctor_id=diagnosis.visiting_doctor_id,
+        ) for diagnosis in diagnoses
+    ], batch_size=BATCH_SIZE)
+    PrescriptionDetails.objects.bulk_create([
+        PrescriptionDetails(
+            prescription_id=prescription, diagnosis_id=prescription.diagnosis_id,
+            patient_id=prescription.patient_id, prescribed_by_doctor_id=prescription.prescribed_by_doctor_id,
+            drug=f'Drug {n}', dosage='1-0-1', method='Oral', duration='5 days',
+        ) for prescription in prescriptions for n in range(3)
+    ], batch_size=BATCH_SIZE)
+    tests_prescribed = TestPrescribed.objects.bulk_create([
+        TestPrescribed(
+            test_code=medical_tests[i % len(medical_tests)], prescription_id=prescription,
+            patient_id=prescription.patient_id, ordering_doctor_id=prescription.prescribed_by_doctor_id,
+            test_date=today, test_time=datetime.time(10, 0),
+        ) for i, prescription in enumerate(prescriptions)
+    ], batch_size=BATCH_SIZE)
+
+    refresh_stats()
+
+    admin = CustomUser.objects.create_superuser(email='benchmark-admin@example.com', password='benchmark')
+    claimed_tests = [test.id for test in tests_prescribed[-100:]]
+    TestPrescribed.objects.filter(id__in=claimed_tests).update(claimed_by=admin, claimed_at=timezone.now())
+    CustomUser.objects.create_user(
+        aadhaar=patients[0].aadhar, password='benchmark', role='patient', patient=patients[0],
+    )
+
+    return {
+        'admin': admin,
+        'department': departments[0],
+        'doctor': doctors[0],
+        'patient': patients[0],
+        'admissible_patients': [patient.id for patient in patients[1:101]],
+        'allotments': [allotment.id for allotment in allotments],
+        'diagnosis': diagnoses[0],
+        'prescription': prescriptions[0],
+        'medical_test': medical_tests[0],
+        'test_prescribed': tests_prescribed[0],
+        'ward': wards[0],
+        'room': rooms[0],
+        'bed': beds[0],
+        'claimed_tests': claimed_tests,
+        'result_upload': ResultUpload.objects.create(test=tests_prescribed[0], filename='scan.pdf', size=1024 ** 2),
+        'import_job': ImportJob.objects.create(kind='patients', source='benchmark.csv', status='completed'),
+    }
+
+
+def build_endpoints(objects):
+    """
+    One entry per request that is measured: the route it resolves to, the concrete
+    path and payload, and the query / p95 latency budget for it. `path` and `data`
+    may be callables taking the iteration number, for endpoints that need unique input.
+    """
+    department = objects['department'].id
+    doctor = objects['doctor'].id
+    patient = objects['patient'].id
+    diagnosis = objects['diagnosis'].id
+    prescription = objects['prescription'].id
+    medical_test = objects['medical_test'].pk
+    test_prescribed = objects['test_prescribed'].id
+    ward = objects['ward'].id
+    room = objects['room'].id
+    bed = objects['bed'].id
+    patient_aadhar = objects['patient'].aadhar
+    today = str(datetime.date.today())
+
+    def new_patient(i):
+        return {
+            'name': f'New Patient {i}', 'dob': '1990-01-01', 'age': 35, 'blood_group': 'O+',
+            'contact_number': '9999999999', 'emergency_contact_number': '8888888888',
+            'address': 'Pune', 'aadhar': f'{i:012d}', 'allergies': [], 'disabilities_or_diseases': [],
+        }
+
+    def new_doctor(i):
+        return {
+            'name': f'New Doctor {i}', 'dob': '1980-01-01', 'age': 45, 'medical_license_number': 'MLN',
+            'working_hours': '9-5', 'contact_number': '7777777777', 'email_id': f'new{i}@example.com',
+            'aadhar': f'{i:012d}', 'address': 'Pune', 'years_of_experience': 10,
+        }
+
+    def new_medical_test(i):
+        return {
+            'test_code': f'NEW{i}', 'name': 'New Test', 'short_name': 'NT', 'description': 'Panel',
+            'preconditions': 'None', 'test_category': 'Pathology', 'test_subcategory': 'Hematology',
+            'test_parameters': {'value': 'unit'}, 'sample_type': 'Blood', 'turnaround_time': 24,
+            'reference_range_format': 'range', 'units': 'unit', 'cost': '100.00',
+        }
+
+    test_prescribed_data = {
+        'test_code': medical_test, 'prescription_id': prescription, 'patient_id': patient,
+        'ordering_doctor_id': doctor, 'test_date': today, 'test_time': '10:00',
+    }
+    full_diagnosis = {
+        'patient_id': patient, 'visiting_doctor_id': doctor, 'diagnosis_summary': 'Fever',
+        'tests': [], 'additional_notes': 'Rest',
+        'prescriptions': [{'drug': f'Drug {n}', 'dosage': '1-0-1', 'method': 'Oral', 'duration': '5 days'} for n in range(10)],
+        'tests_prescribed': [{'test_code': medical_test}],
+    }
+
+    return [
+        # edp/urls.py
+        {'method': 'GET', 'route': '', 'path': '/', 'max_queries': 0, 'p95_ms': 50},
+        {'method': 'GET', 'route': 'admin/', 'path': '/admin/', 'max_queries': 3, 'p95_ms': 250},
+        {'method': 'POST', 'route': 'register/patient/', 'path': '/register/patient/', 'auth': False,
+         'data': lambda i: {'aadhaar': f'{i + 100000000000:012d}', 'password': 'benchmark'},
+         'max_queries': 3, 'p95_ms': AUTH_LATENCY_MS, 'iterations': 5},
+        {'method': 'POST', 'route': 'login/<str:role>/', 'path': '/login/patient/', 'auth': False,
+         'data': {'aadhaar': patient_aadhar, 'password': 'benchmark'},
+         'max_queries': 1, 'p95_ms': AUTH_LATENCY_MS, 'iterations': 5},
+
+        # Departments
+        {'method': 'GET', 'route': 'api/departments/', 'path': '/api/departments/', 'max_queries': 2, 'p95_ms': 100},
+        {'method': 'POST', 'route': 'api/departments/', 'path': '/api/departments/',
+         'data': {'name': 'New Department'}, 'max_queries': 1, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/departments/<int:department_id>/', 'path': f'/api/departments/{department}/',
+         'max_queries': 1, 'p95_ms': 100},
+        {'method': 'PATCH', 'route': 'api/departments/<int:department_id>/', 'path': f'/api/departments/{department}/',
+         'data': {'description': 'Updated'}, 'max_queries': 2, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/departments/<int:department_id>/doctors/',
+         'path': f'/api/departments/{department}/doctors/', 'max_queries': 1, 'p95_ms': 150},
+
+        # Doctors
+        {'method': 'GET', 'route': 'api/doctors/', 'path': '/api/doctors/', 'max_queries': 1, 'p95_ms': 150},
+        {'method': 'GET', 'route': 'api/doctors/', 'path': '/api/doctors/?specializations=General',
+         'max_queries': 1, 'p95_ms': 150},
+        {'method': 'POST', 'route': 'api/doctors/', 'path': '/api/doctors/', 'data': new_doctor,
+         'max_queries': 1, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/doctors/search/', 'path': '/api/doctors/search/?q=doctr 1',
+         'max_queries': 1, 'p95_ms': 50},
+        {'method': 'GET', 'route': 'api/doctors/<int:doctor_id>/', 'path': f'/api/doctors/{doctor}/',
+         'max_queries': 1, 'p95_ms': 100},
+        {'method': 'PATCH', 'route': 'api/doctors/<int:doctor_id>/', 'path': f'/api/doctors/{doctor}/',
+         'data': {'working_hours': '10-6'}, 'max_queries': 2, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/doctors/<int:doctor_id>/diagnoses/', 'path': f'/api/doctors/{doctor}/diagnoses/',
+         'max_queries': 1, 'p95_ms': 150},
+        {'method': 'POST', 'route': 'api/doctors/<int:doctor_id>/diagnoses/<int:patient_id>/',
+         'path': f'/api/doctors/{doctor}/diagnoses/{patient}/',
+         'data': {'patient_id': patient, 'visiting_doctor_id': doctor, 'diagnosis_date': today,
+                  'diagnosis_time': '10:00', 'tests': []},
+         'max_queries': 3, 'p95_ms': 100},
+        {'method': 'PATCH', 'route': 'api/doctors/<int:doctor_id>/diagnoses/<int:patient_id>/<int:diagnosis_id>/',
+         'path': f'/api/doctors/{doctor}/diagnoses/{patient}/{diagnosis}/',
+         'data': {'diagnosis_summary': 'Recovering'}, 'max_queries': 2, 'p95_ms': 100},
+        # PrescriptionDetailsSerializer exposes no prescription field, so only the validation path is measured
+        {'method': 'POST', 'route': 'api/doctors/<doctor_id>/prescriptions/<patient_id>/',
+         'path': f'/api/doctors/{doctor}/prescriptions/{patient}/',
+         'data': {'drug': 'P' * 101, 'dosage': '1-0-1', 'method': 'Oral', 'duration': '3 days'},
+         'expected_status': 400, 'max_queries': 0, 'p95_ms': 100},
+        {'method': 'PATCH', 'route': 'api/doctors/<doctor_id>/prescriptions/<patient_id>/<prescription_id>/',
+         'path': f'/api/doctors/{doctor}/prescriptions/{patient}/{objects["prescription"].prescriptiondetails_set.first().id}/',
+         'data': {'dosage': '1-1-1'}, 'max_queries': 2, 'p95_ms': 100},
+
+        # Diagnoses
+        {'method': 'GET', 'route': 'api/diagnoses/', 'path': f'/api/diagnoses/?tests={medical_test}',
+         'max_queries': 1, 'p95_ms': 150},
+        {'method': 'POST', 'route': 'api/diagnoses/<int:diagnosis_id>/tests/', 'path': f'/api/diagnoses/{diagnosis}/tests/',
+         'data': test_prescribed_data, 'max_queries': 5, 'p95_ms': 100},
+        {'method': 'PATCH', 'route': 'api/diagnoses/<int:diagnosis_id>/tests/<int:test_prescribed_id>/',
+         'path': f'/api/diagnoses/{diagnosis}/tests/{test_prescribed}/',
+         'data': {'comments': 'Fasting sample'}, 'max_queries': 2, 'p95_ms': 100},
+
+        # Patients
+        {'method': 'GET', 'route': 'api/patients/', 'path': '/api/patients/', 'max_queries': 1, 'p95_ms': 150},
+        {'method': 'GET', 'route': 'api/patients/', 'path': '/api/patients/?allergies=Penicillin',
+         'max_queries': 1, 'p95_ms': 150},
+        {'method': 'POST', 'route': 'api/patients/', 'path': '/api/patients/', 'data': new_patient,
+         'max_queries': 1, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/patients/search/', 'path': '/api/patients/search/?q=pati 12',
+         'max_queries': 1, 'p95_ms': 50},
+        {'method': 'GET', 'route': 'api/patients/search/', 'path': '/api/patients/search/?q=000012',
+         'max_queries': 1, 'p95_ms': 50},
+        {'method': 'GET', 'route': 'api/patients/<int:patient_id>/', 'path': f'/api/patients/{patient}/',
+         'max_queries': 1, 'p95_ms': 100},
+        {'method': 'PATCH', 'route': 'api/patients/<int:patient_id>/', 'path': f'/api/patients/{patient}/',
+         'data': {'medical_history': 'Asthma'}, 'max_queries': 2, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/patients/<int:patient_id>/diagnoses/', 'path': f'/api/patients/{patient}/diagnoses/',
+         'max_queries': 1, 'p95_ms': 150},
+        {'method': 'GET', 'route': 'api/patients/<int:patient_id>/diagnoses/<int:diagnosis_id>/',
+         'path': f'/api/patients/{patient}/diagnoses/{diagnosis}/', 'max_queries': 4, 'p95_ms': 100},
+
+        # Medical Tests
+        {'method': 'GET', 'route': 'api/medical-tests/', 'path': '/api/medical-tests/', 'max_queries': 1, 'p95_ms': 150},
+        {'method': 'POST', 'route': 'api/medical-tests/', 'path': '/api/medical-tests/', 'data': new_medical_test,
+         'max_queries': 2, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/medical-tests/<str:medical_test_id>/', 'path': f'/api/medical-tests/{medical_test}/',
+         'max_queries': 1, 'p95_ms': 100},
+        {'method': 'PATCH', 'route': 'api/medical-tests/<str:medical_test_id>/', 'path': f'/api/medical-tests/{medical_test}/',
+         'data': {'cost': '120.00'}, 'max_queries': 2, 'p95_ms': 100},
+
+        # Ward, Room & Bed Management
+        {'method': 'GET', 'route': 'api/wards/', 'path': '/api/wards/', 'max_queries': 1, 'p95_ms': 100},
+        {'method': 'POST', 'route': 'api/wards/create/', 'path': '/api/wards/create/',
+         'data': {'name': 'ICU', 'floor_number': 3}, 'max_queries': 2, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/rooms/', 'path': '/api/rooms/', 'max_queries': 1, 'p95_ms': 100},
+        {'method': 'POST', 'route': 'api/rooms/create/', 'path': '/api/rooms/create/',
+         'data': {'ward': ward, 'room_number': 999, 'room_type': 'Private'}, 'max_queries': 2, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/beds/', 'path': '/api/beds/', 'max_queries': 1, 'p95_ms': 100},
+        # One room lookup and one INSERT per bed, then the ward counters are recounted
+        {'method': 'POST', 'route': 'api/beds/create/', 'path': '/api/beds/create/',
+         'data': [{'room': room, 'bed_number': 900 + n} for n in range(5)], 'max_queries': 15, 'p95_ms': 100},
+        {'method': 'PATCH', 'route': 'api/beds/<int:bed_id>/', 'path': f'/api/beds/{bed}/',
+         'data': {'is_occupied': True}, 'max_queries': 4, 'p95_ms': 100},
+        {'method': 'POST', 'route': 'api/beds/allocate/', 'path': '/api/beds/allocate/',
+         'data': lambda i: {'patient_id': objects['admissible_patients'][i], 'ward_type': 'General'},
+         'max_queries': 8, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/wards/availability/', 'path': '/api/wards/availability/',
+         'max_queries': 1, 'p95_ms': 100},
+
+        # Allotments
+        {'method': 'POST', 'route': 'api/allotments/<int:allotment_id>/discharge/',
+         'path': lambda i: f'/api/allotments/{objects["allotments"][i]}/discharge/',
+         'data': {'discharge_notes': 'Recovered'}, 'max_queries': 7, 'p95_ms': 100},
+
+        # Stats: three small materialized views, the refresh log and WardOccupancy
+        {'method': 'GET', 'route': 'api/stats/', 'path': '/api/stats/?days=30', 'max_queries': 5, 'p95_ms': 100},
+
+        # Exports, timed until the last byte is streamed
+        {'method': 'GET', 'route': 'api/exports/<slug:name>/', 'path': '/api/exports/diagnoses/',
+         'max_queries': 1, 'p95_ms': 500},
+        {'method': 'GET', 'route': 'api/exports/<slug:name>/',
+         'path': f'/api/exports/patients/?output=ndjson&from={today}&to={today}&gzip=true',
+         'max_queries': 1, 'p95_ms': 500},
+
+        # Imports; an upload would leave a file in MEDIA_ROOT per iteration, so only
+        # the validation path of the POST is measured
+        {'method': 'POST', 'route': 'api/imports/<slug:kind>/', 'path': '/api/imports/patients/',
+         'expected_status': 400, 'max_queries': 0, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/imports/<int:import_id>/', 'path': f'/api/imports/{objects["import_job"].id}/',
+         'max_queries': 1, 'p95_ms': 100},
+
+        # Lab queue: the claim reads the pending index with SKIP LOCKED, updates and
+        # refetches the batch (never waits here, the request runs in a transaction)
+        {'method': 'POST', 'route': 'api/lab/queue/claim/', 'path': '/api/lab/queue/claim/?limit=10&wait=5',
+         'max_queries': 5, 'p95_ms': 100},
+        {'method': 'POST', 'route': 'api/lab/queue/<int:test_prescribed_id>/release/',
+         'path': lambda i: f'/api/lab/queue/{objects["claimed_tests"][i]}/release/',
+         'max_queries': 2, 'p95_ms': 100},
+
+        # Result uploads; PATCHing chunks writes files, so only the bookkeeping is measured
+        {'method': 'POST', 'route': 'api/tests/<int:test_prescribed_id>/uploads/',
+         'path': f'/api/tests/{objects["test_prescribed"].id}/uploads/',
+         'data': {'filename': 'scan.pdf', 'size': 200 * 1024 ** 2}, 'max_queries': 2, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/uploads/<int:upload_id>/', 'path': f'/api/uploads/{objects["result_upload"].id}/',
+         'max_queries': 1, 'p95_ms': 100},
+
+        # Doctor flow
+        {'method': 'POST', 'route': 'api/create-full-diagnosis/', 'path': '/api/create-full-diagnosis/',
+         'data': full_diagnosis, 'max_queries': 9, 'p95_ms': 150},
+        {'method': 'GET', 'route': 'api/diagnosis-details/<int:diagnosis_id>/', 'path': f'/api/diagnosis-details/{diagnosis}/',
+         'max_queries': 4, 'p95_ms': 100},
+        {'method': 'GET', 'route': 'api/diagnoses/patient/<int:patient_id>/', 'path': f'/api/diagnoses/patient/{patient}/',
+         'max_queries': 1, 'p95_ms': 150},
+        {'method': 'GET', 'route': 'api/diagnoses/doctor/<int:doctor_id>/', 'path': f'/api/diagnoses/doctor/{doctor}/',
+         'max_queries': 1, 'p95_ms': 150},
+    ]
+
+
+def get_routes():
+    """
+    Every route the project serves, as its full pattern string. The admin site is
+    counted as the single route 'admin/'.
+    """
+    routes = []
+
+    def walk(patterns, prefix):
+        for pattern in patterns:
+            route = prefix + str(pattern.pattern)
+            if hasattr(pattern, 'url_patterns') and getattr(pattern, 'app_name', None) != 'admin':
+                walk(pattern.url_patterns, route)
+            else:
+                routes.append(route)
+
+    walk(get_resolver().url_patterns, '')
+    return routes
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def run_benchmarks(objects, iterations=20):
+    """
+    Issues every request in build_endpoints() `iterations` times (or the entry's own
+    `iterations`) and returns one result dict per entry.
+    """
+    admin = objects['admin']
+    client = APIClient()
+    client.force_login(admin)   # the admin site is session based
+    token = RefreshToken.for_user(admin).access_token
+    authorization = f'Bearer {token}'
+
+    results = []
+    for endpoint in build_endpoints(objects):
+        method = endpoint['method'].lower()
+        timings = []
+        queries = 0
+        status_codes = set()
+
+        for i in range(endpoint.get('iterations', iterations)):
+            path, data = endpoint['path'], endpoint.get('data')
+            if callable(path):
+                path = path(i)
+            if callable(data):
+                data = data(i)
+            headers = {'HTTP_AUTHORIZATION': authorization} if endpoint.get('auth', True) else {}
+
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, data=data, format='json', **headers)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured))
+            status_codes.add(response.status_code)
+
+        expected_status = endpoint.get('expected_status')
+        status_ok = all(
+            code == expected_status if expected_status else code < 400
+            for code in status_codes
+        )
+        p95_ms = percentile(timings, 0.95)
+        results.append({
+            'method': endpoint['method'],
+            'route': endpoint['route'],
+            'path': path,
+            'status_codes': sorted(status_codes),
+            'status_ok': status_ok,
+            'queries': queries,
+            'max_queries': endpoint['max_queries'],
+            'p95_ms': round(p95_ms, 2),
+            'budget_p95_ms': endpoint['p95_ms'],
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'ok': status_ok and queries <= endpoint['max_queries'] and p95_ms <= endpoint['p95_ms'],
+        })
+    return results
+
+
+def run_auth_benchmark(objects, iterations=20):
+    """
+    Queries and time spent per request on authentication and the permission
+    checks alone, for every role, with and without a linked doctor / patient:
+    before is simplejwt's JWTAuthentication (one user SELECT per request),
+    after is CachedJWTAuthentication.
+    """
+    users = {'admin': objects['admin']}
+    users.update(
+        (role, CustomUser.objects.create_user(email=f'benchmark-{role}@example.com', password='benchmark', role=role))
+        for role in ('staff', 'doctor')
+    )
+    users['patient'] = CustomUser.objects.create_user(aadhaar='benchmark-01', password='benchmark', role='patient')
+    users['linked doctor'] = CustomUser.objects.create_user(
+        email='benchmark-linked-doctor@example.com', password='benchmark', role='doctor', doctor=objects['doctor'],
+    )
+    users['linked patient'] = CustomUser.objects.create_user(
+        aadhaar='benchmark-02', password='benchmark', role='patient', patient=objects['patient'],
+    )
+    permissions = [IsAdminUser(), IsDoctorUser(), IsPatientUser(), IsStaffUser()]
+    factory = APIRequestFactory()
+
+    results = {}
+    for name, authentication_class in (('before', JWTAuthentication), ('after', CachedJWTAuthentication)):
+        for role, user in users.items():
+            authorization = f'Bearer {RefreshToken.for_user(user).access_token}'
+            timings = []
+            queries = []
+            for _ in range(iterations):
+                request = Request(factory.get('/', HTTP_AUTHORIZATION=authorization), authenticators=[authentication_class()])
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    request.user
+                    for permission in permissions:
+                        permission.has_permission(request, None)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(captured))
+            results.setdefault(name, {})[role] = {
+                # the first request of 'after' fills the cache
+                'first_request_queries': queries[0],
+                'queries': max(queries[1:]),
+                'p95_ms': round(percentile(timings[1:], 0.95), 3),
+            }
+    return results
+
+
+def write_results(results, path, scale, auth=None):
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    with open(path, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'scale': scale,
+            'endpoints': results,
+            'auth': auth,
+        }, f, indent=2)
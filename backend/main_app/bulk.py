@@ -0,0 +1,154 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from rest_framework import serializers, status
+from rest_framework.response import Response
+from rest_framework.validators import UniqueValidator
+
+from . import audit
+from .cache import CATALOGS, invalidate_catalog
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_bulk_request(request):
+    """
+    Bulk mode is opt-in: POST a JSON list with ?bulk=true.
+    """
+    return isinstance(request.data, list) and request.query_params.get('bulk', '').lower() in ('true', '1', 'yes')
+
+
+def get_batch_size(request):
+    default = getattr(settings, 'BULK_CREATE_BATCH_SIZE', 1000)
+    try:
+        batch_size = int(request.query_params.get('batch_size', default))
+    except ValueError:
+        return default
+    return max(1, min(batch_size, getattr(settings, 'BULK_CREATE_MAX_BATCH_SIZE', 5000)))
+
+
+def prefetch_related_fields(serializer, rows):
+    """
+    PrimaryKeyRelatedField validates each row with its own SELECT. Instead, load
+    every referenced object of each relation with one in_bulk() query and resolve
+    the rows from that.
+    """
+    for name, field in serializer.child.fields.items():
+        if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.read_only:
+            continue
+
+        pk_field = field.get_queryset().model._meta.pk
+        pks = set()
+        for row in rows:
+            if isinstance(row, dict) and row.get(name) is not None:
+                try:
+                    pks.add(pk_field.to_python(row[name]))
+                except DjangoValidationError:
+                    pass
+        objects = field.get_queryset().in_bulk(pks)
+
+        def to_internal_value(data, field=field, pk_field=pk_field, objects=objects):
+            if isinstance(data, bool):
+                field.fail('incorrect_type', data_type=type(data).__name__)
+            try:
+                pk = pk_field.to_python(data)
+            except DjangoValidationError:
+                field.fail('incorrect_type', data_type=type(data).__name__)
+            if pk not in objects:
+                field.fail('does_not_exist', pk_value=data)
+            return objects[pk]
+
+        field.to_internal_value = to_internal_value
+
+
+def prefetch_unique_fields(serializer, rows):
+    """
+    UniqueValidator checks each row with its own SELECT. Instead, load the
+    values of each unique field already taken with one query, and check the
+    rows against that, and against the rows before them.
+    """
+    for name, field in serializer.child.fields.items():
+        unique = [validator for validator in field.validators if isinstance(validator, UniqueValidator)]
+        if field.read_only or not unique or isinstance(field, serializers.RelatedField):
+            continue
+
+        model_field = serializer.child.Meta.model._meta.get_field(field.source)
+        values = set()
+        for row in rows:
+            if isinstance(row, dict) and row.get(name) is not None:
+                try:
+                    values.add(model_field.to_python(row[name]))
+                except DjangoValidationError:
+                    pass
+        taken = set()
+        for validator in unique:
+            taken.update(validator.queryset.filter(**{f'{field.source}__in': values}).values_list(field.source, flat=True))
+        seen = set()
+
+        def validate_unique(value, taken=taken, seen=seen, message=unique[0].message):
+            if value in taken or value in seen:
+                raise serializers.ValidationError(message, code='unique')
+            seen.add(value)
+
+        field.validators = [validator for validator in field.validators if not isinstance(validator, UniqueValidator)]
+        field.validators.append(validate_unique)
+
+
+def bulk_create_response(request, serializer_class):
+    """
+    Validates every row up front, then writes them with bulk_create in batches
+    of ?batch_size= rows inside a single transaction. Nothing is written unless
+    every row is valid; the response lists the errors per row index otherwise.
+    """
+    rows = request.data
+    batch_size = get_batch_size(request)
+    started = time.perf_counter()
+
+    serializer = serializer_class(data=rows, many=True)
+    prefetch_related_fields(serializer, rows)
+    prefetch_unique_fields(serializer, rows)
+    if not serializer.is_valid():
+        errors = [
+            {'index': index, 'errors': row_errors}
+            for index, row_errors in enumerate(serializer.errors) if row_errors
+        ]
+        return Response({
+            'created': 0,
+            'invalid': len(errors),
+            'errors': errors,
+        }, status=status.HTTP_400_BAD_REQUEST)
+    validated = time.perf_counter()
+
+    model = serializer_class.Meta.model
+    objs = [model(**attrs) for attrs in serializer.validated_data]
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(objs, batch_size=batch_size)
+            audit.log_created(objs)
+    except IntegrityError:
+        # a row taken meanwhile by a concurrent request; the database error names tables and values
+        logger.exception('Bulk create of %d %s rows failed', len(objs), model._meta.label)
+        return Response({
+            'created': 0,
+            'errors': [{'index': None, 'errors': 'The rows conflict with existing data, nothing was written.'}],
+        }, status=status.HTTP_400_BAD_REQUEST)
+    finished = time.perf_counter()
+
+    # bulk_create sends no post_save signals
+    for name, model_label in CATALOGS.items():
+        if model_label == model._meta.label:
+            invalidate_catalog(name)
+
+    elapsed = finished - started
+    return Response({
+        'created': len(objs),
+        'ids': [obj.pk for obj in objs],
+        'batch_size': batch_size,
+        'validation_ms': round((validated - started) * 1000, 2),
+        'insert_ms': round((finished - validated) * 1000, 2),
+        'rows_per_second': round(len(objs) / elapsed) if elapsed else None,
+    }, status=status.HTTP_201_CREATED)
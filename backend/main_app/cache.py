@@ -0,0 +1,92 @@
+import functools
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# Reference catalogs that are served through cached_catalog(), keyed by the
+# model whose save/delete signals invalidate them (see signals.py)
+CATALOGS = {
+    'medical_tests': 'main_app.MedicalTest',
+    'departments': 'main_app.Department',
+    'wards': 'main_app.Ward',
+    'rooms': 'main_app.Room',
+}
+
+# The models a catalog's rows point to, whose rows it embeds (?expand=, see
+# fieldsets.py) or which null its foreign keys on delete: their saves and
+# deletes invalidate the catalog too
+CATALOG_RELATED = {
+    'departments': ['main_app.Doctor'],
+    'rooms': ['main_app.Ward'],
+}
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_version(name):
+    """
+    Every catalog has a random version token. Payloads are stored under the token,
+    so invalidating a catalog only means replacing it; a token lost to eviction
+    just makes the next read a miss, and never resurrects an old payload.
+    """
+    return get_cache().get_or_set(f'catalog:{name}:version', uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_catalog(name):
+    """
+    Drops the cached payloads of a catalog now, and again once the surrounding
+    transaction commits, so nothing read before the commit outlives it.
+    """
+    def bump():
+        get_cache().set(f'catalog:{name}:version', uuid.uuid4().hex, timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def cached_catalog(name):
+    """
+    Read-through cache for the GET side of a catalog list view.
+
+    The serialized response is cached per catalog version and query string, and
+    sent with an ETag; a request whose If-None-Match still matches gets a 304
+    without touching the database. Goes inside @api_view/@permission_classes, so
+    authentication and permissions still run on every request.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            cache = get_cache()
+            digest = hashlib.md5(f'{get_version(name)}:{request.get_full_path()}'.encode()).hexdigest()
+            key = f'catalog:{name}:{digest}'
+            etag = quote_etag(digest)
+
+            if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                data = cache.get(key)
+                if data is not None:
+                    response = Response(data, status=status.HTTP_200_OK)
+                else:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    cache.set(key, response.data, timeout=getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60 * 24))
+
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,48 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .models import Bed, WardOccupancy
+
+
+def ward_group(ward_id):
+    return f'ward_{ward_id}_beds'
+
+
+class BedBoardConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Live occupancy board for one ward: /ws/wards/<ward_id>/beds/
+
+    On connect the client gets a snapshot of every bed in the ward; after that it
+    only receives the deltas broadcast by main_app.signals when a bed or allotment
+    changes, so there is nothing left to poll.
+    """
+    async def connect(self):
+        user = self.scope.get('user')
+        # same rule as permissions.IsStaffUser
+        if not (user and user.is_authenticated and (user.is_superuser or hasattr(user, 'staff'))):
+            await self.close(code=4403)
+            return
+
+        self.ward_id = self.scope['url_route']['kwargs']['ward_id']
+        await self.channel_layer.group_add(ward_group(self.ward_id), self.channel_name)
+        await self.accept()
+        await self.send_json(await self.get_snapshot())
+
+    async def disconnect(self, code):
+        if hasattr(self, 'ward_id'):
+            await self.channel_layer.group_discard(ward_group(self.ward_id), self.channel_name)
+
+    @database_sync_to_async
+    def get_snapshot(self):
+        beds = Bed.objects.filter(room__ward_id=self.ward_id).order_by('room_id', 'bed_number')
+        occupancy = WardOccupancy.objects.filter(ward_id=self.ward_id).values('total_beds', 'free_beds').first()
+        return {
+            'type': 'snapshot',
+            'ward': self.ward_id,
+            # [bed id, room id, bed number, occupied]
+            'beds': [list(bed) for bed in beds.values_list('id', 'room_id', 'bed_number', 'is_occupied')],
+            **(occupancy or {'total_beds': 0, 'free_beds': 0}),
+        }
+
+    async def ward_delta(self, event):
+        await self.send_json(event['delta'])
@@ -0,0 +1,214 @@
+"""
+Streaming CSV / NDJSON dumps of the report tables for MIS and insurance.
+
+    GET /api/exports/<name>/?output=csv|ndjson&from=2025-01-01&to=2025-01-31&gzip=true
+
+`from` and `to` are inclusive days of the table's date field (see EXPORTS), in
+the current time zone; ?fields= and ?expand= work as on the list endpoints.
+
+Rows are read through a server-side cursor, EXPORT_CHUNK_SIZE at a time, and
+each chunk is encoded (and compressed) and sent before the next is fetched, so
+a worker holds one chunk however large the table is. The rows are the ones the
+list endpoints return, built by the FastReader where the serializer has one.
+Under ASGI, ExportResponse pulls each chunk in the request's thread in turn,
+rather than letting Django list the whole stream before sending it.
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from .fast_serializers import get_fields, get_reader
+from .fieldsets import get_fieldset, narrow_queryset, serialize
+from .serializers import (
+    DiagnosisSerializer, PatientSerializer, PrescriptionDetailsExportSerializer, PrescriptionExportSerializer,
+)
+
+try:
+    import orjson
+except ImportError:   # optional, json is used without it
+    orjson = None
+
+
+# Export name -> (serializer, field ?from= / ?to= filter on)
+EXPORTS = {
+    'patients': (PatientSerializer, 'created_at'),
+    'diagnoses': (DiagnosisSerializer, 'diagnosis_date'),
+    'prescriptions': (PrescriptionExportSerializer, 'prescription_date'),
+    'prescription-details': (PrescriptionDetailsExportSerializer, 'created_at'),
+}
+
+OUTPUTS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def get_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def is_true(value):
+    return value.lower() in ('true', '1', 'yes')
+
+
+def get_date(request, param):
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValidationError({param: ['Enter a date as YYYY-MM-DD.']})
+    return date
+
+
+def filter_dates(queryset, field_name, start, end):
+    """
+    Rows whose `field_name` falls on the days start..end (either may be None).
+    Datetimes are compared against the bounds of those days in the current time
+    zone rather than through __date, so an index on the column stays usable.
+    """
+    if queryset.model._meta.get_field(field_name).get_internal_type() != 'DateTimeField':
+        if start is not None:
+            queryset = queryset.filter(**{f'{field_name}__gte': start})
+        if end is not None:
+            queryset = queryset.filter(**{f'{field_name}__lte': end})
+        return queryset
+
+    tz = timezone.get_current_timezone()
+    if start is not None:
+        queryset = queryset.filter(**{f'{field_name}__gte': datetime.datetime.combine(start, datetime.time(), tz)})
+    if end is not None:
+        next_day = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time(), tz)
+        queryset = queryset.filter(**{f'{field_name}__lt': next_day})
+    return queryset
+
+
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_rows(queryset, serializer_class, fields, expand):
+    """
+    The serialized rows of `queryset` in primary key order, a chunk (list of
+    dicts) at a time, read through a server-side cursor.
+    """
+    chunk_size = get_chunk_size()
+    queryset = queryset.order_by('pk')
+    reader = get_reader(serializer_class, fields, expand)
+    if reader is not None:
+        for rows in iter_chunks(reader.values_list(queryset).iterator(chunk_size=chunk_size), chunk_size):
+            yield reader.to_representation(rows), reader.json_safe
+        return
+
+    queryset = narrow_queryset(queryset, serializer_class, fields, expand)
+    for instances in iter_chunks(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        yield serialize(instances, serializer_class, fields, expand), False
+
+
+def encode_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+def encode_csv(chunks, header):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows, _ in chunks:
+        writer.writerows([encode_cell(row.get(name)) for name in header] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():   # header only
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(chunks, header):
+    for rows, json_safe in chunks:
+        if orjson is not None and json_safe:
+            yield b''.join(orjson.dumps(row) + b'\n' for row in rows)
+        else:
+            yield ''.join(
+                json.dumps(row, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')) + '\n' for row in rows
+            ).encode()
+
+
+def gzip_stream(blocks):
+    compressor = zlib.compressobj(wbits=31)   # gzip container
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class ExportResponse(StreamingHttpResponse):
+    """
+    A StreamingHttpResponse of a synchronous stream that ASGI servers get a
+    chunk at a time too: each is pulled with sync_to_async on the request's
+    thread (thread_sensitive), where the server-side cursor's connection is.
+    """
+    async def __aiter__(self):
+        parts = iter(self.streaming_content)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while (part := await next_part(parts, None)) is not None:
+            yield part
+
+
+def export_response(request, name):
+    """
+    The ExportResponse for the export `name`. Invalid parameters are a 400
+    before anything is streamed.
+    """
+    if name not in EXPORTS:
+        raise NotFound(f"Unknown export, choose one of: {', '.join(EXPORTS)}")
+    serializer_class, date_field = EXPORTS[name]
+
+    output = request.query_params.get('output', 'csv')
+    if output not in OUTPUTS:
+        raise ValidationError({'output': [f"Choose one of: {', '.join(OUTPUTS)}"]})
+    start, end = get_date(request, 'from'), get_date(request, 'to')
+    if start is not None and end is not None and start > end:
+        raise ValidationError({'to': ['Must not be before from.']})
+    fields, expand = get_fieldset(request, serializer_class)
+
+    queryset = filter_dates(serializer_class.Meta.model.objects.all(), date_field, start, end)
+    header = [field for field in get_fields(serializer_class) if fields is None or field in fields]
+    encode = encode_csv if output == 'csv' else encode_ndjson
+    stream = encode(iter_rows(queryset, serializer_class, fields, expand), header)
+
+    filename = f"{name}-{timezone.localdate().isoformat()}.{output}"
+    content_type = OUTPUTS[output]
+    if is_true(request.query_params.get('gzip', '')):
+        stream = gzip_stream(stream)
+        filename += '.gz'
+        content_type = 'application/gzip'
+
+    response = ExportResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
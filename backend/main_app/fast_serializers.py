@@ -0,0 +1,263 @@
+"""
+Read-only fast path for the list endpoints.
+
+A ModelSerializer spends most of a large list response calling get_attribute()
+and to_representation() on every field of every model instance. FastReader
+compiles a ModelSerializer class once into the list of columns it reads and one
+converter per field, then builds the output dicts straight from values_list()
+tuples: no model instances, no field objects per row. The converters reproduce
+what the DRF fields return, so the JSON is byte for byte what the serializer
+produces (main_app.tests.FastReaderTests checks this for every list endpoint).
+
+Serializers whose fields cannot be compiled (dotted sources, method fields,
+nested serializers, ...) get no reader and keep using the ModelSerializer.
+"""
+import datetime
+import functools
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .images import ThumbnailsField
+
+
+class FastReader:
+    def __init__(self, model, names, columns, converters, utc_converters, nullable, expanded, json_safe):
+        self.model = model
+        self.names = names
+        self.columns = columns
+        self.build_rows = compile_rows(names, converters, nullable, expanded)
+        # the same, with a shortcut for datetimes while the current time zone is UTC
+        self.build_utc_rows = compile_rows(names, utc_converters, nullable, expanded)
+        # False when a field can produce floats or other values orjson would
+        # render differently from json.dumps (see main_app.renderers)
+        self.json_safe = json_safe
+
+    def values_list(self, queryset, *extra):
+        """
+        The columns every row needs, in field order, followed by `extra`.
+        """
+        return queryset.values_list(*self.columns, *extra)
+
+    def to_representation(self, rows):
+        if is_utc(timezone.get_current_timezone()):
+            return self.build_utc_rows(rows)
+        return self.build_rows(rows)
+
+
+def compile_rows(names, converters, nullable, expanded):
+    """
+    Generates the function that turns values_list() tuples into output dicts,
+    with every field's conversion written out inline, e.g. for two fields:
+
+        def build_rows(rows, c0=<int>, c1=<isoformat>):
+            return [{'id': c0(v0), 'dob': None if v1 is None else c1(v1)} for v0, v1, *_ in rows]
+
+    Unchanged values skip the call, and NOT NULL columns the None check. An
+    expanded foreign key becomes {'id': ..., 'name': ...}, its name read from the
+    column index in `expanded`. Rows may carry extra trailing columns (the
+    pagination keyset), which are ignored.
+    """
+    items = []
+    for i, (name, convert, null, name_column) in enumerate(zip(names, converters, nullable, expanded)):
+        if name_column is not None:
+            expression = f"{{'id': v{i}, 'name': v{name_column}}}"
+        elif convert is None:
+            expression = f'v{i}'
+        else:
+            expression = f'c{i}(v{i})'
+        if null and (convert is not None or name_column is not None):
+            expression = f'None if v{i} is None else {expression}'
+        items.append(f'{name!r}: {expression}')
+
+    column_count = len(names) + sum(name_column is not None for name_column in expanded)
+    arguments = ''.join(f', c{i}=c{i}' for i in range(len(names)))
+    variables = ''.join(f'v{i}, ' for i in range(column_count))
+    source = (
+        f'def build_rows(rows{arguments}):\n'
+        f'    return [{{{", ".join(items)}}} for {variables}*_ in rows]\n'
+    )
+    namespace = {f'c{i}': convert for i, convert in enumerate(converters)}
+    exec(source, namespace)
+    return namespace['build_rows']
+
+
+class UnsupportedField(Exception):
+    pass
+
+
+def get_fields(serializer_class):
+    """
+    The fields a serializer outputs, by name.
+    """
+    return {name: field for name, field in serializer_class().fields.items() if not field.write_only}
+
+
+def get_expandable_fields(serializer_class):
+    """
+    The foreign keys ?expand= can inline, by field name: those whose related
+    model has a `name` (doctors, patients, departments, wards).
+    """
+    model = serializer_class.Meta.model
+    expandable = {}
+    for name, field in get_fields(serializer_class).items():
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and field.source and '.' not in field.source:
+            model_field = model._meta.get_field(field.source)
+            related_fields = {f.name for f in model_field.related_model._meta.concrete_fields}
+            if model_field.many_to_one and 'name' in related_fields:
+                expandable[name] = model_field.name
+    return expandable
+
+
+# Readers kept compiled. ?fields= and ?expand= come from the client, so the
+# combinations are unbounded; the least recently used readers are dropped.
+READER_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=READER_CACHE_SIZE)
+def get_reader(serializer_class, fields=None, expand=frozenset()):
+    """
+    The FastReader for a ModelSerializer class, or None when it has a field that
+    cannot be compiled. `fields` limits the output (and the columns selected) to
+    those names, `expand` inlines the named foreign keys as {'id', 'name'}; both
+    must already be validated (see fieldsets.py).
+    """
+    if not issubclass(serializer_class, serializers.ModelSerializer):
+        return None
+
+    model = serializer_class.Meta.model
+    names, columns, converters, utc_converters, nullable, expanded = [], [], [], [], [], []
+    name_columns = []
+    json_safe = True
+    try:
+        for name, field in get_fields(serializer_class).items():
+            if fields is not None and name not in fields:
+                continue
+            if not field.source or '.' in field.source or field.source == '*':
+                raise UnsupportedField(name)
+            try:
+                model_field = model._meta.get_field(field.source)
+            except Exception:
+                raise UnsupportedField(name)
+            if not model_field.concrete or model_field.many_to_many:
+                raise UnsupportedField(name)
+
+            converter, safe = compile_field(field, model_field)
+            names.append(name)
+            columns.append(model_field.attname)
+            converters.append(converter)
+            utc_converters.append(compile_field(field, model_field, utc=True)[0])
+            nullable.append(model_field.null)
+            if name in expand:
+                # the related name is selected through a JOIN, after the field columns
+                name_columns.append(f'{model_field.name}__name')
+                expanded.append(len(name_columns) - 1)
+            else:
+                expanded.append(None)
+            json_safe = json_safe and safe
+    except UnsupportedField:
+        return None
+
+    expanded = [None if index is None else len(names) + index for index in expanded]
+    return FastReader(model, names, columns + name_columns, converters, utc_converters, nullable, expanded, json_safe)
+
+
+def is_utc(tz):
+    return tz is datetime.timezone.utc or getattr(tz, 'key', None) in ('UTC', 'Etc/UTC')
+
+
+def utc_isoformat(value):
+    """
+    DateTimeField.to_representation() for an aware datetime when the current time
+    zone is UTC, without the time zone lookups of enforce_timezone().
+    """
+    if value.utcoffset():
+        value = value.astimezone(datetime.timezone.utc)
+    return value.isoformat()[:-6] + 'Z'   # drops '+00:00'
+
+
+def compile_field(field, model_field=None, utc=False):
+    """
+    Returns (converter, json_safe) for a serializer field. The converter takes a
+    non-None column value and returns what field.to_representation() would; None
+    means the value is returned unchanged. With `utc`, the converter may assume
+    that the current time zone is UTC.
+    """
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        if field.pk_field is not None:
+            raise UnsupportedField(field.field_name)
+        return None, True
+
+    if isinstance(field, serializers.DateTimeField):
+        if getattr(field, 'format', api_settings.DATETIME_FORMAT) != ISO_8601:
+            return field.to_representation, True
+        if utc and settings.USE_TZ and not hasattr(field, 'timezone'):
+            return utc_isoformat, True
+
+        def convert_datetime(value, enforce_timezone=field.enforce_timezone):
+            value = enforce_timezone(value).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert_datetime, True
+
+    if isinstance(field, serializers.DateField):
+        if getattr(field, 'format', api_settings.DATE_FORMAT) != ISO_8601:
+            return field.to_representation, True
+        return datetime.date.isoformat, True
+
+    if isinstance(field, serializers.TimeField):
+        if getattr(field, 'format', api_settings.TIME_FORMAT) != ISO_8601:
+            return field.to_representation, True
+        return datetime.time.isoformat, True
+
+    if isinstance(field, serializers.DecimalField):
+        # quantizing is the expensive part either way; a string unless
+        # COERCE_DECIMAL_TO_STRING is off
+        return field.to_representation, getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+
+    if isinstance(field, serializers.ListField):
+        convert_item, safe = compile_field(field.child, getattr(model_field, 'base_field', None), utc=utc)
+        if convert_item is None:
+            return None, safe
+        return (lambda value: [item if item is None else convert_item(item) for item in value]), safe
+
+    if isinstance(field, ThumbnailsField):
+        if field.context:
+            raise UnsupportedField(field.field_name)
+        return field.to_representation, True   # takes the stored name as well as a FieldFile
+
+    if isinstance(field, serializers.FileField):
+        if field.context or not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            raise UnsupportedField(field.field_name)
+        # value is the stored name; the model's FieldFile would build the same URL
+        storage = model_field.storage
+        return (lambda name: storage.url(name) if name else None), True
+
+    if isinstance(field, serializers.ChoiceField):
+        if isinstance(model_field, (models.CharField, models.TextField)):
+            return None, True   # maps every str choice to itself
+        choices = field.choice_strings_to_values
+        return (lambda value: choices.get(str(value), value) if value != '' else value), True
+
+    if isinstance(field, serializers.CharField):   # also EmailField, URLField, ...
+        if isinstance(model_field, (models.CharField, models.TextField)):
+            return None, True   # already a str
+        return str, True
+
+    if isinstance(field, serializers.BooleanField):
+        return bool, True
+
+    if isinstance(field, serializers.IntegerField):
+        return int, True
+
+    if isinstance(field, serializers.FloatField):
+        return float, False
+
+    if isinstance(field, (serializers.JSONField, serializers.ReadOnlyField)):
+        if getattr(field, 'binary', False):
+            return field.to_representation, True
+        return None, False
+
+    raise UnsupportedField(field.field_name)
@@ -0,0 +1,158 @@
+"""
+Thumbnails of the doctor and patient profile photos.
+
+An uploaded photo is kept as it is. Once the save commits, a background thread
+decodes it once with Pillow and writes every size in THUMBNAIL_SIZES as WebP
+and as JPEG (for clients without WebP), next to each other under
+thumbnails/<photo name without extension>/, e.g.
+
+    images/ravi.jpg -> thumbnails/images/ravi/small.webp, thumbnails/images/ravi/small.jpg, ...
+
+The names follow from the photo's name alone, so the serializers list the URLs
+(`profile_photo_thumbnails`) without a query or a lookup, and an uploaded photo
+always gets a new name (storage never overwrites), so a thumbnail URL never
+changes content. Until the thread is done the URLs are 404s; rosters should
+fall back to a placeholder, not to the full photo. Photos saved before this
+existed get theirs from `python manage.py make_thumbnails`.
+
+The files are served by edp.media ahead of Django, not by a view.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import serializers
+
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels; a photo is never scaled up
+THUMBNAIL_SIZES = {
+    'small': 64,
+    'medium': 256,
+    'large': 768,
+}
+
+# Output format -> (file extension, Pillow format, save options)
+FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+THUMBNAIL_DIR = 'thumbnails'
+
+
+def thumbnail_name(name, size, output):
+    stem = os.path.splitext(name)[0]
+    return f'{THUMBNAIL_DIR}/{stem}/{size}.{FORMATS[output][0]}'
+
+
+def thumbnail_names(name):
+    return [thumbnail_name(name, size, output) for size in THUMBNAIL_SIZES for output in FORMATS]
+
+
+class ThumbnailsField(serializers.Field):
+    """
+    The thumbnail URLs of an image field, {size: {'webp': url, 'jpeg': url}}, or
+    None without an image. Absolute when the request is in the context, as the
+    URL of the image itself is.
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        name = getattr(value, 'name', value)   # a FieldFile, or the column value (see fast_serializers.py)
+        if not name:
+            return None
+        request = self.context.get('request')
+        urls = {}
+        for size in THUMBNAIL_SIZES:
+            urls[size] = {}
+            for output in FORMATS:
+                url = default_storage.url(thumbnail_name(name, size, output))
+                urls[size][output] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
+
+def encode(image, output):
+    _, image_format, options = FORMATS[output]
+    if image_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def make_thumbnails(name, storage=None):
+    """
+    Writes (or rewrites) the thumbnails of the photo `name`. Returns their
+    names, none when the file is not an image Pillow can read.
+    """
+    storage = storage or default_storage
+    largest = max(THUMBNAIL_SIZES.values())
+    try:
+        with storage.open(name, 'rb') as file, Image.open(file) as image:
+            image.draft('RGB', (largest, largest))   # JPEG: decode at the smallest scale that is still large enough
+            image = ImageOps.exif_transpose(image)   # phone photos are stored sideways with an EXIF rotation
+            has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        logger.warning('Cannot make thumbnails of %s: %s', name, exc)
+        return []
+
+    names = []
+    # largest first, each size scaled down from the previous one
+    for size, pixels in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((pixels, pixels), Image.Resampling.LANCZOS)
+        for output in FORMATS:
+            thumbnail = thumbnail_name(name, size, output)
+            if storage.exists(thumbnail):
+                storage.delete(thumbnail)
+            names.append(storage.save(thumbnail, ContentFile(encode(image, output))))
+    return names
+
+
+def has_thumbnails(name, storage=None):
+    storage = storage or default_storage
+    return all(storage.exists(thumbnail) for thumbnail in thumbnail_names(name))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    The threads thumbnails are made on, PHOTO_THUMBNAIL_WORKERS of them. They
+    only touch files, never the database.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PHOTO_THUMBNAIL_WORKERS', 1), thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def make_missing_thumbnails(name):
+    if not has_thumbnails(name):
+        make_thumbnails(name)
+
+
+def schedule_thumbnails(name):
+    """
+    Makes the thumbnails of the photo `name` in the background, once the
+    current transaction commits, unless it has them already.
+    """
+    transaction.on_commit(lambda: get_executor().submit(make_missing_thumbnails, name))
@@ -0,0 +1,298 @@
+"""
+Bulk CSV import of the medical test catalog and patient master data.
+
+    python manage.py import_csv medical-tests tests.csv
+    POST /api/imports/medical-tests/ (multipart `file`), then GET /api/imports/<id>/
+
+The first line names the columns, with the serializer's field names (the same
+header /api/exports/ writes). Empty cells are left out, so the model default
+applies; list and JSON columns hold JSON, e.g. ["Dust","Pollen"].
+
+The file is read as a stream, IMPORT_CHUNK_SIZE rows at a time. Each chunk is
+validated row by row with the serializer, COPYed into a temporary staging
+table, and upserted into the real table on the import's key (IMPORTS): rows
+whose key exists are updated (only the columns in the file), the rest are
+inserted. Every chunk commits on its own and updates the ImportJob, so
+progress and the row errors can be read while the import runs. Invalid rows
+are reported and skipped, they do not stop the import. An uploaded file is
+deleted once its import has completed or failed.
+"""
+import csv
+import io
+import itertools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections, models, transaction
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.validators import UniqueValidator
+
+from . import audit
+from .cache import invalidate_catalog
+from .models import ImportJob
+from .serializers import MedicalTestSerializer, PatientSerializer
+
+
+class Importer:
+    def __init__(self, serializer_class, key, catalog=None):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.key = key   # the column rows are matched on
+        self.catalog = catalog   # cached catalog to invalidate (see cache.py)
+
+
+IMPORTS = {
+    'medical-tests': Importer(MedicalTestSerializer, key='test_code', catalog='medical_tests'),
+    'patients': Importer(PatientSerializer, key='aadhar'),
+}
+
+
+class ImportFailed(Exception):
+    """
+    The file cannot be imported at all (unreadable, wrong columns).
+    """
+
+
+def get_chunk_size():
+    return getattr(settings, 'IMPORT_CHUNK_SIZE', 1000)
+
+
+def get_row_serializer(importer):
+    """
+    One serializer that validates every row. Uniqueness is what the upsert
+    resolves, so the unique validators are dropped.
+    """
+    serializer = importer.serializer_class()
+    for field in serializer.fields.values():
+        field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+    serializer.validators = []
+    return serializer
+
+
+def check_header(header, row_serializer):
+    writable = {name for name, field in row_serializer.fields.items() if not field.read_only}
+    required = {name for name, field in row_serializer.fields.items() if field.required}
+    problems = []
+    unknown = set(header) - writable
+    if unknown:
+        problems.append(f"Unknown column(s): {', '.join(sorted(unknown))}")
+    missing = required - set(header)
+    if missing:
+        problems.append(f"Missing column(s): {', '.join(sorted(missing))}")
+    if len(set(header)) != len(header):
+        problems.append('Repeated column(s)')
+    if problems:
+        raise ImportFailed('. '.join(problems))
+
+
+def parse_row(row, row_serializer):
+    """
+    The cells of a CSV row as serializer input: empty cells are left out, JSON
+    is decoded for list and JSON fields.
+    """
+    data = {}
+    for name, value in row.items():
+        if value == '':
+            continue
+        field = row_serializer.fields[name]
+        if isinstance(field, (serializers.ListField, serializers.JSONField)):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise ValidationError({name: ['Enter valid JSON.']})
+        data[name] = value
+    return data
+
+
+def copy_value(value):
+    """
+    A value as COPY ... (FORMAT csv) expects it: None unquoted, anything else quoted.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, (list, tuple)):
+        value = array_literal(value)
+    elif isinstance(value, dict):
+        value = json.dumps(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def array_literal(items):
+    elements = []
+    for item in items:
+        if item is None:
+            elements.append('NULL')
+        else:
+            elements.append('"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(elements) + '}'
+
+
+def get_columns(model):
+    """
+    The model fields that are inserted: every concrete field but an auto primary key.
+    """
+    return [
+        field for field in model._meta.concrete_fields
+        if not (field.primary_key and isinstance(field, models.AutoField))
+    ]
+
+
+def get_copy_row(importer, columns, data):
+    instance = importer.model(**data)   # applies the model defaults
+    values = []
+    for field in columns:
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            field.pre_save(instance, add=True)
+        value = field.get_prep_value(getattr(instance, field.attname))
+        if isinstance(field, models.JSONField):
+            value = json.dumps(value, cls=field.encoder)
+        values.append(copy_value(value))
+    return ','.join(values) + '\n'
+
+
+def upsert_chunk(importer, columns, updated_columns, rows):
+    """
+    COPYs `rows` (validated data, unique on the key) into a staging table and
+    upserts them. Returns (created, updated).
+    """
+    quote = connection.ops.quote_name
+    table = quote(importer.model._meta.db_table)
+    key = quote(importer.model._meta.get_field(importer.key).column)
+    names = ', '.join(quote(field.column) for field in columns)
+    staged = ', '.join(f's.{quote(field.column)}' for field in columns)
+    assignments = ', '.join(f'{quote(field.column)} = s.{quote(field.column)}' for field in updated_columns)
+
+    buffer = io.StringIO(''.join(get_copy_row(importer, columns, data) for data in rows))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMPORARY TABLE import_staging ON COMMIT DROP AS SELECT {names} FROM {table} WITH NO DATA')
+        cursor.copy_expert(f'COPY import_staging ({names}) FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(f'UPDATE {table} t SET {assignments} FROM import_staging s WHERE t.{key} = s.{key}')
+        updated = cursor.rowcount
+        cursor.execute(
+            f'INSERT INTO {table} ({names}) SELECT {staged} FROM import_staging s '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{key} = s.{key})'
+        )
+        created = cursor.rowcount
+        # ON COMMIT DROP only fires at the outermost commit
+        cursor.execute('DROP TABLE import_staging')
+        if importer.model._meta.label in audit.AUDITED_MODELS:
+            audit.log_bulk('import', importer.model, {
+                importer.key: [data[importer.key] for data in rows], 'created': created, 'updated': updated,
+            })
+    return created, updated
+
+
+def run_import(job, stream, chunk_size=None, on_chunk=None):
+    """
+    Imports the CSV in the binary `stream` for `job`, saving its progress after
+    every chunk of `chunk_size` rows (default IMPORT_CHUNK_SIZE); `on_chunk(job)`
+    is called after each save. Returns the job.
+    """
+    importer = IMPORTS[job.kind]
+    max_errors = getattr(settings, 'IMPORT_MAX_ERRORS', 100)
+    job.status = 'running'
+    job.save(update_fields=['status', 'updated_at'])
+
+    def save_progress(*extra):
+        job.save(update_fields=[
+            'processed_rows', 'created_rows', 'updated_rows', 'failed_rows', 'errors', 'updated_at', *extra,
+        ])
+
+    try:
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''), strict=True)
+        row_serializer = get_row_serializer(importer)
+        check_header(reader.fieldnames or [], row_serializer)
+        columns = get_columns(importer.model)
+        provided = {row_serializer.fields[name].source for name in reader.fieldnames}
+        updated_columns = [
+            field for field in columns
+            if (field.name in provided and field.name != importer.key) or getattr(field, 'auto_now', False)
+        ]
+
+        numbered_rows = ((reader.line_num, row) for row in reader)
+        chunk_size = chunk_size or get_chunk_size()
+        while rows := list(itertools.islice(numbered_rows, chunk_size)):
+            chunk = {}
+            for line, row in rows:
+                if None in row or None in row.values():
+                    errors = {'non_field_errors': ['Wrong number of cells.']}
+                else:
+                    try:
+                        data = row_serializer.run_validation(parse_row(row, row_serializer))
+                    except ValidationError as exc:
+                        errors = exc.detail
+                    else:
+                        chunk[data[importer.key]] = data   # the last row with a key wins
+                        continue
+                job.failed_rows += 1
+                if len(job.errors) < max_errors:
+                    job.errors.append({'line': line, 'errors': errors})
+
+            if chunk:
+                created, updated = upsert_chunk(importer, columns, updated_columns, list(chunk.values()))
+                job.created_rows += created
+                job.updated_rows += updated
+                if importer.catalog:
+                    invalidate_catalog(importer.catalog)
+            job.processed_rows += len(rows)
+            save_progress()
+            if on_chunk is not None:
+                on_chunk(job)
+    except (ImportFailed, UnicodeDecodeError, csv.Error) as exc:
+        job.status, job.error = 'failed', str(exc)
+    except Exception as exc:
+        job.status, job.error = 'failed', f'{type(exc).__name__}: {exc}'
+        raise
+    else:
+        job.status = 'completed'
+    finally:
+        job.finished_at = timezone.now()
+        save_progress('status', 'error', 'finished_at')
+    return job
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    The threads uploaded files are imported on, IMPORT_WORKERS of them.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMPORT_WORKERS', 1), thread_name_prefix='csv-import',
+            )
+        return _executor
+
+
+def import_uploaded_file(job_id):
+    """
+    Imports the file of the job `job_id`, then deletes it: patient master data
+    is not kept at rest once read. The counts and errors stay on the job.
+    """
+    try:
+        job = ImportJob.objects.get(pk=job_id)
+        try:
+            with job.file.open('rb') as stream:
+                run_import(job, stream)
+        finally:
+            job.file.delete(save=False)
+            ImportJob.objects.filter(pk=job.pk).update(file='')
+    finally:
+        connections.close_all()
+
+
+def start_import(job):
+    """
+    Imports an uploaded job's file in the background, once the job is committed.
+    """
+    transaction.on_commit(lambda: get_executor().submit(import_uploaded_file, job.pk))
@@ -0,0 +1,153 @@
+"""
+The lab work queue: benches claim batches of pending tests to run.
+
+    POST /api/lab/queue/claim/?limit=10&wait=20&category=Blood
+    POST /api/lab/queue/<id>/release/
+
+Pending tests are handed out in the order they are due (test_date, test_time),
+quicker tests (MedicalTest.turnaround_time) first among those due together.
+The claim reads the partial index on pending tests (testprescribed_pending_idx)
+in that order and locks the rows FOR UPDATE SKIP LOCKED, so benches claiming
+at the same time each get different tests instead of queueing behind each
+other's locks. A claimed test stays pending, with claimed_by / claimed_at set,
+until its result is saved; a claim older than LAB_CLAIM_TIMEOUT seconds is
+given up (the bench went away) and the test can be claimed again.
+
+With ?wait= and nothing to claim, the request waits up to that many seconds
+(at most LAB_QUEUE_MAX_WAIT) for a test to come in rather than the bench
+polling: it LISTENs on the lab_queue channel, which a trigger on
+main_app_testprescribed NOTIFYs when a test becomes claimable (migration
+0017), and only queries again when woken. A waiting request holds its worker
+thread and database connection.
+"""
+import datetime
+import select
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import audit
+from .models import TestPrescribed
+
+
+CHANNEL = 'lab_queue'
+
+QUEUE_ORDER = ['test_date', 'test_time', 'test_code__turnaround_time', 'id']
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def get_claim_timeout():
+    return getattr(settings, 'LAB_CLAIM_TIMEOUT', 30 * 60)
+
+
+def get_max_wait():
+    return getattr(settings, 'LAB_QUEUE_MAX_WAIT', 30)
+
+
+def claimable(category=None):
+    """
+    The pending tests that are not claimed, or whose claim has timed out.
+    """
+    expired = timezone.now() - datetime.timedelta(seconds=get_claim_timeout())
+    queryset = TestPrescribed.objects.filter(status='pending').filter(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=expired)
+    )
+    if category:
+        queryset = queryset.filter(test_code__test_category=category)
+    return queryset
+
+
+def claim(user, limit=DEFAULT_LIMIT, category=None):
+    """
+    Claims up to `limit` tests for `user`, skipping the ones another bench is
+    claiming right now. Returns them in queue order, possibly none.
+    """
+    with transaction.atomic():
+        rows = list(
+            claimable(category).order_by(*QUEUE_ORDER)
+            .select_for_update(skip_locked=True, of=('self',))   # not the MedicalTest rows
+            .values_list('id', 'claimed_by_id', 'claimed_at')[:limit]
+        )
+        if not rows:
+            return []
+        ids = [id for id, _, _ in rows]
+        claimed_at = timezone.now()
+        TestPrescribed.objects.filter(id__in=ids).update(claimed_by=user, claimed_at=claimed_at)
+        audit.log_updated(TestPrescribed, {
+            id: {'claimed_by_id': [old_user_id, user.pk], 'claimed_at': [old_claimed_at, claimed_at]}
+            for id, old_user_id, old_claimed_at in rows   # an expired claim is taken over
+        })
+    tests = TestPrescribed.objects.in_bulk(ids)
+    return [tests[id] for id in ids]
+
+
+def release(test, user):
+    """
+    Gives `user`'s claim on the pending `test` back to the queue. Returns
+    whether there was one.
+    """
+    released = TestPrescribed.objects.filter(pk=test.pk, status='pending', claimed_by=user).update(
+        claimed_by=None, claimed_at=None,
+    )
+    if released:   # logged once the update commits, right away outside a transaction
+        audit.log_updated(TestPrescribed, {test.pk: {'claimed_by_id': [user.pk, None], 'claimed_at': [test.claimed_at, None]}})
+    return bool(released)
+
+
+@contextmanager
+def listen(channel):
+    """
+    LISTENs on `channel` for the duration, yielding the raw connection the
+    notifications arrive on. Outside a transaction only, as LISTEN takes effect
+    at commit.
+    """
+    connection.ensure_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {channel}')
+    try:
+        yield connection.connection
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'UNLISTEN {channel}')
+        connection.connection.notifies.clear()
+
+
+def wait_for_notify(raw_connection, timeout):
+    """
+    Blocks until a notification arrives or `timeout` seconds pass, without
+    querying. Returns whether one arrived.
+    """
+    # the ones that arrived during the claim's queries were already read off the socket
+    if raw_connection.notifies:
+        raw_connection.notifies.clear()
+        return True
+    if not select.select([raw_connection], [], [], timeout)[0]:
+        return False
+    raw_connection.poll()
+    notified = bool(raw_connection.notifies)
+    raw_connection.notifies.clear()
+    return notified
+
+
+def claim_or_wait(user, limit=DEFAULT_LIMIT, category=None, wait=0):
+    """
+    claim(), waiting up to `wait` seconds for tests to come in when there are
+    none to claim yet.
+    """
+    if wait <= 0 or connection.in_atomic_block:
+        return claim(user, limit, category)
+
+    deadline = time.monotonic() + wait
+    with listen(CHANNEL) as raw_connection:   # before claiming, so a test added in between still wakes us
+        while True:
+            tests = claim(user, limit, category)
+            remaining = deadline - time.monotonic()
+            if tests or remaining <= 0:
+                return tests
+            wait_for_notify(raw_connection, remaining)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from main_app.partitions import archive_old_partitions, create_upcoming_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the monthly partitions of the coming months and archives the "
+        "diagnoses older than the kept months, with their prescriptions and "
+        "tests, to compressed files, dropping them from the database (see "
+        "main_app/partitions.py). Schedule it, e.g. daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, help='months to create partitions for (default PARTITION_MONTHS_AHEAD)')
+        parser.add_argument('--keep-months', type=int, help='months to keep in the database (default PARTITION_KEEP_MONTHS)')
+        parser.add_argument('--directory', help='where the archives go (default PARTITION_ARCHIVE_DIR)')
+
+    def handle(self, *args, **options):
+        for name in create_upcoming_partitions(options['months_ahead']):
+            self.stdout.write(f"Created {name}")
+        for name, rows in archive_old_partitions(options['keep_months'], directory=options['directory']):
+            self.stdout.write(f"Archived {name}: {rows} rows")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from main_app.uploads import clear_stale_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Aborts the chunked result uploads that have had no chunk for "
+        "RESULT_UPLOAD_EXPIRY seconds and removes their partial files (see "
+        "main_app/uploads.py). Schedule it, e.g. daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expiry', type=int, help='seconds without a chunk (default RESULT_UPLOAD_EXPIRY)')
+
+    def handle(self, *args, **options):
+        cleared = clear_stale_uploads(options['expiry'])
+        self.stdout.write(f"Cleared {cleared} stale uploads")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from main_app.storage import collect_blobs, recount_references
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the stored photos and result files no row references any more "
+        "(see main_app/storage.py). Schedule it, e.g. daily from cron; --recount "
+        "first recounts the references, after bulk imports or updates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help='recount the references from the tables first')
+        parser.add_argument('--grace', type=int, help='seconds a blob must be unused (default BLOB_GC_GRACE)')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write(f"Recounted references, {recount_references()} counts were off")
+        deleted, freed = collect_blobs(options['grace'])
+        self.stdout.write(f"Deleted {deleted} unreferenced blobs, {freed} bytes freed")
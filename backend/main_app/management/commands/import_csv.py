@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app import imports
+from main_app.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a CSV of medical tests or patients, upserting on test_code / aadhar "
+        "(see main_app/imports.py). Progress is printed per chunk and kept on an "
+        "ImportJob, readable at /api/imports/<id>/ while the import runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(imports.IMPORTS))
+        parser.add_argument('path', help='CSV file with a header line of field names')
+        parser.add_argument('--chunk-size', type=int, help='rows per chunk (default IMPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        try:
+            stream = open(options['path'], 'rb')
+        except OSError as exc:
+            raise CommandError(exc)
+
+        job = ImportJob.objects.create(kind=options['kind'], source=options['path'])
+        self.stderr.write(f"Import {job.id}: {options['kind']} from {options['path']}")
+
+        def report(job):
+            self.stderr.write(
+                f"{job.processed_rows} rows: {job.created_rows} created, "
+                f"{job.updated_rows} updated, {job.failed_rows} failed"
+            )
+
+        with stream:
+            imports.run_import(job, stream, chunk_size=options['chunk_size'], on_chunk=report)
+
+        for error in job.errors:
+            self.stdout.write(f"line {error['line']}: {error['errors']}")
+        if job.failed_rows > len(job.errors):
+            self.stdout.write(f"... and {job.failed_rows - len(job.errors)} more invalid rows")
+        if job.status == 'failed':
+            raise CommandError(job.error)
+        self.stdout.write(
+            f"Imported {job.processed_rows} rows: {job.created_rows} created, "
+            f"{job.updated_rows} updated, {job.failed_rows} failed"
+        )
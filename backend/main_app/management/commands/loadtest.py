@@ -0,0 +1,142 @@
+import asyncio
+import collections
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammers one endpoint with N concurrent keep-alive clients and reports throughput "
+        "and latency percentiles. Pass --target once per server to compare them, e.g. "
+        "--target wsgi=http://localhost:8000 (gunicorn edp.wsgi) and "
+        "--target asgi=http://localhost:8001 (daphne edp.asgi:application)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='label=base URL of a running server; repeat to compare servers')
+        parser.add_argument('--path', default='/api/diagnoses/doctor/1/',
+                            help='path (and query string) every client requests')
+        parser.add_argument('--token', default='', help='JWT access token sent as a Bearer token')
+        parser.add_argument('--concurrency', type=int, default=500)
+        parser.add_argument('--duration', type=float, default=30, help='seconds per target')
+        parser.add_argument('--timeout', type=float, default=30, help='seconds before a request counts as failed')
+        parser.add_argument('--json', action='store_true', help='print the results as JSON')
+
+    def handle(self, *args, **options):
+        results = []
+        for target in options['target']:
+            label, sep, base_url = target.partition('=')
+            if not sep:
+                label, base_url = target, target
+            url = urlsplit(base_url)
+            if url.scheme != 'http' or not url.hostname:
+                raise CommandError(f'{target}: expected label=http://host:port')
+
+            self.stderr.write(f"{label}: {options['concurrency']} clients for {options['duration']}s ...")
+            result = asyncio.run(run_load(
+                url.hostname, url.port or 80, url.path.rstrip('/') + options['path'], options['token'],
+                options['concurrency'], options['duration'], options['timeout'],
+            ))
+            results.append({'target': label, 'url': base_url, **result})
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'target':<10}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for r in results:
+            p50, p95, p99 = (r[key] if r[key] is not None else '-' for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+            self.stdout.write(
+                f"{r['target']:<10}{r['requests']:>10}{r['errors']:>8}{r['requests_per_second']:>10}"
+                f"{p50:>10}{p95:>10}{p99:>10}"
+            )
+            if r['error_kinds']:
+                self.stdout.write(f"{'':<10}errors: {r['error_kinds']}")
+
+
+async def run_load(host, port, path, token, concurrency, duration, timeout):
+    """
+    Every client keeps one HTTP/1.1 connection open and sends requests back to
+    back until the duration is up, so `concurrency` is the number of requests the
+    server has in flight at any moment.
+    """
+    request = (
+        f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\n'
+        + (f'Authorization: Bearer {token}\r\n' if token else '')
+        + '\r\n'
+    ).encode()
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        reader = writer = None
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+                writer.write(request)
+                status_code, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                errors.append(type(e).__name__)
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                continue
+
+            if status_code == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors.append(status_code)
+            if not keep_alive:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_kinds': dict(collections.Counter(str(error) for error in errors)),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99), 2) if latencies else None,
+    }
+
+
+async def read_response(reader):
+    """
+    Reads one response off a keep-alive connection and returns its status code and
+    whether the connection can be reused. Handles Content-Length and chunked bodies.
+    """
+    status_line = await reader.readuntil(b'\r\n')
+    status_code = int(status_line.split()[1])
+    headers = {}
+    while (line := await reader.readuntil(b'\r\n')) != b'\r\n':
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        while (size := int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)):
+            await reader.readexactly(size + 2)
+        await reader.readuntil(b'\r\n')
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status_code, False
+
+    return status_code, headers.get('connection') != 'close'
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from main_app import images
+from main_app.models import Doctor, Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Makes the thumbnails of every doctor and patient profile photo that has "
+        "none yet, e.g. photos uploaded before thumbnails existed (see "
+        "main_app/images.py). --force remakes them all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='remake existing thumbnails too')
+
+    def handle(self, *args, **options):
+        made = failed = 0
+        for model in (Doctor, Patient):
+            names = model.objects.exclude(profile_photo='').exclude(profile_photo__isnull=True) \
+                .values_list('profile_photo', flat=True).iterator()
+            for name in names:
+                if not options['force'] and images.has_thumbnails(name):
+                    continue
+                if images.make_thumbnails(name):
+                    made += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f"{name}: not a readable image")
+        self.stdout.write(f"Made thumbnails of {made} photos, {failed} failed")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from main_app.beds import recount_free_beds
+from main_app.models import Ward, WardOccupancy
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the free and total bed counters of every ward from the Bed "
+        "table (see main_app/beds.py), e.g. after beds were written with raw SQL "
+        "or bulk updates, which bypass them."
+    )
+
+    def handle(self, *args, **options):
+        before = self.counters()
+        ward_ids = list(Ward.objects.values_list('id', flat=True))
+        recount_free_beds(ward_ids)
+        after = self.counters()
+        fixed = [ward_id for ward_id in ward_ids if before.get(ward_id) != after.get(ward_id)]
+        self.stdout.write(f"{len(ward_ids)} wards recounted, {len(fixed)} corrected")
+
+    @staticmethod
+    def counters():
+        return {ward_id: counts for ward_id, *counts in WardOccupancy.objects.values_list('ward_id', 'total_beds', 'free_beds')}
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from main_app.stats import refresh_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Refreshes the dashboard materialized views behind /api/stats/ "
+        "(see main_app/stats.py). Safe to run while the API serves them; "
+        "schedule it, e.g. every 5 minutes from cron."
+    )
+
+    def handle(self, *args, **options):
+        for refresh in refresh_stats():
+            self.stdout.write(f"{refresh.view}: {refresh.duration_ms} ms")
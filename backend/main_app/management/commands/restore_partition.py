@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.partitions import restore_partition
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads an archived month, named by its diagnosis partition, e.g. "
+        "main_app_diagnosis_p202301, back into tables of the names it was archived "
+        "as to query it (see main_app/partitions.py). --attach puts its diagnoses, "
+        "prescriptions and tests back in their tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('partition')
+        parser.add_argument('--attach', action='store_true', help='serve its rows from the API again')
+        parser.add_argument('--directory', help='where the archives are (default PARTITION_ARCHIVE_DIR)')
+
+    def handle(self, *args, **options):
+        try:
+            rows = restore_partition(options['partition'], options['attach'], options['directory'])
+        except FileNotFoundError as exc:
+            raise CommandError(f"No archive of {options['partition']}: {exc.filename}")
+        self.stdout.write(f"Restored {options['partition']}: {rows} rows")
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0010_alter_prescriptiondetails_dosage_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bed',
+            index=models.Index(condition=models.Q(('is_occupied', False)), fields=['room'], name='bed_free_room_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['patient_id', 'created_at', 'id'], name='diagnosis_patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['visiting_doctor_id', 'created_at', 'id'], name='diagnosis_doctor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['patient_id', 'diagnosis_date'], name='diagnosis_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['aadhar'], name='patient_aadhar_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['created_at', 'id'], name='patient_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['diagnosis_id', 'patient_id'], name='prescription_diag_patient_idx'),
+        ),
+    ]
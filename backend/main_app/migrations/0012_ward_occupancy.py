@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_existing_beds(apps, schema_editor):
+    Ward = apps.get_model('main_app', 'Ward')
+    WardOccupancy = apps.get_model('main_app', 'WardOccupancy')
+    wards = Ward.objects.annotate(
+        total=Count('room__bed'), free=Count('room__bed', filter=Q(room__bed__is_occupied=False)),
+    )
+    WardOccupancy.objects.bulk_create([
+        WardOccupancy(ward=ward, total_beds=ward.total, free_beds=ward.free) for ward in wards
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0011_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WardOccupancy',
+            fields=[
+                ('ward', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='occupancy', serialize=False, to='main_app.ward')),
+                ('total_beds', models.IntegerField(default=0)),
+                ('free_beds', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing_beds, migrations.RunPython.noop),
+    ]
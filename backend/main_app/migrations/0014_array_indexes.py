@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:58
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['tests'], name='diagnosis_tests_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['specializations'], name='doctor_specializations_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['qualifications'], name='doctor_qualifications_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['allergies'], name='patient_allergies_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['disabilities_or_diseases'], name='patient_diseases_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+
+# The dashboard aggregates of main_app.stats. Each has a unique index, which
+# REFRESH MATERIALIZED VIEW CONCURRENTLY requires.
+CREATE_VIEWS = [
+    """
+    CREATE MATERIALIZED VIEW main_app_stats_doctor_daily AS
+    SELECT diagnosis.visiting_doctor_id_id AS doctor_id, doctor.name AS doctor_name,
+           diagnosis.diagnosis_date AS day, count(*) AS diagnoses
+    FROM main_app_diagnosis diagnosis
+    JOIN main_app_doctor doctor ON doctor.id = diagnosis.visiting_doctor_id_id
+    GROUP BY diagnosis.visiting_doctor_id_id, doctor.name, diagnosis.diagnosis_date
+    """,
+    'CREATE UNIQUE INDEX stats_doctor_daily_day_idx ON main_app_stats_doctor_daily (day, doctor_id)',
+    """
+    CREATE MATERIALIZED VIEW main_app_stats_department_patients AS
+    SELECT department.id AS department_id, department.name,
+           count(DISTINCT doctor.id) AS doctors, count(DISTINCT diagnosis.patient_id_id) AS patients
+    FROM main_app_department department
+    LEFT JOIN main_app_doctor doctor ON doctor.department_id_id = department.id
+    LEFT JOIN main_app_diagnosis diagnosis ON diagnosis.visiting_doctor_id_id = doctor.id
+    GROUP BY department.id, department.name
+    """,
+    'CREATE UNIQUE INDEX stats_department_patients_idx ON main_app_stats_department_patients (department_id)',
+    """
+    CREATE MATERIALIZED VIEW main_app_stats_pending_tests AS
+    SELECT medical_test.test_category, count(*) AS pending
+    FROM main_app_testprescribed test
+    JOIN main_app_medicaltest medical_test ON medical_test.test_code = test.test_code_id
+    WHERE test.status = 'pending'
+    GROUP BY medical_test.test_category
+    """,
+    'CREATE UNIQUE INDEX stats_pending_tests_idx ON main_app_stats_pending_tests (test_category)',
+]
+
+DROP_VIEWS = [
+    'DROP MATERIALIZED VIEW main_app_stats_pending_tests',
+    'DROP MATERIALIZED VIEW main_app_stats_department_patients',
+    'DROP MATERIALIZED VIEW main_app_stats_doctor_daily',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0015_import_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsRefresh',
+            fields=[
+                ('view', models.CharField(max_length=63, primary_key=True, serialize=False)),
+                ('refreshed_at', models.DateTimeField()),
+                ('duration_ms', models.IntegerField()),
+            ],
+        ),
+        migrations.RunSQL(CREATE_VIEWS, DROP_VIEWS),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Lab benches long-polling /api/lab/queue/claim/ LISTEN on lab_queue (see
+# main_app.lab_queue). A test that becomes claimable, inserted as pending, set
+# back to pending or released, NOTIFYs them; Postgres sends the notification
+# at commit, once per transaction however many rows changed.
+CREATE_TRIGGERS = [
+    """
+    CREATE FUNCTION main_app_lab_queue_notify() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('lab_queue', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER testprescribed_lab_queue_insert AFTER INSERT ON main_app_testprescribed
+    FOR EACH ROW WHEN (NEW.status = 'pending')
+    EXECUTE FUNCTION main_app_lab_queue_notify()
+    """,
+    """
+    CREATE TRIGGER testprescribed_lab_queue_update AFTER UPDATE ON main_app_testprescribed
+    FOR EACH ROW WHEN (NEW.status = 'pending' AND (
+        OLD.status <> 'pending' OR (NEW.claimed_by_id IS NULL AND OLD.claimed_by_id IS NOT NULL)
+    ))
+    EXECUTE FUNCTION main_app_lab_queue_notify()
+    """,
+]
+
+DROP_TRIGGERS = [
+    'DROP TRIGGER testprescribed_lab_queue_update ON main_app_testprescribed',
+    'DROP TRIGGER testprescribed_lab_queue_insert ON main_app_testprescribed',
+    'DROP FUNCTION main_app_lab_queue_notify()',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0016_dashboard_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testprescribed',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='testprescribed',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_tests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='testprescribed',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['test_date', 'test_time', 'id'], name='testprescribed_pending_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
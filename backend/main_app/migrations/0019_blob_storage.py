@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:23
+
+import main_app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0018_result_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctor',
+            name='profile_photo',
+            field=models.ImageField(blank=True, null=True, storage=main_app.storage.get_blob_storage, upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='profile_photo',
+            field=models.ImageField(blank=True, null=True, storage=main_app.storage.get_blob_storage, upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='testprescribed',
+            name='test_result_files',
+            field=models.FileField(blank=True, null=True, storage=main_app.storage.get_blob_storage, upload_to='test_results/'),
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('refcount', models.IntegerField(default=0)),
+                ('last_used', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refcount', 0)), fields=['last_used'], name='blob_unreferenced_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:30
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+# The model's table, created by hand: Django cannot declare a partitioned
+# table. The primary key must include the partition key, and the id comes from
+# a sequence (PostgreSQL < 17 has no identity columns on partitioned tables).
+# Rows outside every monthly partition (main_app.audit creates them as it
+# writes) go to the default one. UPDATE and DELETE are rejected; old months
+# are removed by dropping their partitions.
+CREATE_TABLE = [
+    """
+    CREATE TABLE main_app_auditevent (
+        id bigserial NOT NULL,
+        occurred_at timestamp with time zone NOT NULL,
+        actor_id bigint NULL,
+        actor_role varchar(10) NOT NULL,
+        action varchar(10) NOT NULL,
+        model varchar(50) NOT NULL,
+        object_id varchar(64) NULL,
+        changes jsonb NULL,
+        path varchar(255) NOT NULL,
+        PRIMARY KEY (id, occurred_at)
+    ) PARTITION BY RANGE (occurred_at)
+    """,
+    'CREATE TABLE main_app_auditevent_default PARTITION OF main_app_auditevent DEFAULT',
+    'CREATE INDEX auditevent_object_idx ON main_app_auditevent (model, object_id, occurred_at)',
+    'CREATE INDEX auditevent_actor_idx ON main_app_auditevent (actor_id, occurred_at)',
+    """
+    CREATE FUNCTION main_app_auditevent_append_only() RETURNS trigger AS $$
+    BEGIN
+        RAISE EXCEPTION 'main_app_auditevent is append-only';
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER auditevent_append_only BEFORE UPDATE OR DELETE ON main_app_auditevent
+    FOR EACH ROW EXECUTE FUNCTION main_app_auditevent_append_only()
+    """,
+]
+
+DROP_TABLE = [
+    'DROP TABLE main_app_auditevent',
+    'DROP FUNCTION main_app_auditevent_append_only()',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0019_blob_storage'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(CREATE_TABLE, DROP_TABLE)],
+            state_operations=[
+                migrations.CreateModel(
+                    name='AuditEvent',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('occurred_at', models.DateTimeField()),
+                        ('actor_id', models.BigIntegerField(blank=True, null=True)),
+                        ('actor_role', models.CharField(blank=True, max_length=10)),
+                        ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('read', 'Read'), ('list', 'List'), ('import', 'Import')], max_length=10)),
+                        ('model', models.CharField(max_length=50)),
+                        ('object_id', models.CharField(blank=True, max_length=64, null=True)),
+                        ('changes', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                        ('path', models.CharField(blank=True, max_length=255)),
+                    ],
+                    options={
+                        'indexes': [models.Index(fields=['model', 'object_id', 'occurred_at'], name='auditevent_object_idx'), models.Index(fields=['actor_id', 'occurred_at'], name='auditevent_actor_idx')],
+                    },
+                ),
+            ],
+        ),
+    ]
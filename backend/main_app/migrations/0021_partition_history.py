@@ -0,0 +1,145 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:39
+
+import datetime
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# The dashboard views (0016) and the lab queue triggers (0017) are built on the
+# tables rebuilt here, so they are dropped first and made again on the new ones
+stats_views = import_module('main_app.migrations.0016_dashboard_stats')
+lab_queue_triggers = import_module('main_app.migrations.0017_lab_queue')
+
+# Table -> partition key. Each is rebuilt partitioned by month of its key
+# (see main_app.partitions), with the same columns, indexes and foreign keys.
+# The others are not archived by their own months but with their diagnoses'.
+PARTITION_KEYS = {
+    'main_app_diagnosis': 'diagnosis_date',
+    'main_app_prescription': 'created_at',
+    'main_app_prescriptiondetails': 'created_at',
+    'main_app_testprescribed': 'created_at',
+}
+
+# Partitions made for the months after the current one; later ones are made by
+# archive_partitions, and rows past them land in the default partition
+MONTHS_AHEAD = 3
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def rebuild(cursor, table, key=None):
+    """
+    Recreates `table` partitioned by month of `key` (plain without one) and
+    copies its rows over. The primary key of a partitioned table must contain
+    the partition key, so it is (id, key); ids come from a sequence, as
+    PostgreSQL < 17 has no identity columns on partitioned tables.
+    """
+    old = f'{table}_old'
+    cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s', [table, f'{table}_pkey'])
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+
+    # the old table gives up its names to the new one
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {old}')
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX {name}')
+    for name, _ in foreign_keys:
+        cursor.execute(f'ALTER TABLE {old} DROP CONSTRAINT {name}')
+    cursor.execute(f'ALTER TABLE {old} DROP CONSTRAINT {table}_pkey')
+    if key is None:
+        cursor.execute(f'ALTER TABLE {old} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'DROP SEQUENCE {table}_id_seq')
+    else:
+        cursor.execute(f'ALTER TABLE {old} ALTER COLUMN id DROP IDENTITY')
+
+    if key is None:
+        cursor.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(f'ALTER TABLE {table} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id)')
+    else:
+        cursor.execute(
+            f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE ({key})'
+        )
+        cursor.execute(f'CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id')
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+        cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, {key})')
+        cursor.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+        this_month = datetime.date.today().replace(day=1)
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', {key})::date FROM {old}")
+        months = {month for month, in cursor.fetchall()}
+        months.update(add_months(this_month, ahead) for ahead in range(MONTHS_AHEAD + 1))
+        for month in sorted(months):
+            cursor.execute(
+                f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            )
+
+    cursor.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+    cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 0) + 1, false) FROM {table}")
+    # indexes after the rows, which is faster than maintaining them row by row
+    for _, definition in indexes:
+        cursor.execute(definition.replace(' ON ONLY ', ' ON '))
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+    cursor.execute(f'DROP TABLE {old}')
+
+
+def partition_tables(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table, key in PARTITION_KEYS.items():
+            rebuild(cursor, table, key)
+
+
+def unpartition_tables(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITION_KEYS:
+            rebuild(cursor, table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0020_audit_log'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='prescription',
+            name='diagnosis_id',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='main_app.diagnosis'),
+        ),
+        migrations.AlterField(
+            model_name='prescriptiondetails',
+            name='diagnosis_id',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='main_app.diagnosis'),
+        ),
+        migrations.AlterField(
+            model_name='prescriptiondetails',
+            name='prescription_id',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='main_app.prescription'),
+        ),
+        migrations.AlterField(
+            model_name='resultupload',
+            name='test',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='result_uploads', to='main_app.testprescribed'),
+        ),
+        migrations.AlterField(
+            model_name='testprescribed',
+            name='prescription_id',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='main_app.prescription'),
+        ),
+        migrations.RunSQL(stats_views.DROP_VIEWS, stats_views.CREATE_VIEWS),
+        migrations.RunSQL(lab_queue_triggers.DROP_TRIGGERS[:2], lab_queue_triggers.CREATE_TRIGGERS[1:]),
+        migrations.RunPython(partition_tables, unpartition_tables),
+        migrations.RunSQL(lab_queue_triggers.CREATE_TRIGGERS[1:], lab_queue_triggers.DROP_TRIGGERS[:2]),
+        migrations.RunSQL(stats_views.CREATE_VIEWS, stats_views.DROP_VIEWS),
+    ]
@@ -1,6 +1,12 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+
+from .storage import get_blob_storage
 
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -62,6 +68,23 @@ class Bed(models.Model):
     def __str__(self):
         return f"Bed {self.bed_number} in {self.room}"
 
+    class Meta:
+        indexes = [
+            # free beds only; occupied beds are never searched for
+            models.Index(fields=['room'], condition=models.Q(is_occupied=False), name='bed_free_room_idx'),
+        ]
+
+
+class WardOccupancy(models.Model):
+    # Maintained by main_app.beds in the same transaction as every bed change, so
+    # availability is read from one row per ward instead of counting beds
+    ward = models.OneToOneField(Ward, on_delete=models.CASCADE, primary_key=True, related_name='occupancy')
+    total_beds = models.IntegerField(default=0)
+    free_beds = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.free_beds}/{self.total_beds} beds free in {self.ward.name}"
+
 
 class Department(BaseModel):
     name = models.CharField(max_length=100)
@@ -100,12 +123,24 @@ class Doctor(BaseModel):
     qualifications = ArrayField(models.TextField(), default=list)
     specializations = ArrayField(models.TextField(), default=list)
     years_of_experience = models.IntegerField()
-    profile_photo = models.ImageField(upload_to='images/', null=True, blank=True)
+    profile_photo = models.ImageField(upload_to='images/', storage=get_blob_storage, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
 
     def __str__(self) -> str:
         return f"Dr. {self.name}"
 
+    class Meta:
+        indexes = [
+            # /api/doctors/search/ (main_app.search)
+            GinIndex(SearchVector('name', config='simple'), name='doctor_name_search_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='doctor_name_trgm_idx'),
+            GinIndex(fields=['contact_number'], opclasses=['gin_trgm_ops'], name='doctor_contact_trgm_idx'),
+            GinIndex(fields=['aadhar'], opclasses=['gin_trgm_ops'], name='doctor_aadhar_trgm_idx'),
+            # ?specializations= / ?qualifications= (main_app.array_filters)
+            GinIndex(fields=['specializations'], name='doctor_specializations_idx'),
+            GinIndex(fields=['qualifications'], name='doctor_qualifications_idx'),
+        ]
+
 
 class Patient(BaseModel):
     GENDER_CHOICES = [
@@ -134,12 +169,27 @@ class Patient(BaseModel):
     disabilities_or_diseases = ArrayField(models.CharField(max_length=50, null=True, blank=True), default=list, null=True, blank=True)
     allergies = ArrayField(models.CharField(max_length=50, null=True, blank=True), default=list, null=True, blank=True)
     medical_history = models.TextField(null=True, blank=True)
-    profile_photo = models.ImageField(upload_to='images/', null=True, blank=True)
+    profile_photo = models.ImageField(upload_to='images/', storage=get_blob_storage, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
 
     def __str__(self) -> str:
         return f"Patient: {self.name}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['aadhar'], name='patient_aadhar_idx'),
+            # active roster in keyset order (get_create_patients)
+            models.Index(fields=['created_at', 'id'], condition=models.Q(status='active'), name='patient_active_created_idx'),
+            # /api/patients/search/ (main_app.search)
+            GinIndex(SearchVector('name', config='simple'), name='patient_name_search_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='patient_name_trgm_idx'),
+            GinIndex(fields=['contact_number'], opclasses=['gin_trgm_ops'], name='patient_contact_trgm_idx'),
+            GinIndex(fields=['aadhar'], opclasses=['gin_trgm_ops'], name='patient_aadhar_trgm_idx'),
+            # ?allergies= / ?disabilities_or_diseases= (main_app.array_filters)
+            GinIndex(fields=['allergies'], name='patient_allergies_idx'),
+            GinIndex(fields=['disabilities_or_diseases'], name='patient_diseases_idx'),
+        ]
+
 
 class MedicalTest(BaseModel):
     test_code = models.CharField(max_length=20, unique=True, primary_key=True)
@@ -160,6 +210,8 @@ class MedicalTest(BaseModel):
         return f"{self.short_name} Medical Test"
 
 
+# Range partitioned by month of diagnosis_date (main_app.partitions). The database
+# cannot enforce foreign keys to partitioned tables: those have db_constraint=False
 class Diagnosis(BaseModel):
     STATUS_CHOICES = [
         ('ongoing', 'Ongoing'),
@@ -184,7 +236,19 @@ class Diagnosis(BaseModel):
     def __str__(self) -> str:
         return f"Diagnosis for {self.patient_id.name} by Dr. {self.visiting_doctor_id.name} on {self.diagnosis_date}"
 
-
+    class Meta:
+        indexes = [
+            # patient / doctor history in keyset order
+            models.Index(fields=['patient_id', 'created_at', 'id'], name='diagnosis_patient_created_idx'),
+            models.Index(fields=['visiting_doctor_id', 'created_at', 'id'], name='diagnosis_doctor_created_idx'),
+            models.Index(fields=['patient_id', 'diagnosis_date'], name='diagnosis_patient_date_idx'),
+            # ?tests= (main_app.array_filters)
+            GinIndex(fields=['tests'], name='diagnosis_tests_idx'),
+        ]
+
+
+# Range partitioned by month of created_at (main_app.partitions). The database
+# cannot enforce foreign keys to partitioned tables: those have db_constraint=False
 class TestPrescribed(BaseModel):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -193,27 +257,39 @@ class TestPrescribed(BaseModel):
     ]
 
     test_code = models.ForeignKey('main_app.MedicalTest', on_delete=models.PROTECT)
-    prescription_id = models.ForeignKey('main_app.Prescription', on_delete=models.PROTECT, null=True, blank=True)
+    prescription_id = models.ForeignKey('main_app.Prescription', on_delete=models.PROTECT, null=True, blank=True, db_constraint=False)
     patient_id = models.ForeignKey('main_app.Patient', on_delete=models.PROTECT)
     ordering_doctor_id = models.ForeignKey('main_app.Doctor', on_delete=models.PROTECT)
     test_date = models.DateField()
     test_time = models.TimeField()
     test_results = models.TextField(null=True, blank=True)  # Made nullable
-    test_result_files = models.FileField(upload_to='test_results/', null=True, blank=True)
+    test_result_files = models.FileField(upload_to='test_results/', storage=get_blob_storage, null=True, blank=True)
     comments = models.TextField(null=True, blank=True)  # Made nullable
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')  # Changed default
+    # Set when a lab bench claims the pending test from the queue (see lab_queue.py)
+    claimed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_tests')
+    claimed_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self) -> str:
         return f"Test {self.test_code.short_name} prescribed to patient {self.patient_id.name} by Dr. {self.ordering_doctor_id.name}"
 
+    class Meta:
+        indexes = [
+            # The lab queue: pending tests in the order they are due
+            models.Index(fields=['test_date', 'test_time', 'id'], condition=models.Q(status='pending'), name='testprescribed_pending_idx'),
+        ]
+
+
 
+# Range partitioned by month of created_at (main_app.partitions). The database
+# cannot enforce foreign keys to partitioned tables: those have db_constraint=False
 class Prescription(BaseModel):
     STATUS_CHOICES = [
         ('active', 'Active'),
         ('inactive', 'Inactive'),
     ]
 
-    diagnosis_id = models.ForeignKey('main_app.Diagnosis', on_delete=models.PROTECT)
+    diagnosis_id = models.ForeignKey('main_app.Diagnosis', on_delete=models.PROTECT, db_constraint=False)
     patient_id = models.ForeignKey('main_app.Patient', on_delete=models.PROTECT)
     prescribed_by_doctor_id = models.ForeignKey('main_app.Doctor', on_delete=models.PROTECT)
     prescription_date = models.DateField(default=timezone.now)  # Added default
@@ -223,10 +299,17 @@ class Prescription(BaseModel):
     def __str__(self) -> str:
         return f"Prescription for patient {self.patient_id.name} by Dr. {self.prescribed_by_doctor_id.name} on date {self.prescription_date}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['diagnosis_id', 'patient_id'], name='prescription_diag_patient_idx'),
+        ]
+
 
+# Range partitioned by month of created_at (main_app.partitions). The database
+# cannot enforce foreign keys to partitioned tables: those have db_constraint=False
 class PrescriptionDetails(BaseModel):
-    prescription_id = models.ForeignKey('main_app.Prescription', on_delete=models.PROTECT)
-    diagnosis_id = models.ForeignKey('main_app.Diagnosis', on_delete=models.PROTECT)
+    prescription_id = models.ForeignKey('main_app.Prescription', on_delete=models.PROTECT, db_constraint=False)
+    diagnosis_id = models.ForeignKey('main_app.Diagnosis', on_delete=models.PROTECT, db_constraint=False)
     patient_id = models.ForeignKey('main_app.Patient', on_delete=models.PROTECT)
     prescribed_by_doctor_id = models.ForeignKey('main_app.Doctor', on_delete=models.PROTECT)
     drug = models.CharField(max_length=100, null=True, blank=True)
@@ -235,4 +318,105 @@ class PrescriptionDetails(BaseModel):
     duration = models.CharField(max_length=100, null=True, blank=True)
 
     def __str__(self) -> str:
-        return f"Prescription details for patient {self.patient_id.name} by Dr. {self.prescribed_by_doctor_id.name} for drug {self.drug}"
\ No newline at end of file
+        return f"Prescription details for patient {self.patient_id.name} by Dr. {self.prescribed_by_doctor_id.name} for drug {self.drug}"
+
+class ImportJob(BaseModel):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=30)   # a key of main_app.imports.IMPORTS
+    source = models.CharField(max_length=255)   # uploaded file name or command line path
+    file = models.FileField(upload_to='imports/', null=True, blank=True)   # only for uploads
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    processed_rows = models.IntegerField(default=0)
+    created_rows = models.IntegerField(default=0)
+    updated_rows = models.IntegerField(default=0)
+    failed_rows = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)   # the first IMPORT_MAX_ERRORS row errors
+    error = models.TextField(null=True, blank=True)   # why a failed import stopped
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"Import of {self.kind} from {self.source} ({self.status})"
+
+
+class ResultUpload(BaseModel):
+    # A chunked, resumable upload of a test's result file (main_app.uploads)
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('aborted', 'Aborted'),
+    ]
+
+    test = models.ForeignKey('main_app.TestPrescribed', on_delete=models.CASCADE, related_name='result_uploads', db_constraint=False)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()   # declared up front, in bytes
+    sha256 = models.CharField(max_length=64, blank=True)   # expected digest if given, the actual one once completed
+    received = models.BigIntegerField(default=0)   # bytes on disk, where the next chunk starts
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading')
+    error = models.TextField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"Upload of {self.filename} for test {self.test_id} ({self.received}/{self.size} bytes)"
+
+
+class Blob(models.Model):
+    # A file of main_app.storage.ContentAddressedStorage and how many rows use it
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.BigIntegerField()
+    refcount = models.IntegerField(default=0)
+    last_used = models.DateTimeField()   # last saved or dereferenced; garbage only after BLOB_GC_GRACE
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.refcount} references)"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_used'], condition=models.Q(refcount=0), name='blob_unreferenced_idx'),
+        ]
+
+
+class StatsRefresh(models.Model):
+    # one row per dashboard materialized view (main_app.stats)
+    view = models.CharField(max_length=63, primary_key=True)
+    refreshed_at = models.DateTimeField()
+    duration_ms = models.IntegerField()
+
+    def __str__(self) -> str:
+        return f"{self.view} refreshed at {self.refreshed_at}"
+
+
+class AuditEvent(models.Model):
+    # Append-only, partitioned by month of occurred_at (see main_app.audit)
+    ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+        ('read', 'Read'),
+        ('list', 'List'),
+        ('import', 'Import'),
+    ]
+
+    occurred_at = models.DateTimeField()
+    actor_id = models.BigIntegerField(null=True, blank=True)   # no foreign key: the trail outlives the users
+    actor_role = models.CharField(max_length=10, blank=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    model = models.CharField(max_length=50)   # app label and model name, e.g. main_app.Patient
+    object_id = models.CharField(max_length=64, null=True, blank=True)   # None for lists and bulk events
+    changes = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)   # {field: [old, new]}
+    path = models.CharField(max_length=255, blank=True)   # the request, with its query string
+
+    def __str__(self) -> str:
+        return f"{self.action} of {self.model} {self.object_id or ''} by user {self.actor_id} at {self.occurred_at}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id', 'occurred_at'], name='auditevent_object_idx'),
+            models.Index(fields=['actor_id', 'occurred_at'], name='auditevent_actor_idx'),
+        ]
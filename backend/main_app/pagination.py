@@ -0,0 +1,223 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import audit
+from .fast_serializers import get_reader
+from .fieldsets import get_fieldset, narrow_queryset, serialize
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination over (created_at, pk).
+
+    Rows are ordered by the keyset and each page is fetched with a
+    "greater than the last row seen" filter, so deep pages cost the same as the
+    first one instead of growing with an OFFSET. Models without a created_at
+    column (Ward, Room, Bed) are paginated on pk alone.
+
+    Query params:
+        cursor     - opaque token taken from the `next` link of the previous page
+        page_size  - rows per page, capped at max_page_size
+        paginate   - pass `false` to get the full, unpaginated list (legacy clients)
+    """
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    paginate_query_param = 'paginate'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Returns the rows of the requested page, or None when the client opted
+        out of pagination with ?paginate=false.
+        """
+        page_queryset = self.get_page_queryset(queryset, request)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for async views.
+        """
+        page_queryset = self.get_page_queryset(queryset, request)
+        if page_queryset is None:
+            return None
+        return self.set_page([row async for row in page_queryset])
+
+    def get_page_queryset(self, queryset, request):
+        """
+        The (unevaluated) queryset of the requested page plus one extra row that
+        tells whether there is a next page.
+        """
+        if request.query_params.get(self.paginate_query_param, '').lower() in ('false', '0', 'no'):
+            return None
+
+        self.request = request
+        self.keyset = self.get_keyset(queryset.model)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.keyset)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(self.get_keyset_filter(cursor))
+            except (TypeError, ValueError, DjangoValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_keyset(self, model):
+        field_names = {field.name for field in model._meta.get_fields()}
+        if 'created_at' in field_names:
+            return ('created_at', 'pk')
+        return ('pk',)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_keyset_filter(self, cursor):
+        """
+        Builds the row-value comparison `(k1, k2) > (v1, v2)` as
+        `k1 >= v1 AND (k1 > v1 OR (k1 = v1 AND k2 > v2))`. The OR alone is only
+        a filter over an index scan from its start; the leading `k1 >= v1` is
+        the bound Postgres starts the scan of the keyset index at.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.keyset, cursor):
+            condition |= Q(**equal, **{f'{field}__gt': value})
+            equal[field] = value
+        if len(self.keyset) > 1:
+            condition &= Q(**{f'{self.keyset[0]}__gte': cursor[0]})
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        values = self.get_row_keyset(self.page[-1])
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def get_row_keyset(self, row):
+        if isinstance(row, tuple):
+            # values_list() rows, which end with the keyset columns (see paginated_response)
+            return list(row[-len(self.keyset):])
+        return [getattr(row, field) for field in self.keyset]
+
+    def encode_cursor(self, values):
+        # isoformat() keeps microseconds, which the keyset comparison relies on
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.keyset):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+
+def paginated_response(request, queryset, serializer_class):
+    """
+    Serializes one keyset page of `queryset`, or the whole queryset when the
+    client passed ?paginate=false, honouring ?fields= and ?expand= (see
+    fieldsets.py). Serializers that compile to a FastReader (see
+    fast_serializers.py) are served from values_list() rows instead of model
+    instances, with identical output.
+    """
+    fields, expand = get_fieldset(request, serializer_class)
+    reader = get_reader(serializer_class, fields, expand)
+    paginator = KeysetPagination()
+    if reader is not None:
+        page = paginator.paginate_queryset(reader.values_list(queryset, *paginator.get_keyset(queryset.model)), request)
+        if page is None:
+            return list_response(request, queryset, serializer_class)
+        audit.log_reads(queryset.model, [row[-1] for row in page])   # the keyset ends with the pk
+        return fast_response(reader, reader.to_representation(page), paginator)
+
+    queryset = narrow_queryset(queryset, serializer_class, fields, expand)
+    page = paginator.paginate_queryset(queryset, request)
+    if page is None:
+        return list_response(request, queryset, serializer_class)
+    audit.log_reads(queryset.model, [instance.pk for instance in page])
+    return paginator.get_paginated_response(serialize(page, serializer_class, fields, expand))
+
+
+async def apaginated_response(request, queryset, serializer_class):
+    """
+    paginated_response() for async views.
+    """
+    fields, expand = get_fieldset(request, serializer_class)
+    reader = get_reader(serializer_class, fields, expand)
+    paginator = KeysetPagination()
+    if reader is not None:
+        page = await paginator.apaginate_queryset(reader.values_list(queryset, *paginator.get_keyset(queryset.model)), request)
+        if page is None:
+            rows = [row async for row in reader.values_list(queryset, 'pk')]
+            audit.log_reads(queryset.model, [row[-1] for row in rows])
+            return fast_response(reader, reader.to_representation(rows))
+        audit.log_reads(queryset.model, [row[-1] for row in page])
+        return fast_response(reader, reader.to_representation(page), paginator)
+
+    queryset = narrow_queryset(queryset, serializer_class, fields, expand)
+    page = await paginator.apaginate_queryset(queryset, request)
+    if page is None:
+        instances = [instance async for instance in queryset]
+        audit.log_reads(queryset.model, [instance.pk for instance in instances])
+        return Response(serialize(instances, serializer_class, fields, expand))
+    audit.log_reads(queryset.model, [instance.pk for instance in page])
+    return paginator.get_paginated_response(serialize(page, serializer_class, fields, expand))
+
+
+def list_response(request, queryset, serializer_class):
+    """
+    The whole queryset, unpaginated, through the FastReader when there is one.
+    Honours ?fields= and ?expand= like paginated_response(). Like it, logs a
+    read of each audited row returned (see audit.py).
+    """
+    fields, expand = get_fieldset(request, serializer_class)
+    reader = get_reader(serializer_class, fields, expand)
+    if reader is not None:
+        rows = list(reader.values_list(queryset, 'pk'))
+        audit.log_reads(queryset.model, [row[-1] for row in rows])
+        return fast_response(reader, reader.to_representation(rows))
+
+    instances = list(narrow_queryset(queryset, serializer_class, fields, expand))
+    audit.log_reads(queryset.model, [instance.pk for instance in instances])
+    return Response(serialize(instances, serializer_class, fields, expand))
+
+
+def fast_response(reader, data, paginator=None):
+    response = paginator.get_paginated_response(data) if paginator is not None else Response(data)
+    # lets main_app.renderers.FastJSONRenderer render it with orjson
+    response.json_safe = reader.json_safe
+    return response
@@ -0,0 +1,492 @@
+"""
+Monthly range partitions of the history tables and the audit log (PARTITION_KEYS),
+declared PARTITION BY RANGE in their migrations (0020, 0021).
+
+A month's partition is named <table>_p<YYYYMM> and holds [first day of the
+month, first day of the next one); rows outside every partition land in
+<table>_default. Queries that filter on the key only read the months they
+need, and the indexes of a month stay the size of a month.
+
+`python manage.py archive_partitions` makes the partitions of the coming
+PARTITION_MONTHS_AHEAD months, and moves the history older than
+PARTITION_KEEP_MONTHS out of the database a month of diagnoses at a time.
+The other history tables are partitioned by when their rows were made, not by
+the date of their diagnosis, so a month is archived by its diagnosis
+partition: in one transaction, with writes to the history held, the
+prescriptions, details and tests of those diagnoses are moved out of their
+tables, wherever their own month is, and the partition is detached (from then
+on nothing reads or writes it). Each of these tables is then written to
+PARTITION_ARCHIVE_DIR/<table>.csv.gz, with one <diagnosis partition>.json
+manifest for the month, checked and dropped; the old partitions of the other
+tables are dropped once empty. A month left detached by an interrupted run is
+archived by the next one. There are no foreign keys to partitioned tables, so
+detach_partition refuses to detach diagnoses that rows still reference.
+
+`python manage.py restore_partition <diagnosis partition>` loads a month
+back, each table under the name it was archived as, for queries in SQL until
+the next run archives it again; with --attach the diagnoses become a
+partition again, the other rows go back to their tables, and the API serves
+them.
+"""
+import csv
+import datetime
+import gzip
+import json
+import os
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+
+from .storage import BLOB_FIELDS
+
+
+# model label -> the field its table is partitioned by
+PARTITION_KEYS = {
+    'main_app.Diagnosis': 'diagnosis_date',
+    'main_app.Prescription': 'created_at',
+    'main_app.PrescriptionDetails': 'created_at',
+    'main_app.TestPrescribed': 'created_at',
+    'main_app.AuditEvent': 'occurred_at',
+}
+
+# The ones archive_partitions moves out of the database; the audit log is kept.
+# A month of diagnoses goes with every row that references them, in this order.
+ARCHIVED_MODELS = [
+    'main_app.Diagnosis',
+    'main_app.Prescription',
+    'main_app.PrescriptionDetails',
+    'main_app.TestPrescribed',
+]
+HISTORY_ROOT = 'main_app.Diagnosis'
+
+# (model label, field, model label it references) between the ARCHIVED_MODELS
+HISTORY_REFERENCES = [
+    ('main_app.Prescription', 'diagnosis_id', 'main_app.Diagnosis'),
+    ('main_app.PrescriptionDetails', 'diagnosis_id', 'main_app.Diagnosis'),
+    ('main_app.PrescriptionDetails', 'prescription_id', 'main_app.Prescription'),
+    ('main_app.TestPrescribed', 'prescription_id', 'main_app.Prescription'),
+]
+
+
+def get_archive_dir():
+    return getattr(settings, 'PARTITION_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive'))
+
+
+def get_months_ahead():
+    return getattr(settings, 'PARTITION_MONTHS_AHEAD', 3)
+
+
+def get_keep_months():
+    return getattr(settings, 'PARTITION_KEEP_MONTHS', 24)
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def next_month(month):
+    return add_months(month, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def partition_month(table, name):
+    """
+    The month of the partition `name` of `table`, None for any other table.
+    """
+    match = re.fullmatch(rf'{re.escape(table)}_p(\d{{4}})(\d{{2}})', name)
+    return datetime.date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def get_key_column(model):
+    return model._meta.get_field(PARTITION_KEYS[model._meta.label]).column
+
+
+def list_partitions(model):
+    """
+    (name, month) of the monthly partitions attached to the table of `model`, oldest first.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = %s::regclass',
+            [table],
+        )
+        names = [name for name, in cursor.fetchall()]
+    return sorted((name, month) for name in names if (month := partition_month(table, name)))
+
+
+def list_detached(model):
+    """
+    (name, month) of the tables named like partitions of `model`'s table that
+    are not attached: archive_partitions stopped before dropping them, or
+    restore_partition loaded them.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+            "AND relnamespace = 'public'::regnamespace AND relname LIKE %s",
+            [f'{table}_p%'],
+        )
+        names = [name for name, in cursor.fetchall()]
+    return sorted((name, month) for name in names if (month := partition_month(table, name)))
+
+
+def attach_partition(model, name, month):
+    """
+    Attaches the table `name` as the partition of `month`, first moving into it
+    the rows of that month the default partition took meanwhile (the
+    attachment fails otherwise).
+    """
+    quote = connection.ops.quote_name
+    table = model._meta.db_table
+    key = quote(get_key_column(model))
+    start, end = month.isoformat(), next_month(month).isoformat()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {quote(f"{table}_default")} WHERE {key} >= %s AND {key} < %s RETURNING *) '
+            f'INSERT INTO {quote(name)} SELECT * FROM moved',
+            [start, end],
+        )
+        # the bounds are literals; DDL takes no parameters
+        cursor.execute(f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM ('{start}') TO ('{end}')")
+
+
+def create_partition(model, month):
+    """
+    Creates the partition of `model`'s table for the month of `month` unless it
+    exists. Returns its name. Concurrent callers wait on an advisory lock rather
+    than race on the catalog.
+    """
+    quote = connection.ops.quote_name
+    month = month_start(month)
+    table = model._meta.db_table
+    name = partition_name(table, month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [name])
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+        if not cursor.fetchone()[0]:
+            cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            attach_partition(model, name, month)
+    return name
+
+
+def create_upcoming_partitions(months_ahead=None, today=None):
+    """
+    Creates the partitions of every partitioned table for this month and the
+    `months_ahead` (default PARTITION_MONTHS_AHEAD) after it. Returns the names
+    of the ones that were missing.
+    """
+    months_ahead = months_ahead if months_ahead is not None else get_months_ahead()
+    this_month = month_start(today or datetime.date.today())
+    created = []
+    for label in PARTITION_KEYS:
+        model = apps.get_model(label)
+        existing = {name for name, _ in list_partitions(model)}
+        for ahead in range(months_ahead + 1):
+            name = create_partition(model, add_months(this_month, ahead))
+            if name not in existing:
+                created.append(name)
+    return created
+
+
+def archive_path(name, directory=None):
+    return os.path.join(directory or get_archive_dir(), f'{name}.csv.gz')
+
+
+def manifest_path(name, directory=None):
+    return os.path.join(directory or get_archive_dir(), f'{name}.json')
+
+
+def get_blob_columns(model):
+    return [
+        model._meta.get_field(field_name).column
+        for label, field_name in BLOB_FIELDS if label == model._meta.label
+    ]
+
+
+def table_exists(cursor, name):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+    return cursor.fetchone()[0]
+
+
+def history_tables(month):
+    """
+    {model label: table} of the archive of `month`: the diagnosis partition of
+    the month, and <table>_a<YYYYMM> for each of the other ARCHIVED_MODELS,
+    which detach_history moves the rows of those diagnoses into.
+    """
+    tables = {}
+    for label in ARCHIVED_MODELS:
+        table = apps.get_model(label)._meta.db_table
+        tables[label] = partition_name(table, month) if label == HISTORY_ROOT else f'{table}_a{month:%Y%m}'
+    return tables
+
+
+def get_references(label):
+    """
+    (column, model label it references, nullable) of the HISTORY_REFERENCES from `label`.
+    """
+    model = apps.get_model(label)
+    return [
+        (model._meta.get_field(field_name).column, parent, model._meta.get_field(field_name).null)
+        for child, field_name, parent in HISTORY_REFERENCES if child == label
+    ]
+
+
+def check_unreferenced(cursor, label, name):
+    """
+    Raises RuntimeError if a row of the history tables references a row of the
+    table `name`, which holds rows of `label` that are leaving the database.
+    """
+    quote = connection.ops.quote_name
+    for child, field_name, parent in HISTORY_REFERENCES:
+        if parent != label:
+            continue
+        model = apps.get_model(child)
+        column = model._meta.get_field(field_name).column
+        cursor.execute(
+            f'SELECT count(*) FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN (SELECT id FROM {quote(name)})'
+        )
+        count = cursor.fetchone()[0]
+        if count:
+            raise RuntimeError(f'{name}: {count} rows of {model._meta.db_table} reference it, it is kept')
+
+
+def lock_history(cursor):
+    # no writes to the history tables until the transaction ends; reads go on
+    quote = connection.ops.quote_name
+    tables = ', '.join(quote(apps.get_model(label)._meta.db_table) for label in ARCHIVED_MODELS)
+    cursor.execute(f'LOCK TABLE {tables} IN SHARE ROW EXCLUSIVE MODE')
+
+
+def detach_partition(model, name):
+    """
+    Detaches the partition `name` of `model`'s table, unless rows of the
+    history tables still reference its rows (RuntimeError): there are no
+    foreign keys to partitioned tables to refuse it otherwise.
+    """
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        lock_history(cursor)
+        check_unreferenced(cursor, model._meta.label, name)
+        cursor.execute(f'ALTER TABLE {quote(model._meta.db_table)} DETACH PARTITION {quote(name)}')
+
+
+def detach_history(month):
+    """
+    Detaches the diagnosis partition of `month` together with what references
+    its diagnoses, wherever it is: their prescriptions, and the details and
+    tests of those, are moved to the other history_tables of the month, and so
+    are the tests of the month that belong to no prescription. Returns False
+    if the partition was not attached (a run stopped after this, or a restore).
+    """
+    quote = connection.ops.quote_name
+    tables = history_tables(month)
+    root = apps.get_model(HISTORY_ROOT)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass AND inhparent = %s::regclass',
+            [tables[HISTORY_ROOT], root._meta.db_table],
+        )
+        if not cursor.fetchone():
+            return False
+        lock_history(cursor)
+        for label in ARCHIVED_MODELS:
+            if label == HISTORY_ROOT:
+                continue
+            model = apps.get_model(label)
+            table = model._meta.db_table
+            references = get_references(label)
+            conditions = [f'{quote(column)} IN (SELECT id FROM {quote(tables[parent])})' for column, parent, _ in references]
+            params = []
+            if all(null for *_, null in references):   # rows of their own month when they reference nothing
+                key = quote(get_key_column(model))
+                unreferenced = ' AND '.join(f'{quote(column)} IS NULL' for column, *_ in references)
+                conditions.append(f'({unreferenced} AND {key} >= %s AND {key} < %s)')
+                params += [month.isoformat(), next_month(month).isoformat()]
+            cursor.execute(f'CREATE TABLE {quote(tables[label])} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {quote(table)} WHERE {" OR ".join(conditions)} RETURNING *) '
+                f'INSERT INTO {quote(tables[label])} SELECT * FROM moved',
+                params,
+            )
+        for label in ARCHIVED_MODELS:
+            if label != HISTORY_ROOT:
+                check_unreferenced(cursor, label, tables[label])
+        detach_partition(root, tables[HISTORY_ROOT])
+    return True
+
+
+def export_table(cursor, model, name, directory):
+    """
+    Writes the table `name`, rows of `model`, to <name>.csv.gz once the file
+    holds every row. Returns (rows, {stored file: rows referencing it}).
+    """
+    quote = connection.ops.quote_name
+    path = archive_path(name, directory)
+    temporary = f'{path}.tmp'
+
+    cursor.execute(f'SELECT count(*) FROM {quote(name)}')
+    rows = cursor.fetchone()[0]
+    with gzip.open(temporary, 'wt', encoding='utf-8', newline='') as file:
+        cursor.copy_expert(f'COPY {quote(name)} TO STDOUT WITH (FORMAT csv, HEADER)', file)
+    files = {}
+    for column in get_blob_columns(model):
+        cursor.execute(f"SELECT {quote(column)}, count(*) FROM {quote(name)} WHERE {quote(column)} <> '' GROUP BY 1")
+        for file_name, count in cursor.fetchall():
+            files[file_name] = files.get(file_name, 0) + count
+
+    with gzip.open(temporary, 'rt', encoding='utf-8', newline='') as file:
+        written = sum(1 for _ in csv.reader(file)) - 1   # without the header
+    if written != rows:
+        os.remove(temporary)
+        raise RuntimeError(f'{name}: {written} of {rows} rows written, the table is kept')
+    with open(temporary, 'rb') as file:
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return rows, files
+
+
+def archive_history(month, directory=None):
+    """
+    Writes the history_tables of `month`, detached, to <table>.csv.gz each and
+    drops them. The manifest, <diagnosis partition>.json, lists the tables and
+    counts the rows referencing each stored file, which
+    storage.recount_references keeps counting. Returns [(table, rows)].
+    """
+    quote = connection.ops.quote_name
+    directory = directory or get_archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    archived, files = {}, {}
+    with connection.cursor() as cursor:
+        for label, name in history_tables(month).items():
+            if not table_exists(cursor, name):
+                continue
+            model = apps.get_model(label)
+            rows, table_files = export_table(cursor, model, name, directory)
+            archived[name] = {'table': model._meta.db_table, 'rows': rows}
+            for file_name, count in table_files.items():
+                files[file_name] = files.get(file_name, 0) + count
+
+    with open(manifest_path(partition_name(apps.get_model(HISTORY_ROOT)._meta.db_table, month), directory), 'w') as file:
+        json.dump({
+            'month': month.isoformat(),
+            'tables': archived,
+            'archived_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'files': files,
+        }, file, indent=2)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name in archived:
+            cursor.execute(f'DROP TABLE {quote(name)}')
+    return [(name, table['rows']) for name, table in archived.items()]
+
+
+def drop_emptied_partitions(cutoff):
+    """
+    Drops the partitions older than `cutoff` of the history tables but the
+    diagnoses' once they are empty, their rows archived with their diagnoses.
+    Those still holding rows of kept diagnoses stay. Returns their names.
+    """
+    quote = connection.ops.quote_name
+    dropped = []
+    for label in ARCHIVED_MODELS:
+        if label == HISTORY_ROOT:
+            continue
+        model = apps.get_model(label)
+        table = model._meta.db_table
+        for name, month in list_partitions(model):
+            if month >= cutoff:
+                continue
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {quote(table)} IN SHARE ROW EXCLUSIVE MODE')
+                cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {quote(name)})')
+                if cursor.fetchone()[0]:
+                    continue
+                cursor.execute(f'ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}')
+                cursor.execute(f'DROP TABLE {quote(name)}')
+            dropped.append(name)
+    return dropped
+
+
+def archive_old_partitions(keep_months=None, today=None, directory=None):
+    """
+    Archives the months of diagnoses that ended more than `keep_months`
+    (default PARTITION_KEEP_MONTHS) months ago with their prescriptions and
+    tests, and any month left detached, then drops the emptied partitions of
+    the other history tables. Returns [(table, rows)].
+    """
+    keep_months = keep_months if keep_months is not None else get_keep_months()
+    cutoff = add_months(month_start(today or datetime.date.today()), -keep_months)
+    root = apps.get_model(HISTORY_ROOT)
+    for name, month in list_partitions(root):
+        if month < cutoff:
+            detach_history(month)
+    archived = []
+    for name, month in list_detached(root):
+        archived += archive_history(month, directory)
+    drop_emptied_partitions(cutoff)
+    return archived
+
+
+def restore_partition(name, attach=False, directory=None):
+    """
+    Loads the archive of the diagnosis partition `name` back, each of its
+    tables into a table of its name; `attach` makes the diagnoses a partition
+    again and puts the rows of the other tables back in theirs. Returns the
+    rows loaded.
+    """
+    quote = connection.ops.quote_name
+    with open(manifest_path(name, directory)) as file:
+        manifest = json.load(file)
+    month = datetime.date.fromisoformat(manifest['month'])
+
+    rows = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table_name, archived in manifest['tables'].items():
+            table = archived['table']
+            cursor.execute(f'CREATE TABLE {quote(table_name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            with gzip.open(archive_path(table_name, directory), 'rt', encoding='utf-8', newline='') as file:
+                # by the names in the header: the table may have gained columns since
+                columns = ', '.join(quote(column) for column in next(csv.reader(file)))
+                file.seek(0)
+                cursor.copy_expert(f'COPY {quote(table_name)} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER)', file)
+            rows += cursor.rowcount
+        if attach:
+            for table_name, archived in manifest['tables'].items():
+                table = archived['table']
+                if partition_month(table, table_name):
+                    model = next(model for model in apps.get_models() if model._meta.db_table == table)
+                    attach_partition(model, table_name, month)
+                else:
+                    cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(table_name)}')
+                    cursor.execute(f'DROP TABLE {quote(table_name)}')
+    return rows
+
+
+def archived_files(directory=None):
+    """
+    The stored files referenced by archived rows, from the manifests: {name: rows}.
+    """
+    directory = directory or get_archive_dir()
+    counts = {}
+    if not os.path.isdir(directory):
+        return counts
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json'):
+            with open(entry.path) as file:
+                for name, rows in json.load(file)['files'].items():
+                    counts[name] = counts.get(name, 0) + rows
+    return counts
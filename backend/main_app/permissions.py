@@ -4,13 +4,15 @@ class IsAdminUser(BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_authenticated and request.user.is_superuser
 
+# The doctor / patient checks ask the user's class: hasattr on the user loads the
+# linked row, a query per request, for the same answer
 class IsDoctorUser(BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.is_authenticated and (request.user.is_superuser or hasattr(request.user, 'doctor'))
+        return request.user and request.user.is_authenticated and (request.user.is_superuser or hasattr(type(request.user), 'doctor'))
 
 class IsPatientUser(BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.is_authenticated and (request.user.is_superuser or hasattr(request.user, 'patient'))
+        return request.user and request.user.is_authenticated and (request.user.is_superuser or hasattr(type(request.user), 'patient'))
 
 class IsStaffUser(BasePermission):
     def has_permission(self, request, view):
@@ -0,0 +1,29 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:   # optional, JSONRenderer is used without it
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that hands responses built by main_app.fast_serializers to
+    orjson. Those only hold strings, ints, bools, None, lists and dicts, for
+    which orjson writes exactly the bytes json.dumps does with DRF's default
+    settings (compact, non-ASCII unescaped). Anything else, or an indented
+    response (?format=api, `Accept: application/json; indent=4`), goes through
+    JSONRenderer as usual.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        response = renderer_context.get('response')
+        if (
+            orjson is None or data is None
+            or not getattr(response, 'json_safe', False)
+            or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return orjson.dumps(data).replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
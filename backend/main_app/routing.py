@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import BedBoardConsumer
+
+websocket_urlpatterns = [
+    path('ws/wards/<int:ward_id>/beds/', BedBoardConsumer.as_asgi()),
+]
@@ -0,0 +1,87 @@
+"""
+Ranked patient and doctor lookup by partial name, phone number or aadhaar.
+
+Every filter here is served by a GIN index on the model (see Patient.Meta and
+Doctor.Meta): the pg_trgm indexes answer substring matches on name,
+contact_number and aadhar, and the expression index on
+to_tsvector('simple', name) answers word-prefix matches on the name. The
+expressions must stay exactly as they are in those indexes or PostgreSQL falls
+back to a sequential scan (main_app.tests.SearchTests checks the plans).
+"""
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity, TrigramWordSimilarity,
+)
+from django.db.models import Q
+from django.db.models.functions import Greatest
+from rest_framework.exceptions import ValidationError
+
+
+SEARCH_QUERY_PARAM = 'q'
+LIMIT_QUERY_PARAM = 'limit'
+
+# pg_trgm cannot use the index for fewer than three characters
+MIN_QUERY_LENGTH = 3
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+NAME_VECTOR = SearchVector('name', config='simple')
+
+
+def get_search_params(request):
+    """
+    Returns (q, limit) from the query string, or raises ValidationError.
+    """
+    q = ' '.join(request.query_params.get(SEARCH_QUERY_PARAM, '').split())
+    if len(q) < MIN_QUERY_LENGTH:
+        raise ValidationError({SEARCH_QUERY_PARAM: f'Enter at least {MIN_QUERY_LENGTH} characters.'})
+
+    limit = request.query_params.get(LIMIT_QUERY_PARAM, DEFAULT_LIMIT)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValidationError({LIMIT_QUERY_PARAM: 'A whole number is required.'})
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValidationError({LIMIT_QUERY_PARAM: f'Must be between 1 and {MAX_LIMIT}.'})
+    return q, limit
+
+
+def prefix_query(q):
+    """
+    A tsquery matching names that contain a word starting with every word of
+    `q`, e.g. 'ram kum' -> 'ram:* & kum:*'. Only word characters reach
+    to_tsquery(), so user input cannot produce a syntax error.
+    """
+    words = re.findall(r'\w+', q)
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config='simple')
+
+
+def search(queryset, q, limit):
+    """
+    The best `limit` matches for `q` in `queryset`, best first, with ties broken
+    by id. A query of digits (spaces, '+' and '-' are ignored) is looked up as a
+    substring of the phone number and aadhaar; anything else is matched against
+    the name, by word prefix and by trigram similarity, so misspellings still
+    find the patient.
+    """
+    digits = re.sub(r'[\s+-]', '', q)
+    if digits.isdigit():
+        queryset = queryset.filter(
+            Q(contact_number__contains=digits) | Q(aadhar__contains=digits)
+        ).annotate(
+            rank=Greatest(TrigramSimilarity('contact_number', digits), TrigramSimilarity('aadhar', digits)),
+        )
+    else:
+        query = prefix_query(q)
+        matches = Q(name__trigram_word_similar=q)
+        if query is not None:
+            matches |= Q(name_vector=query)
+            rank = Greatest(TrigramWordSimilarity(q, 'name'), SearchRank(NAME_VECTOR, query))
+        else:
+            rank = TrigramWordSimilarity(q, 'name')
+        queryset = queryset.annotate(name_vector=NAME_VECTOR).filter(matches).annotate(rank=rank)
+
+    return queryset.order_by('-rank', 'pk')[:limit]
@@ -1,6 +1,13 @@
+import os
+
 from rest_framework import serializers
 from .models import *
+from . import audit
+from .images import ThumbnailsField
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
 from django.db import transaction
+from django.utils.text import get_valid_filename
 
 
 class AllotmentSerializer(serializers.ModelSerializer):
@@ -23,11 +30,32 @@ class BedSerializer(serializers.ModelSerializer):
         model = Bed
         fields = '__all__'
 
+class WardOccupancySerializer(serializers.ModelSerializer):
+    name = serializers.CharField(source='ward.name', read_only=True)
+    ward_type = serializers.CharField(source='ward.ward_type', read_only=True)
+
+    class Meta:
+        model = WardOccupancy
+        fields = ['ward', 'name', 'ward_type', 'total_beds', 'free_beds']
+
+class BedAllocationSerializer(serializers.Serializer):
+    patient_id = serializers.IntegerField()
+    ward_type = serializers.CharField(required=False)
+    room_type = serializers.ChoiceField(choices=Room.ROOM_TYPES, required=False)
+    admission_date = serializers.DateField(required=False)
+    admission_time = serializers.TimeField(required=False)
+
+class DischargeSerializer(serializers.Serializer):
+    discharge_date = serializers.DateField(required=False)
+    discharge_notes = serializers.CharField(required=False, allow_blank=True)
+
 class DepartmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Department
         fields = '__all__'
 class DoctorSerializer(serializers.ModelSerializer):
+    profile_photo_thumbnails = ThumbnailsField(source='profile_photo')
+
     class Meta:
         model = Doctor
         fields = '__all__'
@@ -41,6 +69,7 @@ class PatientSerializer(serializers.ModelSerializer):
         child=serializers.CharField(allow_blank=True),
         allow_empty=True
     )
+    profile_photo_thumbnails = ThumbnailsField(source='profile_photo')
 
     class Meta:
         model = Patient
@@ -65,6 +94,7 @@ class TestPrescribedSerializer(serializers.ModelSerializer):
     class Meta:
         model = TestPrescribed
         fields = '__all__'
+        read_only_fields = ['claimed_by', 'claimed_at']   # set by the lab queue
 
 class PrescriptionDetailsSerializer(serializers.ModelSerializer):
     class Meta:
@@ -76,26 +106,58 @@ class PrescriptionSerializer(serializers.ModelSerializer):
         model = Prescription
         fields = ['prescription_date', 'additional_notes', 'status']
 
+class PrescriptionExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Prescription
+        fields = '__all__'
+
+class PrescriptionDetailsExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PrescriptionDetails
+        fields = '__all__'
+
+
+class TestPrescribedNestedSerializer(serializers.ModelSerializer):
+    # Resolved for the whole list at once in DiagnosisFullCreateSerializer.validate_tests_prescribed
+    test_code = serializers.CharField(max_length=20)
+
+    class Meta:
+        model = TestPrescribed
+        fields = ['test_code', 'test_date', 'test_time', 'comments']
+        extra_kwargs = {
+            'test_date': {'required': False},
+            'test_time': {'required': False},
+        }
+
 
 class DiagnosisFullCreateSerializer(serializers.ModelSerializer):
     prescriptions = PrescriptionDetailsSerializer(many=True, required=False)
+    tests_prescribed = TestPrescribedNestedSerializer(many=True, required=False)
     additional_notes = serializers.CharField(required=False, write_only=True)
     
     class Meta:
         model = Diagnosis
         exclude = ['id', 'created_at', 'updated_at']
+
+    def validate_tests_prescribed(self, value):
+        test_codes = {test['test_code'] for test in value}
+        missing = test_codes - set(MedicalTest.objects.in_bulk(test_codes))
+        if missing:
+            raise serializers.ValidationError(f"Unknown test code(s): {', '.join(sorted(missing))}")
+        return value
     
     def create(self, validated_data):
         # Extract prescription-related data
         prescriptions_data = validated_data.pop('prescriptions', [])
+        tests_data = validated_data.pop('tests_prescribed', [])
         additional_notes = validated_data.pop('additional_notes', '')
         
         with transaction.atomic():
             # Create the diagnosis
             diagnosis = Diagnosis.objects.create(**validated_data)
             
-            # Only create a prescription if there are prescription details
-            if prescriptions_data:
+            # Only create a prescription if there are medicines or tests to hang off it
+            if prescriptions_data or tests_data:
                 # Create the prescription
                 prescription = Prescription.objects.create(
                     diagnosis_id=diagnosis,
@@ -106,14 +168,56 @@ class DiagnosisFullCreateSerializer(serializers.ModelSerializer):
                     status='active'  # Set to active by default
                 )
                 
-                # Create the prescription details
-                for prescription_detail in prescriptions_data:
-                    PrescriptionDetails.objects.create(
+                # Create the prescription details and tests, one INSERT each however many rows there are
+                PrescriptionDetails.objects.bulk_create([
+                    PrescriptionDetails(
                         prescription_id=prescription,
                         diagnosis_id=diagnosis,
                         patient_id=diagnosis.patient_id,
                         prescribed_by_doctor_id=diagnosis.visiting_doctor_id,
                         **prescription_detail
-                    )
+                    ) for prescription_detail in prescriptions_data
+                ])
+                tests = TestPrescribed.objects.bulk_create([
+                    TestPrescribed(
+                        test_code_id=test.pop('test_code'),
+                        prescription_id=prescription,
+                        patient_id=diagnosis.patient_id,
+                        ordering_doctor_id=diagnosis.visiting_doctor_id,
+                        test_date=test.pop('test_date', diagnosis.diagnosis_date),
+                        test_time=test.pop('test_time', diagnosis.diagnosis_time),
+                        **test
+                    ) for test in tests_data
+                ])
+                # bulk_create sends no signals
+                audit.log_created(tests)
             
         return diagnosis
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = '__all__'
+
+class ResultUploadSerializer(serializers.ModelSerializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+
+    class Meta:
+        model = ResultUpload
+        fields = '__all__'
+        read_only_fields = ['test', 'created_by', 'received', 'status', 'error']
+
+    def validate_filename(self, value):
+        try:
+            return get_valid_filename(os.path.basename(value.replace('\\', '/')))
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError('Enter a file name.')
+
+    def validate_size(self, value):
+        max_size = getattr(settings, 'RESULT_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(f'Must be between 1 and {max_size} bytes.')
+        return value
+
+    def validate_sha256(self, value):
+        return value.lower()
@@ -0,0 +1,206 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+
+from . import audit, beds
+from .cache import CATALOG_RELATED, CATALOGS, invalidate_catalog
+from .consumers import ward_group
+from .images import schedule_thumbnails
+from .storage import BLOB_FIELDS, add_reference, remove_reference
+from .models import Allotment, Bed, Doctor, Patient, Room, Ward, WardOccupancy
+
+
+def connect_catalog_invalidation():
+    """
+    Invalidates the cached catalog whenever one of its rows, or of the
+    CATALOG_RELATED rows it embeds, is saved or deleted. Bulk writes
+    (bulk_create, queryset.update) send no signals and must call
+    invalidate_catalog() themselves.
+    """
+    for name, model_label in CATALOGS.items():
+        def receiver(sender, name=name, **kwargs):
+            invalidate_catalog(name)
+
+        for label in [model_label, *CATALOG_RELATED.get(name, [])]:
+            model = apps.get_model(label)
+            post_save.connect(receiver, sender=model, weak=False, dispatch_uid=f'catalog-{name}-{label}-save')
+            post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=f'catalog-{name}-{label}-delete')
+
+
+def create_ward_occupancy(sender, instance, created, **kwargs):
+    if created:
+        WardOccupancy.objects.create(ward=instance)
+
+
+def release_deleted_bed(sender, instance, **kwargs):
+    beds.remove_bed(instance.room_id, not instance.is_occupied)
+
+
+def remember_room_ward(sender, instance, **kwargs):
+    instance._loaded_ward_id = instance.__dict__.get('ward_id')
+
+
+def move_room_beds(sender, instance, created, **kwargs):
+    old_ward_id, instance._loaded_ward_id = instance._loaded_ward_id, instance.ward_id
+    if not created and old_ward_id is not None and old_ward_id != instance.ward_id:
+        beds.recount_free_beds([old_ward_id, instance.ward_id])
+
+
+def connect_ward_occupancy():
+    """
+    Keeps WardOccupancy in step with the writes main_app.beds does not make
+    itself: deleted beds (a deleted room or ward deletes its beds with it) and
+    rooms moved to another ward. Bulk writes send no signals; recount_beds
+    repairs the counters after them.
+    """
+    post_save.connect(create_ward_occupancy, sender=Ward, dispatch_uid='ward-occupancy')
+    post_delete.connect(release_deleted_bed, sender=Bed, dispatch_uid='ward-occupancy-bed-delete')
+    post_init.connect(remember_room_ward, sender=Room, dispatch_uid='ward-occupancy-room-ward')
+    post_save.connect(move_room_beds, sender=Room, dispatch_uid='ward-occupancy-room-move')
+
+
+def broadcast_to_ward(ward_id, delta):
+    """
+    Sends a delta to the ward's bed board subscribers once the change commits,
+    stamped with the ward's free-bed count at that point.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None or ward_id is None:
+        return
+
+    def send():
+        delta['free_beds'] = WardOccupancy.objects.filter(ward_id=ward_id).values_list('free_beds', flat=True).first()
+        async_to_sync(channel_layer.group_send)(ward_group(ward_id), {'type': 'ward.delta', 'delta': delta})
+
+    transaction.on_commit(send)
+
+
+def broadcast_bed(sender, instance, **kwargs):
+    ward_id = instance.room.ward_id
+    broadcast_to_ward(ward_id, {
+        'type': 'bed',
+        'ward': ward_id,
+        # same layout as the snapshot: [bed id, room id, bed number, occupied]
+        'bed': [instance.id, instance.room_id, instance.bed_number, instance.is_occupied],
+    })
+
+
+def broadcast_allotment(sender, instance, **kwargs):
+    broadcast_to_ward(instance.ward_id_id, {
+        'type': 'allotment',
+        'ward': instance.ward_id_id,
+        'id': instance.id,
+        'patient': instance.patient_id_id,
+        'bed': instance.bed_id_id,
+        'admission_date': str(instance.admission_date),
+        'discharge_date': str(instance.discharge_date) if instance.discharge_date else None,
+    })
+
+
+def connect_bed_board():
+    post_save.connect(broadcast_bed, sender=Bed, dispatch_uid='bed-board-bed')
+    post_save.connect(broadcast_allotment, sender=Allotment, dispatch_uid='bed-board-allotment')
+
+
+def make_photo_thumbnails(sender, instance, update_fields=None, **kwargs):
+    if instance.profile_photo and (update_fields is None or 'profile_photo' in update_fields):
+        schedule_thumbnails(instance.profile_photo.name)
+
+
+def connect_photo_thumbnails():
+    """
+    Thumbnails every doctor and patient profile photo that is saved (see images.py).
+    """
+    post_save.connect(make_photo_thumbnails, sender=Doctor, dispatch_uid='doctor-photo-thumbnails')
+    post_save.connect(make_photo_thumbnails, sender=Patient, dispatch_uid='patient-photo-thumbnails')
+
+
+def file_name(value):
+    return getattr(value, 'name', value) or ''
+
+
+def remember_blob_names(sender, instance, **kwargs):
+    # the raw column values, without creating FieldFiles; a deferred field is unknown (None)
+    instance._blob_names = {
+        field_name: file_name(instance.__dict__[field_name]) if field_name in instance.__dict__ else None
+        for field_name in sender._blob_fields
+    }
+
+
+def count_blob_references(sender, instance, created, update_fields=None, **kwargs):
+    for field_name in sender._blob_fields:
+        if update_fields is not None and field_name not in update_fields:
+            continue
+        old = '' if created else instance._blob_names.get(field_name)
+        new = file_name(instance.__dict__.get(field_name))
+        if old is None or old == new:   # unknown or unchanged
+            instance._blob_names[field_name] = new
+            continue
+        if old:
+            remove_reference(old)
+        if new:
+            add_reference(new)
+        instance._blob_names[field_name] = new
+
+
+def release_blob_references(sender, instance, **kwargs):
+    for field_name in sender._blob_fields:
+        name = file_name(instance.__dict__.get(field_name))
+        if name:
+            remove_reference(name)
+
+
+def connect_blob_references():
+    """
+    Keeps Blob.refcount in step with the rows referencing each blob (see
+    storage.py). The names loaded with a row are remembered, so a save only
+    costs queries when a file actually changed. Bulk writes send no signals;
+    collect_blobs --recount repairs the counts after them.
+    """
+    fields = {}
+    for label, field_name in BLOB_FIELDS:
+        fields.setdefault(apps.get_model(label), []).append(field_name)
+    for model, field_names in fields.items():
+        model._blob_fields = field_names
+        uid = model._meta.label_lower
+        post_init.connect(remember_blob_names, sender=model, dispatch_uid=f'blob-names-{uid}')
+        post_save.connect(count_blob_references, sender=model, dispatch_uid=f'blob-references-{uid}')
+        post_delete.connect(release_blob_references, sender=model, dispatch_uid=f'blob-release-{uid}')
+
+
+def remember_audit_values(sender, instance, **kwargs):
+    instance._audit_values = audit.snapshot(instance)
+
+
+def log_audit_save(sender, instance, created, update_fields=None, **kwargs):
+    values = audit.snapshot(instance)
+    if created:
+        audit.log_change('create', instance, audit.diff({}, values))
+    else:
+        if update_fields is not None:
+            saved = {sender._meta.get_field(name).attname for name in update_fields}
+            values = {name: value for name, value in values.items() if name in saved}
+        changes = audit.diff(instance._audit_values, values)
+        if changes:
+            audit.log_change('update', instance, changes)
+    instance._audit_values.update(values)
+
+
+def log_audit_delete(sender, instance, **kwargs):
+    audit.log_change('delete', instance, {name: [value, None] for name, value in instance._audit_values.items()})
+
+
+def connect_audit_log():
+    """
+    Logs every save and delete of the audited models with its field diff (see
+    audit.py). The values loaded with a row are remembered, so the diff costs
+    no query. Bulk writes send no signals and log themselves.
+    """
+    for label in audit.AUDITED_MODELS:
+        model = apps.get_model(label)
+        uid = model._meta.label_lower
+        post_init.connect(remember_audit_values, sender=model, dispatch_uid=f'audit-values-{uid}')
+        post_save.connect(log_audit_save, sender=model, dispatch_uid=f'audit-save-{uid}')
+        post_delete.connect(log_audit_delete, sender=model, dispatch_uid=f'audit-delete-{uid}')
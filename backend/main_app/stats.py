@@ -0,0 +1,80 @@
+"""
+Dashboard aggregates served by /api/stats/.
+
+The counts come from PostgreSQL materialized views (migration 0016), so a
+request reads a few small, indexed tables however many diagnoses and tests
+there are. `python manage.py refresh_stats` (run it from cron) refreshes them
+CONCURRENTLY: each refresh rebuilds the view beside the old one and swaps in
+the changed rows, so dashboards keep reading while it runs. Ward occupancy
+needs no view, WardOccupancy is already kept up to date as beds change (see
+beds.py).
+"""
+import datetime
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import StatsRefresh, WardOccupancy
+from .serializers import WardOccupancySerializer
+
+
+VIEWS = [
+    'main_app_stats_doctor_daily',
+    'main_app_stats_department_patients',
+    'main_app_stats_pending_tests',
+]
+
+DEFAULT_DAYS = 7
+MAX_DAYS = 90
+
+
+def refresh_stats():
+    """
+    Refreshes every view, recording when and how long each took. Returns the
+    StatsRefresh rows.
+    """
+    refreshes = []
+    for view in VIEWS:
+        started = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {connection.ops.quote_name(view)}')
+            refresh, _ = StatsRefresh.objects.update_or_create(view=view, defaults={
+                'refreshed_at': timezone.now(),
+                'duration_ms': round((time.perf_counter() - started) * 1000),
+            })
+        refreshes.append(refresh)
+    return refreshes
+
+
+def fetch(sql, params=()):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column.name for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def get_stats(days=DEFAULT_DAYS):
+    """
+    Every aggregate, with diagnoses per doctor for the last `days` days (today
+    included). `refreshed_at` is the oldest refresh of the views, None before
+    the first one.
+    """
+    since = timezone.localdate() - datetime.timedelta(days=days - 1)
+    refreshes = [refresh.refreshed_at for refresh in StatsRefresh.objects.filter(view__in=VIEWS)]
+    occupancy = WardOccupancy.objects.select_related('ward').order_by('ward_id')
+    return {
+        'refreshed_at': min(refreshes) if len(refreshes) == len(VIEWS) else None,
+        'diagnoses_per_doctor_per_day': fetch(
+            'SELECT doctor_id, doctor_name, day, diagnoses FROM main_app_stats_doctor_daily '
+            'WHERE day >= %s ORDER BY day, doctor_id', [since],
+        ),
+        'patients_per_department': fetch(
+            'SELECT department_id, name, doctors, patients FROM main_app_stats_department_patients '
+            'ORDER BY department_id'
+        ),
+        'pending_tests_per_category': fetch(
+            'SELECT test_category, pending FROM main_app_stats_pending_tests ORDER BY test_category'
+        ),
+        'ward_occupancy': WardOccupancySerializer(occupancy, many=True).data,
+    }
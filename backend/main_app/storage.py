@@ -0,0 +1,227 @@
+"""
+Content-addressed storage for the uploaded photos and result files.
+
+A file saved through ContentAddressedStorage is stored under the SHA-256 of
+its content, in the directory its field uploads to:
+
+    images/3f/3fa1...c9.jpg
+    test_results/9b/9b07...e2.pdf
+
+so the same photo PUT again, or the same report attached to ten tests, is one
+file on disk and one write: when the blob already exists the upload is only
+read (hashed), never written. New blobs are written beside their final name
+and renamed into place, so a blob is always complete.
+
+Every blob has a Blob row counting the rows that reference it (BLOB_FIELDS),
+kept up to date by main_app.signals when those rows are saved or deleted.
+`python manage.py collect_blobs` deletes the blobs nothing references any
+more, once unused for BLOB_GC_GRACE seconds (an upload whose row is not
+committed yet is not garbage); `--recount` first recounts the references from
+the tables, for rows changed by bulk writes, which send no signals. The Blob
+row is written in the transaction of the save, so a save that rolls back
+leaves a file without one; collect_blobs deletes those files, and the
+temporary files of saves that crashed, once BLOB_GC_GRACE old too.
+
+Files saved before this storage, under their upload names, are left alone.
+"""
+import datetime
+import hashlib
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+from edp.media import SignedMediaStorage
+
+
+# The file fields stored as blobs, as (model label, field name)
+BLOB_FIELDS = [
+    ('main_app.Doctor', 'profile_photo'),
+    ('main_app.Patient', 'profile_photo'),
+    ('main_app.TestPrescribed', 'test_result_files'),
+]
+
+
+def content_digest(content):
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+    return hasher.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(SignedMediaStorage):
+    def get_available_name(self, name, max_length=None):
+        return name   # the name is replaced by the digest in _save
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        # uploads.PartialFile knows its digest already
+        digest = getattr(content, 'sha256', None) or content_digest(content)
+        directory, filename = os.path.split(name)
+        name = f'{directory}/{digest[:2]}/{digest}{os.path.splitext(filename)[1].lower()}'
+
+        with transaction.atomic():
+            # Held until the caller's transaction ends, so that collect_blobs
+            # never takes the file for one without a row meanwhile
+            lock_blob(name)
+            # Touching the row first makes a concurrent collect_blobs, which holds
+            # it locked while deleting, finish before the file is checked
+            if Blob.objects.filter(name=name).update(last_used=timezone.now()) and self.exists(name):
+                return name
+
+            temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+            os.replace(self.path(temporary), self.path(name))
+            Blob.objects.update_or_create(name=name, defaults={'size': self.size(name), 'last_used': timezone.now()})
+        return name
+
+
+def lock_blob(name):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'blob:{name}'])
+
+
+def get_blob_storage():
+    return blob_storage
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def get_model_fields():
+    from django.apps import apps
+    return [(apps.get_model(label), field_name) for label, field_name in BLOB_FIELDS]
+
+
+def add_reference(name):
+    from .models import Blob
+    Blob.objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+
+def remove_reference(name):
+    from .models import Blob
+    Blob.objects.filter(name=name).update(refcount=Greatest(F('refcount') - 1, 0), last_used=timezone.now())
+
+
+def is_referenced(name):
+    return any(model._default_manager.filter(**{field_name: name}).exists() for model, field_name in get_model_fields())
+
+
+def recount_references():
+    """
+    Sets every blob's refcount to the rows that reference it, archived rows
+    included (see partitions.py). Returns how many were off.
+    """
+    from .models import Blob
+    from .partitions import archived_files
+
+    counts = archived_files()
+    for model, field_name in get_model_fields():
+        rows = model._default_manager.exclude(**{field_name: ''}).values_list(field_name).annotate(Count('pk'))
+        for name, count in rows:
+            if name:
+                counts[name] = counts.get(name, 0) + count
+
+    fixed = []
+    for blob in Blob.objects.only('name', 'refcount').iterator():
+        if blob.refcount != counts.get(blob.name, 0):
+            blob.refcount = counts.get(blob.name, 0)
+            fixed.append(blob)
+    Blob.objects.bulk_update(fixed, ['refcount'], batch_size=1000)
+    return len(fixed)
+
+
+def collect_blobs(grace=None):
+    """
+    Deletes the blobs with no reference left, unused for `grace` seconds
+    (default BLOB_GC_GRACE), with their thumbnails. Each is checked against the
+    tables once more under a lock, so a reference the counts missed keeps it.
+    Returns (deleted blobs, bytes freed).
+    """
+    from . import images
+    from .models import Blob
+
+    grace = grace if grace is not None else getattr(settings, 'BLOB_GC_GRACE', 60 * 60)
+    cutoff = timezone.now() - datetime.timedelta(seconds=grace)
+    deleted = freed = 0
+    for name in Blob.objects.filter(refcount=0, last_used__lt=cutoff).values_list('name', flat=True).iterator():
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update(skip_locked=True).filter(
+                name=name, refcount=0, last_used__lt=cutoff,
+            ).first()
+            if blob is None:   # used again meanwhile
+                continue
+            if is_referenced(name):
+                add_reference(name)   # recount_references() sets the exact count
+                continue
+            blob_storage.delete(name)
+            for thumbnail in images.thumbnail_names(name):
+                blob_storage.delete(thumbnail)
+            blob.delete()
+        deleted += 1
+        freed += blob.size
+
+    orphans, orphan_bytes = collect_orphan_files(cutoff)
+    return deleted + orphans, freed + orphan_bytes
+
+
+# A blob's name, or the name of one being written, in its field's directory
+BLOB_NAME = re.compile(r'[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?(\.[0-9a-f]{32}\.tmp)?')
+TEMPORARY_SUFFIX = re.compile(r'\.[0-9a-f]{32}\.tmp$')
+
+
+def get_blob_directories():
+    return sorted({model._meta.get_field(field_name).upload_to.strip('/') for model, field_name in get_model_fields()})
+
+
+def collect_orphan_files(cutoff):
+    """
+    Deletes the blob files last written before `cutoff` that have no Blob row:
+    saved in a transaction that rolled back, or left behind by a crash. Files
+    outside the blob layout (saved before this storage) are left alone.
+    Returns (deleted files, bytes freed).
+    """
+    from . import images
+    from .models import Blob
+
+    candidates = {}
+    for directory in get_blob_directories():
+        root = blob_storage.path(directory)
+        for path, _, filenames in os.walk(root):
+            for filename in filenames:
+                relative = os.path.relpath(os.path.join(path, filename), root).replace(os.sep, '/')
+                if BLOB_NAME.fullmatch(relative):
+                    candidates[f'{directory}/{relative}'] = os.path.join(path, filename)
+    candidates = {name: path for name, path in candidates.items() if is_older(path, cutoff)}
+    rows = set(Blob.objects.filter(name__in=candidates).values_list('name', flat=True))
+
+    deleted = freed = 0
+    for name, path in candidates.items():
+        if name in rows:
+            continue
+        with transaction.atomic():
+            lock_blob(TEMPORARY_SUFFIX.sub('', name))   # a temporary file is written under its blob's lock
+            if not is_older(path, cutoff) or Blob.objects.filter(name=name).exists() or is_referenced(name):
+                continue   # written, saved or referenced again meanwhile
+            size = os.path.getsize(path)
+            blob_storage.delete(name)
+            if not name.endswith('.tmp'):
+                for thumbnail in images.thumbnail_names(name):
+                    blob_storage.delete(thumbnail)
+        deleted += 1
+        freed += size
+    return deleted, freed
+
+
+def is_older(path, cutoff):
+    try:
+        return datetime.datetime.fromtimestamp(os.stat(path).st_mtime, datetime.timezone.utc) < cutoff
+    except FileNotFoundError:
+        return False
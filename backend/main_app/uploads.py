@@ -0,0 +1,264 @@
+"""
+Chunked, resumable uploads of TestPrescribed.test_result_files (scans, DICOM
+bundles, reports of hundreds of MB).
+
+    POST   /api/tests/<id>/uploads/   {"filename": ..., "size": bytes, "sha256": optional hex digest}
+    PATCH  /api/uploads/<id>/         Upload-Offset: <bytes sent so far>, the next chunk as the raw body
+                                      (Content-Type: application/offset+octet-stream)
+    GET    /api/uploads/<id>/         where to resume (`received`, also the Upload-Offset header)
+    DELETE /api/uploads/<id>/         abort
+
+Every chunk is streamed from the request to a partial file under
+MEDIA_ROOT/uploads/ in RESULT_UPLOAD_BLOCK_SIZE blocks, so a worker holds one
+block whatever the size of the chunk or the file, and fsynced before the
+new offset is saved: after a crash or a dropped connection, GET tells the
+client where to resume and nothing before that is lost. A chunk must start
+where the last one ended (409 otherwise, with the current offset). Appends to
+one upload are serialized with a lock on its partial file, not a database
+transaction held for the length of the transfer.
+
+A SHA-256 of the file is computed as the chunks arrive. The hasher stays in
+the worker's memory between chunks; once a chunk lands on another worker (or
+after a restart) the rest are written without one, and the finished file is
+hashed in a single read, rather than read again for every chunk. When the last
+byte arrives the digest is checked against the one given up front, and the
+file is moved (renamed) into the storage and set on the TestPrescribed in one
+transaction, so the row never points to a half-written file. The storage is
+content addressed (see storage.py): a file it holds already is not stored
+twice.
+
+`python manage.py clear_stale_uploads` aborts uploads that have not moved for
+RESULT_UPLOAD_EXPIRY seconds and removes their partial files.
+"""
+import datetime
+import fcntl
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ResultUpload, TestPrescribed
+
+
+UPLOAD_DIR = 'uploads'
+
+# Hashers of uploads in progress kept by this process, at most this many
+MAX_CACHED_HASHERS = 1000
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=409):
+        super().__init__(message)
+        self.status = status
+
+
+def get_block_size():
+    return getattr(settings, 'RESULT_UPLOAD_BLOCK_SIZE', 1024 * 1024)
+
+
+def get_max_chunk_size():
+    return getattr(settings, 'RESULT_UPLOAD_MAX_CHUNK_SIZE', 64 * 1024 * 1024)
+
+
+def partial_path(upload):
+    return os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR, f'{upload.pk}.part')
+
+
+_hashers = {}   # upload id -> (bytes hashed, hasher)
+_hashers_lock = threading.Lock()
+
+
+def get_hasher(upload):
+    """
+    The SHA-256 of the first `upload.received` bytes this process kept after
+    the previous chunk, None if that chunk was written elsewhere: then the
+    finished file is hashed (hash_file) instead.
+    """
+    with _hashers_lock:
+        cached = _hashers.pop(upload.pk, None)
+    if cached is not None and cached[0] == upload.received:
+        return cached[1]
+    return hashlib.sha256() if upload.received == 0 else None
+
+
+def hash_file(file, length):
+    """
+    The SHA-256 of the first `length` bytes of `file`, read a block at a time.
+    """
+    hasher = hashlib.sha256()
+    file.seek(0)
+    remaining = length
+    while remaining > 0:
+        block = file.read(min(get_block_size(), remaining))
+        if not block:
+            raise UploadError('The partial file is shorter than the bytes received.', status=500)
+        hasher.update(block)
+        remaining -= len(block)
+    return hasher
+
+
+def keep_hasher(upload, hasher):
+    with _hashers_lock:
+        if len(_hashers) >= MAX_CACHED_HASHERS:
+            _hashers.pop(next(iter(_hashers)))   # the oldest
+        _hashers[upload.pk] = (upload.received, hasher)
+
+
+def forget_hasher(upload):
+    with _hashers_lock:
+        _hashers.pop(upload.pk, None)
+
+
+class locked_partial_file:
+    """
+    Opens (creating) the partial file of `upload` with an exclusive lock;
+    UploadError if another request holds it.
+    """
+    def __init__(self, upload):
+        self.path = partial_path(upload)
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            raise UploadError('Another chunk of this upload is being written.')
+        return self.file
+
+    def __exit__(self, *exc_info):
+        self.file.close()   # releases the lock
+
+
+class PartialFile(File):
+    """
+    The finished partial file, which the storage moves into place instead of
+    copying, and its digest, which it need not compute again.
+    """
+    def __init__(self, path, name, sha256):
+        super().__init__(open(path, 'rb'), name)
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def append(upload, offset, stream, length):
+    """
+    Writes the `length` bytes of `stream` at `offset` of the upload. A short
+    stream (the client went away) keeps what arrived. Completes the upload on
+    its last byte. Returns the upload, updated.
+    """
+    if upload.status != 'uploading':
+        raise UploadError(f'The upload is {upload.status}.')
+    if length > get_max_chunk_size():
+        raise UploadError(f'Send at most {get_max_chunk_size()} bytes per chunk.', status=413)
+
+    with locked_partial_file(upload) as file:
+        upload.refresh_from_db(fields=['received', 'status', 'sha256'])
+        if upload.status != 'uploading':
+            raise UploadError(f'The upload is {upload.status}.')
+        if offset != upload.received:
+            raise UploadError(f'The upload is at offset {upload.received}.')
+        if offset + length > upload.size:
+            raise UploadError(f'The chunk ends past the declared size of {upload.size} bytes.', status=400)
+
+        hasher = get_hasher(upload)
+        file.seek(offset)
+        file.truncate()   # drops whatever an interrupted chunk left past the offset
+        remaining = length
+        while remaining > 0:
+            block = stream.read(min(get_block_size(), remaining))
+            if not block:
+                break
+            file.write(block)
+            if hasher is not None:
+                hasher.update(block)
+            remaining -= len(block)
+        file.flush()
+        os.fsync(file.fileno())
+
+        upload.received = offset + length - remaining
+        ResultUpload.objects.filter(pk=upload.pk).update(received=upload.received, updated_at=timezone.now())
+        if upload.received < upload.size:
+            if hasher is not None:
+                keep_hasher(upload, hasher)
+            return upload
+
+        forget_hasher(upload)
+        if hasher is None:
+            hasher = hash_file(file, upload.received)
+        complete(upload, hasher.hexdigest())
+    return upload
+
+
+def complete(upload, digest):
+    """
+    Checks the digest and attaches the partial file to the test, or fails the
+    upload.
+    """
+    path = partial_path(upload)
+    if upload.sha256 and digest != upload.sha256:
+        os.remove(path)
+        fail(upload, f'SHA-256 mismatch: received {digest}.')
+        raise UploadError('The file does not match its SHA-256, upload it again.', status=400)
+
+    field = TestPrescribed._meta.get_field('test_result_files')
+    with transaction.atomic():
+        test = TestPrescribed.objects.select_for_update().get(pk=upload.test_id)
+        content = PartialFile(path, upload.filename, digest)
+        try:
+            name = field.storage.save(field.generate_filename(test, upload.filename), content)
+        finally:
+            content.close()
+            if os.path.exists(path):   # the storage had the content already
+                os.remove(path)
+        # should this fail, the Blob row rolls back too and collect_blobs deletes the file
+        test.test_result_files = name
+        test.save(update_fields=['test_result_files', 'updated_at'])
+        upload.status, upload.sha256 = 'completed', digest
+        upload.save(update_fields=['status', 'sha256', 'updated_at'])
+
+
+def fail(upload, error):
+    upload.status, upload.error = 'failed', error
+    upload.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def abort(upload):
+    """
+    Stops an upload in progress and removes its partial file.
+    """
+    if upload.status != 'uploading':
+        raise UploadError(f'The upload is {upload.status}.')
+    with locked_partial_file(upload):
+        upload.refresh_from_db(fields=['status'])
+        if upload.status != 'uploading':
+            raise UploadError(f'The upload is {upload.status}.')
+        os.remove(partial_path(upload))
+        forget_hasher(upload)
+        upload.status = 'aborted'
+        upload.save(update_fields=['status', 'updated_at'])
+
+
+def clear_stale_uploads(expiry=None):
+    """
+    Aborts the uploads not written to for `expiry` seconds (default
+    RESULT_UPLOAD_EXPIRY). Returns how many.
+    """
+    expiry = expiry if expiry is not None else getattr(settings, 'RESULT_UPLOAD_EXPIRY', 24 * 60 * 60)
+    cutoff = timezone.now() - datetime.timedelta(seconds=expiry)
+    cleared = 0
+    for upload in ResultUpload.objects.filter(status='uploading', updated_at__lt=cutoff):
+        try:
+            abort(upload)
+        except UploadError:   # a chunk is being written after all, or it finished meanwhile
+            continue
+        cleared += 1
+    return cleared
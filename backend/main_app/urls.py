@@ -4,13 +4,13 @@ from .views import (
     get_create_departments, get_update_delete_department, get_doctors_in_department,
     
     # Doctors
-    get_create_doctors, get_update_delete_doctor, get_diagnoses_for_doctor,
+    get_create_doctors, get_search_doctors, get_update_delete_doctor, get_diagnoses_for_doctor,
     create_update_diagnosis,
     create_update_prescription_detials,
     create_update_tests_prescribed,
     
     # Patients
-    get_create_patients, get_update_delete_patient, get_diagnoses_for_patient, get_diagnosis_for_patient,
+    get_create_patients, get_search_patients, get_update_delete_patient, get_diagnoses_for_patient, get_diagnosis_for_patient,
     
     # Medical Tests
     get_create_medical_tests, get_update_delete_medical_test,
@@ -18,12 +18,23 @@ from .views import (
     # Rooms & Beds
     # get_all_room_bed_details, get_room_bed_details,
     get_wards, create_ward, get_rooms, create_room, get_beds, create_beds, update_bed,
+    allocate_bed, get_ward_availability,
     
     # Allotments
     # get_all_allotments, get_patient_allotment, create_allotment, delete_allotment,
+    discharge_allotment,
 
 
-    create_full_diagnosis, get_full_diagnosis_details
+    # Stats, Exports & Imports
+    get_stats, get_export, create_import, get_import,
+
+    # Lab queue
+    claim_lab_tests, release_lab_test,
+
+    # Result uploads
+    create_result_upload, get_append_delete_result_upload,
+
+    create_full_diagnosis, get_full_diagnosis_details, get_diagnoses
 )
 
 urlpatterns = [
@@ -34,6 +45,7 @@ urlpatterns = [
 
     # Doctors
     path('doctors/', get_create_doctors, name='get_create_doctors'),
+    path('doctors/search/', get_search_doctors, name='get_search_doctors'),
     path('doctors/<int:doctor_id>/', get_update_delete_doctor, name='get_update_delete_doctor'),
     path('doctors/<int:doctor_id>/diagnoses/', get_diagnoses_for_doctor, name='get_diagnoses_for_doctor'),
     path('doctors/<int:doctor_id>/diagnoses/<int:patient_id>/', create_update_diagnosis, name='create_diagnosis'),
@@ -44,18 +56,20 @@ urlpatterns = [
     # path('doctors/<doctor_id>/tests/<patient_id>/<test_prescribed_id>/', create_update_tests_prescribed, name='update_tests_prescribed'),
 
     # Diagnoses
+    path('diagnoses/', get_diagnoses, name='get_diagnoses'),
     path('diagnoses/<int:diagnosis_id>/tests/', create_update_tests_prescribed, name='create_update_tests_prescribed'),
     path('diagnoses/<int:diagnosis_id>/tests/<int:test_prescribed_id>/', create_update_tests_prescribed, name='update_tests_prescribed'),
     
     # Patients
     path('patients/', get_create_patients, name='get_create_patients'),
+    path('patients/search/', get_search_patients, name='get_search_patients'),
     path('patients/<int:patient_id>/', get_update_delete_patient, name='get_update_delete_patient'),
     path('patients/<int:patient_id>/diagnoses/', get_diagnoses_for_patient, name='get_diagnoses_for_patient'),
     path('patients/<int:patient_id>/diagnoses/<int:diagnosis_id>/', get_diagnosis_for_patient, name='get_diagnosis_for_patient'),
 
     # Medical Tests
     path('medical-tests/', get_create_medical_tests, name='get_create_medical_tests'),
-    path('medical-tests/<int:medical_test_id>/', get_update_delete_medical_test, name='get_update_delete_medical_test'),
+    path('medical-tests/<str:medical_test_id>/', get_update_delete_medical_test, name='get_update_delete_medical_test'),
 
     # Ward, Room & Bed Management
     path('wards/', get_wards, name='get_wards'),
@@ -67,12 +81,33 @@ urlpatterns = [
     path('beds/', get_beds, name='get_beds'),
     path('beds/create/', create_beds, name='create_bed'),
     path('beds/<int:bed_id>/', update_bed, name='update_bed'),
+    path('beds/allocate/', allocate_bed, name='allocate_bed'),
+    path('wards/availability/', get_ward_availability, name='get_ward_availability'),
 
     # Allotments
     # path('allotments/', get_all_allotments, name='get_all_allotments'),
     # path('allotments/<int:patient_id>/', get_patient_allotment, name='get_patient_allotment'),
     # path('allotments/create/', create_allotment, name='create_allotment'),
     # path('allotments/<int:allotment_id>/', delete_allotment, name='delete_allotment'),
+    path('allotments/<int:allotment_id>/discharge/', discharge_allotment, name='discharge_allotment'),
+
+    # Stats
+    path('stats/', get_stats, name='get_stats'),
+
+    # Exports
+    path('exports/<slug:name>/', get_export, name='get_export'),
+
+    # Imports
+    path('imports/<int:import_id>/', get_import, name='get_import'),
+    path('imports/<slug:kind>/', create_import, name='create_import'),
+
+    # Lab queue
+    path('lab/queue/claim/', claim_lab_tests, name='claim_lab_tests'),
+    path('lab/queue/<int:test_prescribed_id>/release/', release_lab_test, name='release_lab_test'),
+
+    # Result uploads
+    path('tests/<int:test_prescribed_id>/uploads/', create_result_upload, name='create_result_upload'),
+    path('uploads/<int:upload_id>/', get_append_delete_result_upload, name='get_append_delete_result_upload'),
 
     # APIS FOR THE DOCTOR FLOW IN FRONTEND
     path('create-full-diagnosis/', create_full_diagnosis, name='create_full_diagnosis'),
@@ -9,6 +9,15 @@ from django.db import transaction
 
 from rest_framework.permissions import IsAuthenticated
 from .permissions import IsAdminUser, IsDoctorUser, IsPatientUser, IsStaffUser
+from .pagination import paginated_response, apaginated_response, list_response
+from .async_api import async_api_view
+from .cache import cached_catalog
+from .bulk import is_bulk_request, bulk_create_response
+from .search import get_search_params, search
+from .array_filters import filter_arrays
+from .exports import export_response
+from . import audit, imports, lab_queue, stats, uploads
+from . import beds
 
 from .models import *
 from .serializers import *
@@ -19,6 +28,7 @@ from .serializers import *
 # /api/departments/
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated, IsAdminUser])  # Only Admin can access this
+@cached_catalog('departments')
 def get_create_departments(request):
     """
     GET: List all departments
@@ -26,8 +36,7 @@ def get_create_departments(request):
     """
     if (request.method == 'GET'):
         departments = Department.objects.all()
-        serializer = DepartmentSerializer(departments, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return list_response(request, departments, DepartmentSerializer)
     
     elif (request.method == 'POST'):
             if isinstance(request.data, list):
@@ -80,8 +89,7 @@ def get_doctors_in_department(request, department_id):
     GET: List all doctors in a department
     """
     doctors = Doctor.objects.filter(department_id=department_id)
-    serializer = DoctorSerializer(doctors, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return list_response(request, doctors, DoctorSerializer)
 
 
 ######################################################### DOCTOR VIEWS #######################################################################
@@ -92,14 +100,18 @@ def get_doctors_in_department(request, department_id):
 def get_create_doctors(request):
     """
     GET: List all doctors
+         ?specializations= / ?qualifications= filter on the arrays (see array_filters.py)
     POST: Create new doctor(s)
+          ?bulk=true with a list validates all rows, then inserts them with bulk_create
     """
     if (request.method == 'GET'):
-        doctors = Doctor.objects.all()
-        serializer = DoctorSerializer(doctors, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        doctors = filter_arrays(request, Doctor.objects.all(), ['specializations', 'qualifications'])
+        return paginated_response(request, doctors, DoctorSerializer)
     
     elif (request.method == 'POST'):
+        if is_bulk_request(request):
+            return bulk_create_response(request, DoctorSerializer)
+
         if isinstance(request.data, list):
             serializer = DoctorSerializer(data=request.data, many=True)
         else:
@@ -112,6 +124,19 @@ def get_create_doctors(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Search doctors by name, phone number or aadhaar
+# /api/doctors/search/?q=<query>
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only Staff can access this
+def get_search_doctors(request):
+    """
+    GET: The best matches for ?q= (at least 3 characters), best first
+         ?limit= caps the results (default 20, at most 50)
+    """
+    q, limit = get_search_params(request)
+    return list_response(request, search(Doctor.objects.all(), q, limit), DoctorSerializer)
+
+
 # Retrieve / Update / Delete a doctor
 # /api/doctors/<doctor_id>/
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
@@ -188,7 +213,7 @@ def create_update_diagnosis(request, doctor_id, patient_id, diagnosis_id=None):
 #update /api/doctors/<doctor_id>/prescriptions/<patient_id>/<prescription_id>/
 @api_view(['POST', 'PUT', 'PATCH'])
 @permission_classes([IsAuthenticated, IsDoctorUser])   # Only Doctors can access this
-def create_update_prescription_detials(request, prescription_id=None):
+def create_update_prescription_detials(request, doctor_id=None, patient_id=None, prescription_id=None):
     """
     POST: Create new prescription details
     PUT: Update an existing prescription detail
@@ -222,10 +247,14 @@ def create_update_prescription_detials(request, prescription_id=None):
 def create_update_tests_prescribed(request, diagnosis_id=None, test_prescribed_id=None):
     """
     POST: Create new test(s) for a diagnosis
+          ?bulk=true with a list validates all rows, then inserts them with bulk_create
     PUT/PATCH: Update a specific test
     """
 
     if request.method == 'POST':
+        if is_bulk_request(request):
+            return bulk_create_response(request, TestPrescribedSerializer)
+
         is_bulk = isinstance(request.data, list)
         serializer = TestPrescribedSerializer(
             data=request.data,
@@ -267,14 +296,18 @@ def create_update_tests_prescribed(request, diagnosis_id=None, test_prescribed_i
 def get_create_patients(request):
     """
     GET: List all patients
+         ?allergies= / ?disabilities_or_diseases= filter on the arrays (see array_filters.py)
     POST: Create new patient(s)
+          ?bulk=true with a list validates all rows, then inserts them with bulk_create
     """
     if (request.method == 'GET'):
-        patients = Patient.objects.filter(status='active')
-        serializer = PatientSerializer(patients, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        patients = filter_arrays(request, Patient.objects.filter(status='active'), ['allergies', 'disabilities_or_diseases'])
+        return paginated_response(request, patients, PatientSerializer)
     
     elif (request.method == 'POST'):
+        if is_bulk_request(request):
+            return bulk_create_response(request, PatientSerializer)
+
         if isinstance(request.data, list):
             serializer = PatientSerializer(data=request.data, many=True)
         else:
@@ -287,6 +320,19 @@ def get_create_patients(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
+# Search active patients by name, phone number or aadhaar
+# /api/patients/search/?q=<query>
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only Staff can access this
+def get_search_patients(request):
+    """
+    GET: The best matches for ?q= (at least 3 characters), best first
+         ?limit= caps the results (default 20, at most 50)
+    """
+    q, limit = get_search_params(request)
+    return list_response(request, search(Patient.objects.filter(status='active'), q, limit), PatientSerializer)
+
+
 # Retrieve / Update / Delete a patient (soft delete by marking status as inactive)
 # /api/patients/<patient_id>/
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
@@ -339,14 +385,27 @@ def get_diagnosis_for_patient(request, patient_id, diagnosis_id):
     GET: Retrieve a specific diagnosis info for a patient with complete details,
     including prescriptions, associated prescription details and medical tests prescribed.
     """
-    get_object_or_404(Patient, id=patient_id) # ensure that the patient exists
-    diagnosis = get_object_or_404(Diagnosis, id=diagnosis_id, patient_id=patient_id) # ensure that the diagnosis exists
-    prescriptions = Prescription.objects.filter(diagnosis_id=diagnosis_id, patient_id=patient_id)
-    prescription_details = PrescriptionDetails.objects.filter(prescription_id__in=prescriptions)
+    # Everything hanging off the diagnosis is prefetched up front, so the endpoint runs a
+    # fixed number of queries no matter how many prescriptions, medicines or tests it has.
+    prescriptions = (
+        Prescription.objects
+        .filter(patient_id=patient_id)
+        .select_related('prescribed_by_doctor_id')
+        .prefetch_related(
+            Prefetch('prescriptiondetails_set', queryset=PrescriptionDetails.objects.order_by('id')),
+            Prefetch('testprescribed_set', queryset=TestPrescribed.objects.order_by('id')),
+        )
+        .order_by('id')
+    )
+    diagnosis = get_object_or_404(
+        Diagnosis.objects.prefetch_related(Prefetch('prescription_set', queryset=prescriptions)),
+        id=diagnosis_id,
+        patient_id=patient_id,
+    )
 
     prescriptions_data = []
-    for presc in prescriptions:
-        related_details = prescription_details.filter(prescription_id=presc.id) # type: ignore
+    tests_prescribed = []
+    for presc in diagnosis.prescription_set.all():
         prescriptions_data.append({
             "id": presc.id, # type: ignore
             "prescription_date": str(presc.prescription_date),
@@ -360,11 +419,10 @@ def get_diagnosis_for_patient(request, patient_id, diagnosis_id):
                     "dosage": detail.dosage,
                     "method": detail.method,
                     "duration": detail.duration
-                } for detail in related_details
+                } for detail in presc.prescriptiondetails_set.all()
             ]
         })
-
-    tests_prescribed = TestPrescribed.objects.filter(diagnosis_id=diagnosis_id, patient_id=patient_id)
+        tests_prescribed.extend(presc.testprescribed_set.all())
 
     data = {
         "diagnosis_data": {
@@ -379,10 +437,10 @@ def get_diagnosis_for_patient(request, patient_id, diagnosis_id):
             "tests": diagnosis.tests,
         },
         "prescriptions": prescriptions_data,
-        "tests_prescribed": tests_prescribed,
+        "tests_prescribed": TestPrescribedSerializer(tests_prescribed, many=True, context={'request': request}).data,
     }
 
-    return JsonResponse({"data": data}, status=status.HTTP_200_OK, safe=False)
+    return Response({"data": data}, status=status.HTTP_200_OK)
 
 
 
@@ -391,17 +449,21 @@ def get_diagnosis_for_patient(request, patient_id, diagnosis_id):
 # /api/medical-tests/
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated, IsAdminUser])   # Only admin can access this
+@cached_catalog('medical_tests')
 def get_create_medical_tests(request):
     """
     GET: List all medical tests
     POST: Create new medical test(s)
+          ?bulk=true with a list validates all rows, then inserts them with bulk_create
     """
     if (request.method == 'GET'):
         medical_tests = MedicalTest.objects.all()
-        serializer = MedicalTestSerializer(medical_tests, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginated_response(request, medical_tests, MedicalTestSerializer)
     
     elif (request.method == 'POST'):
+        if is_bulk_request(request):
+            return bulk_create_response(request, MedicalTestSerializer)
+
         if isinstance(request.data, list):
             serializer = MedicalTestSerializer(data=request.data, many=True)
         else:
@@ -425,7 +487,7 @@ def get_update_delete_medical_test(request, medical_test_id):
     PATCH: Partially update a medical test
     DELETE: Delete a medical test
     """
-    medical_test = get_object_or_404(MedicalTest, id=medical_test_id)
+    medical_test = get_object_or_404(MedicalTest, pk=medical_test_id)
 
     if (request.method == 'GET'):
         serializer = MedicalTestSerializer(medical_test)
@@ -481,10 +543,10 @@ def get_room_bed_details(request, bed_id):
 # /api/wards/
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+@cached_catalog('wards')
 def get_wards(request):
     wards = Ward.objects.all()
-    serializer = WardSerializer(wards, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return list_response(request, wards, WardSerializer)
 
 # Create a new ward
 # /api/wards/create/
@@ -502,10 +564,10 @@ def create_ward(request):
 # /api/rooms/
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+@cached_catalog('rooms')
 def get_rooms(request):
     rooms = Room.objects.all()
-    serializer = RoomSerializer(rooms, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return paginated_response(request, rooms, RoomSerializer)
 
 # Create a new room
 # /api/rooms/create/
@@ -525,8 +587,7 @@ def create_room(request):
 @permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
 def get_beds(request):
     beds = Bed.objects.all()
-    serializer = BedSerializer(beds, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return paginated_response(request, beds, BedSerializer)
 
 # Create a new bed
 # /api/beds/create/
@@ -535,31 +596,83 @@ def get_beds(request):
 def create_beds(request):
     """
     POST: Create one or more bed objects (accepts an array)
+          ?bulk=true with a list validates all rows, then inserts them with bulk_create
     """
     data = request.data
 
     # If it's a list, many=True; otherwise just a single object
     many = isinstance(data, list)
 
-    serializer = BedSerializer(data=data, many=many)
-    if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        if is_bulk_request(request):
+            response = bulk_create_response(request, BedSerializer)
+        else:
+            serializer = BedSerializer(data=data, many=many)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            serializer.save()
+            response = Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        if response.status_code == status.HTTP_201_CREATED:
+            room_ids = {bed.get('room') for bed in (data if many else [data])}
+            beds.recount_free_beds(list(Ward.objects.filter(room__in=room_ids).values_list('id', flat=True).distinct()))
+    return response
 
 # Update a specific bed
 # /api/beds/<bed_id>/
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
 def update_bed(request, bed_id):
-    bed = get_object_or_404(Bed, id=bed_id)
-    serializer = BedSerializer(bed, data=request.data, partial=True)
-    if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    with transaction.atomic():
+        bed = get_object_or_404(Bed.objects.select_for_update(of=('self',)).select_related('room'), id=bed_id)
+        old_ward_id, was_free = bed.room.ward_id, not bed.is_occupied
+
+        serializer = BedSerializer(bed, data=request.data, partial=True)
+        if serializer.is_valid():
+            bed = serializer.save()
+            beds.move_bed(old_ward_id, was_free, bed.room.ward_id, not bed.is_occupied)
+            return Response(serializer.data, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Find a free bed and admit a patient to it in one step
+# /api/beds/allocate/
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+def allocate_bed(request):
+    """
+    POST: Claim the first free bed of the requested ward/room type and create the allotment
+    """
+    serializer = BedAllocationSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        allotment = beds.allocate_bed(**serializer.validated_data)
+    except Patient.DoesNotExist:
+        return Response({"error": "Patient not found."}, status=status.HTTP_404_NOT_FOUND)
+    except beds.PatientAlreadyAdmitted:
+        return Response({"error": "Patient already has an active allotment."}, status=status.HTTP_409_CONFLICT)
+    except beds.NoBedAvailable:
+        return Response({"error": "No free bed matches the request."}, status=status.HTTP_409_CONFLICT)
+
+    response_data = {
+        "allotment": AllotmentSerializer(allotment).data,
+        "bed": BedSerializer(allotment.bed_id).data,
+    }
+    return Response(response_data, status=status.HTTP_201_CREATED)
+
+
+# Free beds per ward, read from the maintained counters
+# /api/wards/availability/
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+def get_ward_availability(request):
+    occupancy = WardOccupancy.objects.select_related('ward').order_by('ward_id')
+    serializer = WardOccupancySerializer(occupancy, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 # Get all allotments
 # /api/allotments/
 @api_view(['GET'])
@@ -569,8 +682,7 @@ def get_all_allotments(request):
     GET: Get all allotments
     """
     allotments = Allotment.objects.all()
-    serializer = AllotmentSerializer(allotments, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return list_response(request, allotments, AllotmentSerializer)
 
 
 # Get allotment details of a patient
@@ -622,6 +734,25 @@ def get_all_allotments(request):
 #     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Discharge a patient: close the allotment and free its bed
+# /api/allotments/<allotment_id>/discharge/
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+def discharge_allotment(request, allotment_id):
+    """
+    POST: Discharge the patient of an active allotment and mark the bed as free
+    """
+    serializer = DischargeSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        allotment = beds.discharge(allotment_id, **serializer.validated_data)
+    except Allotment.DoesNotExist:
+        return Response({"error": "Active allotment not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(AllotmentSerializer(allotment).data, status=status.HTTP_200_OK)
+
+
 # Delete an allotment
 # By deleting means deleting the particular allotment record plus marking the is_admitted field false in the roombed object linked with it
 # /api/allotments/<allotment_id>/
@@ -642,6 +773,175 @@ def get_all_allotments(request):
 #     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+########################################################### STATS VIEWS ########################################################################
+# Dashboard aggregates
+# /api/stats/
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])   # Only Admin can access this
+def get_stats(request):
+    """
+    GET: Diagnoses per doctor per day, patients per department, pending tests per
+         category and ward occupancy, as of the last refresh_stats (see stats.py)
+         ?days= how many days of diagnoses (default 7, at most 90)
+    """
+    try:
+        days = int(request.query_params.get('days', stats.DEFAULT_DAYS))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= stats.MAX_DAYS:
+        return Response({"days": [f"Must be a whole number between 1 and {stats.MAX_DAYS}."]}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(stats.get_stats(days), status=status.HTTP_200_OK)
+
+
+########################################################### EXPORT VIEWS #######################################################################
+# Stream a table as CSV / NDJSON
+# /api/exports/<name>/
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+def get_export(request, name):
+    """
+    GET: Stream every row of patients, diagnoses, prescriptions or prescription-details
+         ?output=csv|ndjson, ?from= / ?to= (YYYY-MM-DD, inclusive), ?gzip=true (see exports.py)
+    """
+    return export_response(request, name)
+
+
+########################################################### IMPORT VIEWS #######################################################################
+# Upload a CSV to import in the background
+# /api/imports/<kind>/
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])   # Only Admin can access this
+def create_import(request, kind):
+    """
+    POST: Import the CSV in `file` into medical-tests or patients (see imports.py)
+          Returns the import at once with 202; GET it for progress and row errors
+    """
+    if kind not in imports.IMPORTS:
+        return Response({"error": f"Unknown import, choose one of: {', '.join(imports.IMPORTS)}"}, status=status.HTTP_404_NOT_FOUND)
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({"file": ["Upload the CSV as `file`."]}, status=status.HTTP_400_BAD_REQUEST)
+
+    job = ImportJob.objects.create(kind=kind, source=upload.name, file=upload)
+    imports.start_import(job)
+    return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': f'/api/imports/{job.id}/'})
+
+
+# Progress and errors of an import
+# /api/imports/<import_id>/
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])   # Only Admin can access this
+def get_import(request, import_id):
+    """
+    GET: Retrieve an import, with its counts so far and the first row errors
+    """
+    job = get_object_or_404(ImportJob, id=import_id)
+    return Response(ImportJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
+########################################################### LAB QUEUE VIEWS ####################################################################
+# Claim the next pending tests for a lab bench
+# /api/lab/queue/claim/
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+def claim_lab_tests(request):
+    """
+    POST: Claim the next pending tests, in the order they are due (see lab_queue.py)
+          ?limit= how many (default 10, at most 50), ?category= only this test category
+          ?wait= seconds to wait for a test when none is pending (default 0, at most LAB_QUEUE_MAX_WAIT)
+          Returns the claimed tests, an empty list if none came in
+    """
+    errors = {}
+    try:
+        limit = int(request.query_params.get('limit', lab_queue.DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= lab_queue.MAX_LIMIT:
+        errors['limit'] = [f"Must be a whole number between 1 and {lab_queue.MAX_LIMIT}."]
+    max_wait = lab_queue.get_max_wait()
+    try:
+        wait = float(request.query_params.get('wait', 0))
+    except ValueError:
+        wait = -1
+    if not 0 <= wait <= max_wait:
+        errors['wait'] = [f"Must be a number of seconds between 0 and {max_wait}."]
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    tests = lab_queue.claim_or_wait(request.user, limit, request.query_params.get('category'), wait)
+    audit.log_reads(TestPrescribed, [test.pk for test in tests])
+    return Response(TestPrescribedSerializer(tests, many=True).data, status=status.HTTP_200_OK)
+
+
+# Give a claimed test back to the queue
+# /api/lab/queue/<test_prescribed_id>/release/
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+def release_lab_test(request, test_prescribed_id):
+    """
+    POST: Release your claim on a pending test, so another bench can claim it
+    """
+    test = get_object_or_404(TestPrescribed, id=test_prescribed_id)
+    if not lab_queue.release(test, request.user):
+        return Response({"error": "You have not claimed this test, or it is no longer pending."}, status=status.HTTP_409_CONFLICT)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+########################################################### RESULT UPLOAD VIEWS ################################################################
+# Start a chunked upload of a test's result file
+# /api/tests/<test_prescribed_id>/uploads/
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+def create_result_upload(request, test_prescribed_id):
+    """
+    POST: Start uploading the result file of a test: filename, size in bytes and
+          optionally its sha256; then PATCH the chunks to the upload (see uploads.py)
+    """
+    test = get_object_or_404(TestPrescribed, id=test_prescribed_id)
+    serializer = ResultUploadSerializer(data=request.data)
+    if serializer.is_valid():
+        upload = serializer.save(test=test, created_by=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED,
+                        headers={'Location': f'/api/uploads/{upload.id}/', 'Upload-Offset': '0'})
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+# Resume, append to or abort a chunked upload
+# /api/uploads/<upload_id>/
+@api_view(['GET', 'PATCH', 'DELETE'])
+@permission_classes([IsAuthenticated, IsStaffUser])   # Only staff can access this
+def get_append_delete_result_upload(request, upload_id):
+    """
+    GET: Retrieve an upload; `received` (and the Upload-Offset header) is where to resume
+    PATCH: Append the raw body at the Upload-Offset header, which must equal `received`
+    DELETE: Abort the upload
+    """
+    upload = get_object_or_404(ResultUpload, id=upload_id)
+
+    try:
+        if request.method == 'PATCH':
+            if request.content_type.split(';')[0].strip() not in ('application/offset+octet-stream', 'application/octet-stream'):
+                return Response({"error": "Send the chunk as application/offset+octet-stream."}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+            try:
+                offset = int(request.headers['Upload-Offset'])
+                length = int(request.headers.get('Content-Length') or 0)
+            except (KeyError, ValueError):
+                return Response({"error": "Send the Upload-Offset and Content-Length headers."}, status=status.HTTP_400_BAD_REQUEST)
+            # request.stream, never request.data: the chunk is read block by block
+            uploads.append(upload, offset, request.stream, length)
+        elif request.method == 'DELETE':
+            uploads.abort(upload)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+    except uploads.UploadError as exc:
+        upload.refresh_from_db()
+        return Response({"error": str(exc), "received": upload.received}, status=exc.status,
+                        headers={'Upload-Offset': str(upload.received)})
+
+    return Response(ResultUploadSerializer(upload).data, status=status.HTTP_200_OK,
+                    headers={'Upload-Offset': str(upload.received)})
+
+
 ####################################################### APIS THE FOR DOCTOR FLOW IN FRONTEND ###################################################
 
 @api_view(['POST'])
@@ -653,21 +953,23 @@ def create_full_diagnosis(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['GET'])
-def get_full_diagnosis_details(request, diagnosis_id):
+# Read-only doctor/patient dashboard endpoints below are async views (see async_api.py),
+# so under ASGI one worker serves many dashboards concurrently.
+@async_api_view()
+async def get_full_diagnosis_details(request, diagnosis_id):
     """
     GET: Retrieve a diagnosis, its prescription (if any), prescription details (medicines), and tests prescribed
     """
     try:
-        diagnosis = Diagnosis.objects.get(id=diagnosis_id)
+        diagnosis = await Diagnosis.objects.aget(id=diagnosis_id)
     except Diagnosis.DoesNotExist:
         return Response({"error": "Diagnosis not found."}, status=status.HTTP_404_NOT_FOUND)
 
     # Diagnosis base data
     diagnosis_data = {
         "id": diagnosis.id,
-        "patient_id": diagnosis.patient_id.id,
-        "doctor_id": diagnosis.visiting_doctor_id.id,
+        "patient_id": diagnosis.patient_id_id,
+        "doctor_id": diagnosis.visiting_doctor_id_id,
         "diagnosis_date": diagnosis.diagnosis_date,
         "diagnosis_time": diagnosis.diagnosis_time,
         "blood_pressure": diagnosis.blood_pressure,
@@ -680,14 +982,14 @@ def get_full_diagnosis_details(request, diagnosis_id):
     }
 
     # Check if there's a prescription linked to this diagnosis
-    prescription = Prescription.objects.filter(diagnosis_id=diagnosis).first()
+    prescription = await Prescription.objects.filter(diagnosis_id=diagnosis).afirst()
     if prescription:
-        prescription_details = PrescriptionDetails.objects.filter(prescription_id=prescription)
-        tests_prescribed = TestPrescribed.objects.filter(prescription_id=prescription)
+        prescription_details = [detail async for detail in PrescriptionDetails.objects.filter(prescription_id=prescription)]
+        tests_prescribed = [test async for test in TestPrescribed.objects.filter(prescription_id=prescription)]
 
         diagnosis_data["prescription"] = {
             "id": prescription.id,
-            "prescribed_by": prescription.prescribed_by_doctor_id.id,
+            "prescribed_by": prescription.prescribed_by_doctor_id_id,
             "date": prescription.prescription_date,
             "notes": prescription.additional_notes,
             "status": prescription.status,
@@ -700,23 +1002,31 @@ def get_full_diagnosis_details(request, diagnosis_id):
     return Response(diagnosis_data, status=status.HTTP_200_OK)
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])   # All authenticated users can access this
-def get_diagnoses_for_patient(request, patient_id):
+@async_api_view([IsAuthenticated, IsStaffUser])   # Only staff can access this
+async def get_diagnoses(request):
+    """
+    GET: List all diagnoses
+         ?tests= filters on the ordered tests (see array_filters.py)
+    """
+    diagnosis = filter_arrays(request, Diagnosis.objects.all(), ['tests'])
+    return await apaginated_response(request, diagnosis, DiagnosisSerializer)
+
+
+@async_api_view([IsAuthenticated])   # All authenticated users can access this
+async def get_diagnoses_for_patient(request, patient_id):
     """
     GET: List all diagnosis for a patient
+         ?tests= filters on the ordered tests
     """
-    diagnosis = Diagnosis.objects.filter(patient_id=patient_id)
-    serializer = DiagnosisSerializer(diagnosis, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    diagnosis = filter_arrays(request, Diagnosis.objects.filter(patient_id=patient_id), ['tests'])
+    return await apaginated_response(request, diagnosis, DiagnosisSerializer)
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated, IsDoctorUser])   # Only Doctors can access this
-def get_diagnoses_for_doctor(request, doctor_id):
+@async_api_view([IsAuthenticated, IsDoctorUser])   # Only Doctors can access this
+async def get_diagnoses_for_doctor(request, doctor_id):
     """
     GET: List all diagnosis for a doctor
+         ?tests= filters on the ordered tests
     """
-    diagnosis = Diagnosis.objects.filter(visiting_doctor_id=doctor_id)
-    serializer = DiagnosisSerializer(diagnosis, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    diagnosis = filter_arrays(request, Diagnosis.objects.filter(visiting_doctor_id=doctor_id), ['tests'])
+    return await apaginated_response(request, diagnosis, DiagnosisSerializer)
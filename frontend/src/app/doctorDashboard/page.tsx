@@ -49,16 +49,18 @@ export default function DoctorDashboard() {
       setError(null) // Clear any previous errors
       const token = localStorage.getItem('token')
 
-      const response = await axios.get(
-        `http://localhost:8000/api/doctors/${doctorId}/diagnoses/`,
-        {
+      // The list is paginated: follow the `next` cursor until the last page
+      const diagnosesData = []
+      let url = `http://localhost:8000/api/doctors/${doctorId}/diagnoses/`
+      while (url) {
+        const response = await axios.get(url, {
           headers: {
             Authorization: `Bearer ${token}`
           }
-        }
-      )
-
-      const diagnosesData = response.data
+        })
+        diagnosesData.push(...response.data.results)
+        url = response.data.next
+      }
 
       // If diagnosesData is empty, set empty arrays but don't show an error
       if (!diagnosesData || diagnosesData.length === 0) {
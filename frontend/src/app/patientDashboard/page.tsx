@@ -50,16 +50,20 @@ export default function PatientDashboard() {
         // Get auth token from local storage or context
         const token = localStorage.getItem('token') // Adjust based on how you store tokens
 
-        const response = await axios.get(
-          `http://localhost:8000/api/patients/1/diagnoses/`,
-          {
+        // The list is paginated: follow the `next` cursor until the last page
+        const records = []
+        let url = `http://localhost:8000/api/patients/1/diagnoses/`
+        while (url) {
+          const response = await axios.get(url, {
             headers: {
               Authorization: `Bearer ${token}` // Adjust based on your auth method
             }
-          }
-        )
+          })
+          records.push(...response.data.results)
+          url = response.data.next
+        }
 
-        setDiagnosisRecords(response.data)
+        setDiagnosisRecords(records)
         setError(null)
       } catch (err) {
         console.error('Error fetching diagnosis data:', err)